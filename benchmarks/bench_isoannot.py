@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Scaling benchmark of the IsoAnnotLite readers of a tappAS GFF3.
+
+Usage:
+    python -m benchmarks.bench_isoannot --gff3 Homo_sapiens_GRCh38_Ensembl_86.gff3
+    python -m benchmarks.bench_isoannot --transcripts 20000 --features 10,100,1000
+
+With --gff3, the reference is read at increasing fractions of its transcripts
+(1/8, 1/4, 1/2, all) to show how the time grows with the genome size. Without
+it, synthetic tappAS GFF3 files with the same total number of features spread
+over fewer and fewer transcripts show how the time grows with the number of
+features of a transcript (the case of the few transcripts with thousands of
+features). Time per line should stay flat in both series when the readers are
+linear.
+
+Every point times readGFF, transformCDStoGenomic and
+transformTransFeaturesToGenomic.
+"""
+
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import click
+
+from sqanti3.utilities.IsoAnnotLite_SQ1 import (
+    readGFF,
+    transformCDStoGenomic,
+    transformTransFeaturesToGenomic,
+)
+from tests.tappas_gff3 import write_tappas_gff3
+
+BENCHMARK_VERSION = 1
+FRACTIONS = (0.125, 0.25, 0.5, 1.0)
+
+
+def head_transcripts(src: str, dst: str, fraction: float) -> int:
+    """
+    Copy the lines of the first `fraction` of the transcripts of src
+    :return: number of lines written
+    """
+    with open(src) as f:
+        transcripts = []
+        for line in f:
+            trans = line.split("\t", 1)[0]
+            if not transcripts or transcripts[-1] != trans:
+                transcripts.append(trans)
+    keep = set(transcripts[: max(1, int(len(transcripts) * fraction))])
+    n_lines = 0
+    with open(src) as f, open(dst, "w") as out:
+        for line in f:
+            if line.split("\t", 1)[0] in keep:
+                out.write(line)
+                n_lines += 1
+    return n_lines
+
+
+def time_readers(gff3: str) -> Dict:
+    t = time.perf_counter()
+    dc_GFF3, _, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand = readGFF(gff3)
+    read_s = time.perf_counter() - t
+    t = time.perf_counter()
+    dc_GFF3coding = transformCDStoGenomic(dc_GFF3coding, dc_GFF3transExons, dc_GFF3strand)
+    transformTransFeaturesToGenomic(dc_GFF3, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand)
+    return {"readGFF_s": read_s, "transform_s": time.perf_counter() - t}
+
+
+@click.command()
+@click.option(
+    "--gff3",
+    help    = "tappAS GFF3 to read at increasing fractions of its transcripts",
+    type    = str,
+    default = None,
+)
+@click.option(
+    "--transcripts",
+    help         = "Synthetic series: number of transcripts of the smallest point",
+    type         = int,
+    default      = 2000,
+    show_default = True,
+)
+@click.option(
+    "--features",
+    help         = "Synthetic series: comma-separated features per transcript, same total features at every point",
+    type         = str,
+    default      = "10,100,1000,10000",
+    show_default = True,
+)
+@click.option(
+    "-o",
+    "--output",
+    help         = "JSON result file",
+    type         = str,
+    default      = "isoannot_benchmark.json",
+    show_default = True,
+)
+def main(gff3: str, transcripts: int, features: str, output: str) -> None:
+    """Benchmark the scaling of the IsoAnnotLite tappAS GFF3 readers"""
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("sqanti3_benchmark")
+
+    work_dir = tempfile.mkdtemp(prefix="isoannot_bench.")
+    points: List[Dict] = []
+    try:
+        filename = os.path.join(work_dir, "reference.gff3")
+        if gff3:
+            for fraction in FRACTIONS:
+                n_lines = head_transcripts(gff3, filename, fraction)
+                points.append({"fraction": fraction, "lines": n_lines, **time_readers(filename)})
+        else:
+            per_transcript = [int(x) for x in features.split(",") if x]
+            total = transcripts * max(per_transcript)
+            for n in per_transcript:
+                n_lines = write_tappas_gff3(filename, total // n, n)
+                points.append(
+                    {"features_per_transcript": n, "lines": n_lines, **time_readers(filename)}
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for point in points:
+        point["us_per_line"] = 1e6 * (point["readGFF_s"] + point["transform_s"]) / point["lines"]
+        logger.info(
+            " ".join(f"{k} {v:.3f}" if isinstance(v, float) else f"{k} {v}" for k, v in point.items())
+        )
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "benchmark_version": BENCHMARK_VERSION,
+                "timestamp"        : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python"           : platform.python_version(),
+                "platform"         : platform.platform(),
+                "gff3"             : gff3,
+                "points"           : points,
+            },
+            f,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""
+Time and memory benchmark of the SQANTI3 classification pipeline on synthetic data.
+
+Usage:
+    python -m benchmarks.bench_sqanti3 --loci 500 --isoforms_per_gene 4 -o bench.json
+
+Each stage is run on the output of the previous ones and reports its wall time,
+CPU time, peak Python heap (tracemalloc, optional since it slows everything down)
+and the maximum resident set size of the process once it is done. A stage that
+cannot run (missing external program, failed earlier stage) is recorded as
+"skipped" or "error" and the benchmark carries on.
+"""
+
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+import click
+
+from benchmarks.synthetic import CATEGORIES, generate_dataset, parse_fractions
+from sqanti3.utilities.profiling import peak_rss_mb
+
+BENCHMARK_VERSION = 1
+STAGES = [
+    "genome_load",
+    "reference_parser",
+    "isoforms_parser",
+    "calc_indels_from_sam",
+    "isoformClassification",
+    "rts",
+    "sqanti_filter_lite",
+    "IsoAnnotLite",
+]
+POLYA_MOTIFS = ["AATAAA", "ATTAAA", "AGTAAA", "TATAAA"]
+SPLICE_SITES = "ATAC,GCAG,GTAG"
+OUTPUT_PREFIX = "bench"
+
+
+class StageSkipped(Exception):
+    pass
+
+
+@contextmanager
+def measure(name: str, records: List[Dict], trace_memory: bool):
+    """
+    Time the enclosed block and append its record to records
+    Exceptions are logged and recorded, so later independent stages still run;
+    a sys.exit of the code under test ends the benchmark.
+    """
+    record = {"stage": name, "status": "ok"}
+    if trace_memory:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    except StageSkipped as e:
+        record["status"] = "skipped"
+        record["reason"] = str(e)
+    except Exception as e:
+        logging.getLogger("sqanti3_benchmark").warning(f"Stage {name} failed", exc_info=True)
+        record["status"] = "error"
+        record["reason"] = f"{type(e).__name__}: {e}"
+    finally:
+        record["wall_s"] = round(time.perf_counter() - wall, 6)
+        record["cpu_s"] = round(time.process_time() - cpu, 6)
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            record["peak_traced_mb"] = round(peak / 2 ** 20, 3)
+            tracemalloc.stop()
+        record["max_rss_mb"] = round(peak_rss_mb(), 3)
+        records.append(record)
+
+
+def run_pipeline(
+    dataset: Dict, work_dir: str, stages: List[str], trace_memory: bool
+) -> List[Dict]:
+    """
+    Run the selected stages once on a synthetic dataset
+    :return: list of stage records
+    """
+    from Bio import SeqIO
+    from sqanti3 import sqanti3_qc
+    from sqanti3.sqanti3_RulesFilter import sqanti_filter_lite
+    from sqanti3.utilities import IsoAnnotLite_SQ1
+    from sqanti3.utilities.indels_annot import calc_indels_from_sam
+    from sqanti3.utilities.rt_switching import rts
+
+    files = dataset["files"]
+    records, state = [], {}
+    outputClassPath, outputJuncPath = sqanti3_qc.get_class_junc_filenames(
+        OUTPUT_PREFIX, work_dir
+    )
+    corrGTF, corrSAM, _, _ = sqanti3_qc.get_corr_filenames(OUTPUT_PREFIX, work_dir)
+    shutil.copy(files["isoforms_gtf"], corrGTF)
+    shutil.copy(files["sam"], corrSAM)
+    # reference_parser reuses an existing genePred instead of calling gtfToGenePred
+    shutil.copy(
+        files["reference_genePred"],
+        os.path.join(work_dir, f"refAnnotation_{OUTPUT_PREFIX}.genePred"),
+    )
+    polyA_motif_list = os.path.join(work_dir, "polyA.list")
+    with open(polyA_motif_list, "w") as f:
+        f.write("\n".join(POLYA_MOTIFS) + "\n")
+
+    def requires(*keys):
+        missing = [k for k in keys if k not in state]
+        if missing:
+            raise StageSkipped(f"requires the output of {', '.join(missing)}")
+
+    with measure("genome_load", records, trace_memory) as record:
+        state["genome_dict"] = {
+            r.name: r for r in SeqIO.parse(open(files["genome"]), "fasta")
+        }
+        record["records"] = len(state["genome_dict"])
+
+    if "reference_parser" in stages:
+        with measure("reference_parser", records, trace_memory) as record:
+            requires("genome_dict")
+            state["reference"] = sqanti3_qc.reference_parser(
+                directory     = work_dir,
+                output        = OUTPUT_PREFIX,
+                genename      = False,
+                annotation    = files["reference_gtf"],
+                min_ref_len   = 0,
+                genome_chroms = list(state["genome_dict"].keys()),
+            )
+            record["records"] = dataset["references"]
+
+    if "isoforms_parser" in stages:
+        with measure("isoforms_parser", records, trace_memory) as record:
+            if sqanti3_qc.GTF2GENEPRED_PROG is None:
+                raise StageSkipped("gtfToGenePred not found")
+            state["isoforms_by_chr"], _ = sqanti3_qc.isoforms_parser(corrGTF)
+            record["records"] = sum(len(v) for v in state["isoforms_by_chr"].values())
+    if "isoforms_by_chr" not in state:
+        # later stages only need the parsed isoforms, use the genePred of the dataset
+        isoforms_by_chr = {}
+        for r in sqanti3_qc.genePredReader(files["isoforms_genePred"]):
+            isoforms_by_chr.setdefault(r.chrom, []).append(r)
+        state["isoforms_by_chr"] = isoforms_by_chr
+
+    if "calc_indels_from_sam" in stages:
+        with measure("calc_indels_from_sam", records, trace_memory) as record:
+            state["indelsJunc"], indelsTotal = calc_indels_from_sam(corrSAM)
+            record["records"] = sum(indelsTotal.values())
+
+    if "isoformClassification" in stages:
+        with measure("isoformClassification", records, trace_memory) as record:
+            requires("genome_dict", "reference")
+            (
+                refs_1exon_by_chr,
+                refs_exons_by_chr,
+                junctions_by_chr,
+                junctions_by_gene,
+                start_ends_by_gene,
+            ) = state["reference"]
+            state["isoforms_info"] = sqanti3_qc.isoformClassification(
+                None,
+                None,
+                None,
+                polyA_motif_list,
+                None,
+                SPLICE_SITES,
+                20,
+                state["isoforms_by_chr"],
+                refs_1exon_by_chr,
+                refs_exons_by_chr,
+                junctions_by_chr,
+                junctions_by_gene,
+                start_ends_by_gene,
+                state["genome_dict"],
+                state.get("indelsJunc"),
+                {},
+                outputClassPath,
+                outputJuncPath,
+            )
+            record["records"] = len(state["isoforms_info"])
+            record["categories"] = dict(
+                Counter(h.str_class for h in state["isoforms_info"].values())
+            )
+
+    if "rts" in stages:
+        with measure("rts", records, trace_memory) as record:
+            requires("genome_dict", "isoforms_info")
+            RTS_info = rts(
+                [f"{outputJuncPath}_tmp", files["genome"], "-a"], state["genome_dict"]
+            )
+            record["records"] = sum(len(v) > 0 for v in RTS_info.values())
+
+    if "sqanti_filter_lite" in stages:
+        with measure("sqanti_filter_lite", records, trace_memory) as record:
+            requires("isoforms_info")
+            sqanti_filter_lite(
+                sqanti_class          = f"{outputClassPath}_tmp",
+                isoforms              = files["isoforms_fasta"],
+                annotation            = corrGTF,
+                junctions             = f"{outputJuncPath}_tmp",
+                sam                   = None,
+                faa                   = None,
+                intrapriming          = 0.6,
+                runAlength            = 6,
+                max_dist_to_known_end = 50,
+                min_cov               = 3,
+                filter_mono_exonic    = False,
+                skipGTF               = False,
+                skipFaFq              = False,
+                skipJunction          = False,
+                skip_report           = True,
+            )
+            record["records"] = dataset["isoforms"]
+
+    if "IsoAnnotLite" in stages:
+        with measure("IsoAnnotLite", records, trace_memory) as record:
+            requires("isoforms_info")
+            cwd = os.getcwd()
+            # IsoAnnotLite writes its GFF3 to the working directory
+            os.chdir(work_dir)
+            try:
+                IsoAnnotLite_SQ1.isoannot(
+                    gtf            = corrGTF,
+                    classification = f"{outputClassPath}_tmp",
+                    junctions      = f"{outputJuncPath}_tmp",
+                    output         = OUTPUT_PREFIX,
+                )
+            finally:
+                os.chdir(cwd)
+            record["records"] = dataset["isoforms"]
+
+    return records
+
+
+@click.command()
+@click.option(
+    "--chroms",
+    help         = "Number of chromosomes",
+    type         = int,
+    default      = 2,
+    show_default = True,
+)
+@click.option(
+    "--loci",
+    help         = "Number of gene loci per chromosome",
+    type         = int,
+    default      = 100,
+    show_default = True,
+)
+@click.option(
+    "--ref_isoforms",
+    help         = "Reference transcripts per gene",
+    type         = int,
+    default      = 3,
+    show_default = True,
+)
+@click.option(
+    "--isoforms_per_gene",
+    help         = "Query isoforms per gene",
+    type         = int,
+    default      = 4,
+    show_default = True,
+)
+@click.option(
+    "--min_exons",
+    help         = "Minimum number of exons of a gene model",
+    type         = int,
+    default      = 2,
+    show_default = True,
+)
+@click.option(
+    "--max_exons",
+    help         = "Maximum number of exons of a gene model",
+    type         = int,
+    default      = 12,
+    show_default = True,
+)
+@click.option(
+    "--fractions",
+    help         = f"Fraction of query isoforms in each category ({','.join(CATEGORIES)})",
+    type         = str,
+    default      = "FSM=0.4,ISM=0.2,NIC=0.15,NNC=0.15,fusion=0.1",
+    show_default = True,
+)
+@click.option(
+    "--indel_rate",
+    help         = "Fraction of the alignments with an indel",
+    type         = float,
+    default      = 0.1,
+    show_default = True,
+)
+@click.option(
+    "--seed",
+    help         = "Random seed of the generator",
+    type         = int,
+    default      = 0,
+    show_default = True,
+)
+@click.option(
+    "--repeat",
+    help         = "Number of runs of the pipeline",
+    type         = int,
+    default      = 1,
+    show_default = True,
+)
+@click.option(
+    "--stages",
+    help         = "Comma-separated stages to run (the genome is always loaded)",
+    type         = str,
+    default      = ",".join(STAGES[1:]),
+    show_default = True,
+)
+@click.option(
+    "--trace_memory/--no_trace_memory",
+    help         = "Record the peak Python heap of each stage with tracemalloc (slower)",
+    default      = False,
+    show_default = True,
+)
+@click.option(
+    "-d",
+    "--dir",
+    "work_dir",
+    help    = "Directory for the dataset and outputs (default: temporary, removed afterwards)",
+    type    = str,
+    default = None,
+)
+@click.option(
+    "-o",
+    "--output",
+    help         = "JSON result file",
+    type         = str,
+    default      = "sqanti3_benchmark.json",
+    show_default = True,
+)
+def main(
+    chroms: int,
+    loci: int,
+    ref_isoforms: int,
+    isoforms_per_gene: int,
+    min_exons: int,
+    max_exons: int,
+    fractions: str,
+    indel_rate: float,
+    seed: int,
+    repeat: int,
+    stages: str,
+    trace_memory: bool,
+    work_dir: str,
+    output: str,
+) -> None:
+    """Benchmark the SQANTI3 classification stages on a synthetic dataset"""
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("sqanti3_benchmark")
+
+    selected = [s for s in stages.split(",") if s]
+    unknown = set(selected).difference(STAGES)
+    if unknown:
+        raise click.BadParameter(
+            f"unknown stages {','.join(sorted(unknown))}", param_hint="--stages"
+        )
+
+    keep = work_dir is not None
+    if keep:
+        work_dir = os.path.abspath(work_dir)
+    else:
+        work_dir = tempfile.mkdtemp(prefix="sqanti3_bench.")
+    try:
+        t = time.perf_counter()
+        dataset = generate_dataset(
+            os.path.join(work_dir, "data"),
+            n_chroms              = chroms,
+            loci_per_chrom        = loci,
+            ref_isoforms_per_gene = ref_isoforms,
+            isoforms_per_gene     = isoforms_per_gene,
+            exon_range            = (min_exons, max_exons),
+            fractions             = parse_fractions(fractions),
+            indel_rate            = indel_rate,
+            seed                  = seed,
+        )
+        logger.info(
+            f"Generated {dataset['isoforms']} isoforms on {dataset['loci']} loci "
+            f"in {time.perf_counter() - t:.1f} sec."
+        )
+
+        runs = []
+        for i in range(repeat):
+            run_dir = os.path.join(work_dir, f"run{i + 1}")
+            os.makedirs(run_dir, exist_ok=True)
+            records = run_pipeline(dataset, run_dir, selected, trace_memory)
+            for record in records:
+                logger.info(
+                    f"run {i + 1} {record['stage']:<22} {record['status']:<8} "
+                    f"wall {record['wall_s']:>9.3f} s  cpu {record['cpu_s']:>9.3f} s  "
+                    f"rss {record['max_rss_mb']:>9.1f} MB"
+                )
+            runs.append(records)
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    dataset = {k: v for k, v in dataset.items() if k != "files"}
+    dataset.update(
+        seed                  = seed,
+        ref_isoforms_per_gene = ref_isoforms,
+        isoforms_per_gene     = isoforms_per_gene,
+        exon_range            = [min_exons, max_exons],
+        fractions             = parse_fractions(fractions),
+        indel_rate            = indel_rate,
+    )
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "benchmark_version": BENCHMARK_VERSION,
+                "timestamp"        : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python"           : platform.python_version(),
+                "platform"         : platform.platform(),
+                "trace_memory"     : trace_memory,
+                "dataset"          : dataset,
+                "runs"             : runs,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+"""
+Synthetic genome, reference annotation and isoform sets for benchmarking SQANTI3.
+
+Every locus is a gene model of random exon/intron lengths with canonical GT-AG
+splice sites written into a random genome. Reference transcripts are the full
+model plus exon-skipping variants; query isoforms are derived from them so that
+they fall in a chosen structural category:
+
+    FSM     a reference intron chain, TSS/TTS moved by a few bp
+    ISM     a reference with exons dropped from one end
+    NIC     a new combination of the known splice sites (exon skipping)
+    NNC     a reference with one donor moved to a novel site
+    fusion  two neighbouring genes on the same strand joined together
+
+Files written to the output directory:
+    genome.fasta, reference.gtf, reference.genePred, isoforms.fasta, isoforms.gtf,
+    isoforms.genePred, isoforms.sam, truth.tsv (isoform --> intended category)
+"""
+
+import os
+import random
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+CATEGORIES = ("FSM", "ISM", "NIC", "NNC", "fusion")
+DEFAULT_FRACTIONS = {"FSM": 0.4, "ISM": 0.2, "NIC": 0.15, "NNC": 0.15, "fusion": 0.1}
+
+EXON_LEN = (60, 400)
+INTRON_LEN = (150, 3000)
+INTERGENIC_LEN = (2000, 10000)
+CHROM_FLANK = 1000
+# the TSS/TTS of FSM isoforms are moved by up to this many bp
+END_JITTER = 20
+# novel donors of NNC isoforms are moved by this many bp
+NOVEL_SITE_SHIFT = (5, 15)
+
+Locus = namedtuple("Locus", ["gene", "chrom", "strand", "exons", "refs"])
+Transcript = namedtuple(
+    "Transcript", ["id", "gene", "chrom", "strand", "exons", "category"]
+)
+
+
+def parse_fractions(text: str) -> Dict[str, float]:
+    """
+    :param text: comma-separated category=fraction, ex: "FSM=0.5,ISM=0.2,NIC=0.3"
+    :return: dict of category --> fraction, normalised to sum to 1
+    """
+    fractions = {}
+    for item in text.split(","):
+        category, value = item.split("=")
+        category = category.strip()
+        if category not in CATEGORIES:
+            raise ValueError(
+                f"Unknown category {category}, must be one of {','.join(CATEGORIES)}"
+            )
+        fractions[category] = float(value)
+    total = sum(fractions.values())
+    if total <= 0:
+        raise ValueError(f"Category fractions must add up to more than 0: {text}")
+    return {k: v / total for k, v in fractions.items()}
+
+
+def make_loci(
+    rng: random.Random,
+    n_chroms: int,
+    loci_per_chrom: int,
+    ref_isoforms_per_gene: int,
+    exon_range: Tuple[int, int],
+) -> Tuple[Dict[str, int], List[Locus]]:
+    """
+    :return: (dict of chrom --> length, list of loci in genome order)
+    """
+    chrom_sizes, loci = {}, []
+    for c in range(n_chroms):
+        chrom = f"chr{c + 1}"
+        pos = CHROM_FLANK
+        for _ in range(loci_per_chrom):
+            gene = f"G{len(loci) + 1}"
+            strand = rng.choice("+-")
+            exons = []
+            for _ in range(rng.randint(*exon_range)):
+                start = pos
+                pos += rng.randint(*EXON_LEN)
+                exons.append((start, pos))
+                pos += rng.randint(*INTRON_LEN)
+            pos = exons[-1][1] + rng.randint(*INTERGENIC_LEN)
+
+            # the full model plus exon skipping variants with distinct intron chains
+            chains = [tuple(range(len(exons)))]
+            internal = list(range(1, len(exons) - 1))
+            for _ in range(4 * ref_isoforms_per_gene):
+                if len(chains) >= ref_isoforms_per_gene or not internal:
+                    break
+                skipped = set(rng.sample(internal, rng.randint(1, len(internal))))
+                chain = tuple(i for i in range(len(exons)) if i not in skipped)
+                if chain not in chains:
+                    chains.append(chain)
+            refs = [[exons[i] for i in chain] for chain in chains]
+            loci.append(Locus(gene, chrom, strand, exons, refs))
+        chrom_sizes[chrom] = pos + CHROM_FLANK
+    return chrom_sizes, loci
+
+
+def make_genome(
+    rng: random.Random, chrom_sizes: Dict[str, int], loci: List[Locus]
+) -> Dict[str, str]:
+    """
+    Random sequence with canonical splice sites at every intron of the gene models
+    """
+    genome = {
+        chrom: bytearray(rng.choices(b"ACGT", k=size))
+        for chrom, size in chrom_sizes.items()
+    }
+    for locus in loci:
+        seq = genome[locus.chrom]
+        donor, acceptor = (b"GT", b"AG") if locus.strand == "+" else (b"CT", b"AC")
+        for (_, d), (a, _) in zip(locus.exons[:-1], locus.exons[1:]):
+            seq[d : d + 2] = donor
+            seq[a - 2 : a] = acceptor
+    return {chrom: seq.decode("ascii") for chrom, seq in genome.items()}
+
+
+def _jitter_ends(rng: random.Random, exons: List[Tuple[int, int]]):
+    exons = list(exons)
+    s, e = exons[0]
+    exons[0] = (min(e - 30, s + rng.randint(-END_JITTER, END_JITTER)), e)
+    s, e = exons[-1]
+    exons[-1] = (s, max(s + 30, e + rng.randint(-END_JITTER, END_JITTER)))
+    return exons
+
+
+def make_isoform(
+    rng: random.Random, category: str, loci: List[Locus], i: int
+) -> Optional[Tuple[str, List[Tuple[int, int]], List[str]]]:
+    """
+    Derive one isoform of the given category from locus i
+    :return: (category, exons, genes), or None if the locus cannot give this category
+    """
+    locus = loci[i]
+    ref = rng.choice(locus.refs)
+    if category == "FSM":
+        return category, _jitter_ends(rng, ref), [locus.gene]
+    if category == "ISM":
+        if len(ref) < 3:
+            return None
+        n = rng.randint(1, len(ref) - 2)
+        exons = ref[n:] if rng.random() < 0.5 else ref[:-n]
+        return category, exons, [locus.gene]
+    if category == "NIC":
+        known = {tuple(r) for r in locus.refs}
+        internal = list(range(1, len(locus.exons) - 1))
+        for _ in range(10):
+            if not internal:
+                break
+            skipped = set(rng.sample(internal, rng.randint(1, len(internal))))
+            exons = tuple(e for k, e in enumerate(locus.exons) if k not in skipped)
+            if exons not in known:
+                return category, list(exons), [locus.gene]
+        return None
+    if category == "NNC":
+        if len(ref) < 2:
+            return None
+        exons = list(ref)
+        k = rng.randrange(len(exons) - 1)
+        s, e = exons[k]
+        shift = rng.randint(*NOVEL_SITE_SHIFT) * rng.choice((-1, 1))
+        # keep at least 30 bp in the exon and in the following intron
+        shift = min(max(shift, 30 - (e - s)), exons[k + 1][0] - 30 - 1 - e)
+        if shift == 0:
+            return None
+        exons[k] = (s, e + shift)
+        return category, exons, [locus.gene]
+    if category == "fusion":
+        for other in loci[i + 1 :]:
+            if other.chrom != locus.chrom:
+                break
+            if other.strand == locus.strand:
+                exons = ref + rng.choice(other.refs)
+                return category, exons, [locus.gene, other.gene]
+        return None
+    raise ValueError(f"Unknown category {category}")
+
+
+def make_isoforms(
+    rng: random.Random,
+    loci: List[Locus],
+    isoforms_per_gene: int,
+    fractions: Dict[str, float],
+) -> List[Transcript]:
+    categories, weights = zip(*sorted(fractions.items()))
+    isoforms = []
+    for i, locus in enumerate(loci):
+        for k in range(isoforms_per_gene):
+            category = rng.choices(categories, weights)[0]
+            # loci that cannot give the category (ex: nothing to skip) give a FSM
+            made = make_isoform(rng, category, loci, i) or make_isoform(
+                rng, "FSM", loci, i
+            )
+            category, exons, genes = made
+            isoforms.append(
+                Transcript(
+                    id       = f"PB.{i + 1}.{k + 1}",
+                    gene     = "_".join(genes),
+                    chrom    = locus.chrom,
+                    strand   = locus.strand,
+                    exons    = exons,
+                    category = category,
+                )
+            )
+    isoforms.sort(key=lambda t: (t.chrom, t.exons[0][0]))
+    return isoforms
+
+
+def write_fasta(genome: Dict[str, str], filename: str, width: int = 60) -> None:
+    with open(filename, "w") as f:
+        for chrom, seq in genome.items():
+            f.write(f">{chrom}\n")
+            for i in range(0, len(seq), width):
+                f.write(f"{seq[i : i + width]}\n")
+
+
+def write_transcript_fasta(
+    genome: Dict[str, str], transcripts: List[Transcript], filename: str
+) -> None:
+    complement = str.maketrans("ACGT", "TGCA")
+    with open(filename, "w") as f:
+        for t in transcripts:
+            seq = "".join(genome[t.chrom][s:e] for s, e in t.exons)
+            if t.strand == "-":
+                seq = seq.translate(complement)[::-1]
+            f.write(f">{t.id}\n{seq}\n")
+
+
+def write_gtf(transcripts: List[Transcript], filename: str, source: str) -> None:
+    with open(filename, "w") as f:
+        for t in transcripts:
+            attributes = f'gene_id "{t.gene}"; transcript_id "{t.id}";'
+            f.write(
+                f"{t.chrom}\t{source}\ttranscript\t{t.exons[0][0] + 1}\t"
+                f"{t.exons[-1][1]}\t.\t{t.strand}\t.\t{attributes}\n"
+            )
+            for s, e in t.exons:
+                f.write(
+                    f"{t.chrom}\t{source}\texon\t{s + 1}\t{e}\t.\t{t.strand}\t.\t"
+                    f"{attributes}\n"
+                )
+
+
+def write_genePred(transcripts: List[Transcript], filename: str) -> None:
+    """
+    Same layout as gtfToGenePred -genePredExt for non-coding transcripts
+    """
+    with open(filename, "w") as f:
+        for t in transcripts:
+            tx_start, tx_end = t.exons[0][0], t.exons[-1][1]
+            starts = "".join(f"{s}," for s, _ in t.exons)
+            ends = "".join(f"{e}," for _, e in t.exons)
+            frames = "-1," * len(t.exons)
+            f.write(
+                f"{t.id}\t{t.chrom}\t{t.strand}\t{tx_start}\t{tx_end}\t{tx_end}\t"
+                f"{tx_end}\t{len(t.exons)}\t{starts}\t{ends}\t0\t{t.gene}\t"
+                f"none\tnone\t{frames}\n"
+            )
+
+
+def write_sam(
+    rng: random.Random,
+    transcripts: List[Transcript],
+    chrom_sizes: Dict[str, int],
+    filename: str,
+    indel_rate: float,
+) -> None:
+    """
+    One spliced alignment per isoform, a fraction of them with a small indel
+    """
+    with open(filename, "w") as f:
+        f.write("@HD\tVN:1.6\tSO:coordinate\n")
+        for chrom, size in chrom_sizes.items():
+            f.write(f"@SQ\tSN:{chrom}\tLN:{size}\n")
+        for t in transcripts:
+            cigar = []
+            indel_exon = (
+                rng.randrange(len(t.exons)) if rng.random() < indel_rate else None
+            )
+            for k, (s, e) in enumerate(t.exons):
+                if k > 0:
+                    cigar.append(f"{s - t.exons[k - 1][1]}N")
+                if k == indel_exon and e - s > 20:
+                    cut = rng.randint(10, e - s - 10)
+                    if rng.random() < 0.5:
+                        cigar.append(f"{cut}M2I{e - s - cut}M")
+                    else:
+                        cigar.append(f"{cut}M1D{e - s - cut - 1}M")
+                else:
+                    cigar.append(f"{e - s}M")
+            flag = 0 if t.strand == "+" else 16
+            f.write(
+                f"{t.id}\t{flag}\t{t.chrom}\t{t.exons[0][0] + 1}\t60\t"
+                f"{''.join(cigar)}\t*\t0\t0\t*\t*\n"
+            )
+
+
+def generate_dataset(
+    out_dir: str,
+    n_chroms: int = 2,
+    loci_per_chrom: int = 100,
+    ref_isoforms_per_gene: int = 3,
+    isoforms_per_gene: int = 4,
+    exon_range: Tuple[int, int] = (2, 12),
+    fractions: Optional[Dict[str, float]] = None,
+    indel_rate: float = 0.1,
+    seed: int = 0,
+) -> Dict:
+    """
+    Write a synthetic dataset to out_dir
+    :param exon_range: (min, max) number of exons of the gene models
+    :param fractions: dict of category --> fraction of the isoforms, see CATEGORIES
+    :param indel_rate: fraction of the alignments with an indel
+    :return: dict with the path of every file and the size of the dataset
+    """
+    rng = random.Random(seed)
+    fractions = fractions or DEFAULT_FRACTIONS
+    os.makedirs(out_dir, exist_ok=True)
+
+    chrom_sizes, loci = make_loci(
+        rng, n_chroms, loci_per_chrom, ref_isoforms_per_gene, exon_range
+    )
+    genome = make_genome(rng, chrom_sizes, loci)
+    refs = [
+        Transcript(
+            f"{locus.gene}.{k + 1}", locus.gene, locus.chrom, locus.strand, exons, "ref"
+        )
+        for locus in loci
+        for k, exons in enumerate(locus.refs)
+    ]
+    isoforms = make_isoforms(rng, loci, isoforms_per_gene, fractions)
+
+    files = {
+        "genome"           : os.path.join(out_dir, "genome.fasta"),
+        "reference_gtf"    : os.path.join(out_dir, "reference.gtf"),
+        "reference_genePred": os.path.join(out_dir, "reference.genePred"),
+        "isoforms_fasta"   : os.path.join(out_dir, "isoforms.fasta"),
+        "isoforms_gtf"     : os.path.join(out_dir, "isoforms.gtf"),
+        "isoforms_genePred": os.path.join(out_dir, "isoforms.genePred"),
+        "sam"              : os.path.join(out_dir, "isoforms.sam"),
+        "truth"            : os.path.join(out_dir, "truth.tsv"),
+    }
+    write_fasta(genome, files["genome"])
+    write_gtf(refs, files["reference_gtf"], "synthetic")
+    write_genePred(refs, files["reference_genePred"])
+    write_transcript_fasta(genome, isoforms, files["isoforms_fasta"])
+    write_gtf(isoforms, files["isoforms_gtf"], "PacBio")
+    write_genePred(isoforms, files["isoforms_genePred"])
+    write_sam(rng, isoforms, chrom_sizes, files["sam"], indel_rate)
+    with open(files["truth"], "w") as f:
+        f.write("isoform\tcategory\tgenes\n")
+        for t in isoforms:
+            f.write(f"{t.id}\t{t.category}\t{t.gene}\n")
+
+    counts = {c: 0 for c in CATEGORIES}
+    for t in isoforms:
+        counts[t.category] += 1
+    return {
+        "files"     : files,
+        "genome_bp" : sum(chrom_sizes.values()),
+        "chroms"    : n_chroms,
+        "loci"      : len(loci),
+        "references": len(refs),
+        "isoforms"  : len(isoforms),
+        "categories": counts,
+    }
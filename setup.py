@@ -30,7 +30,7 @@
         line.strip()
         for line in Path("requirements.txt").read_text("utf-8").splitlines()
     ],
-    extra_requires={"parallel": ["swifter~=0.3"]},
+    extras_require={"parallel": ["swifter~=0.3"], "bigwig": ["pyBigWig"], "yaml": ["PyYAML"]},
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Environment :: Console",
@@ -48,6 +48,7 @@
         "console_scripts": [
             "sqanti3_qc = sqanti3.sqanti3_qc:main",
             "sqanti3_RulesFilter = sqanti3.sqanti3_RulesFilter:main",
+            "sqanti3_daemon = sqanti3.sqanti3_daemon:main",
             "IsoAnnotLite = sqanti3.utilities.IsoAnnotLite_SQ1:main",
         ]
     },
@@ -1,2 +1,11 @@
-from . import sqanti3_qc, sqanti3_RulesFilter
-from . import utilities
+import importlib
+
+# submodules are imported on first access, so that importing one of them
+# (ex: sqanti3.sqanti3_RulesFilter) does not load the others
+__all__ = ["sqanti3_qc", "sqanti3_RulesFilter", "utilities"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,22 +3,30 @@
 
 # import argparse
 import click
-import distutils.spawn
 import os
 import subprocess
 import sys
+import itertools
 from argparse import Namespace
-from csv import DictReader, DictWriter
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from Bio import SeqIO
-from cupcake.sequence.BioReaders import GMAPSAMReader
-from cupcake.sequence.GFF import collapseGFFReader, write_collapseGFF_format
-
-from typing import Optional
+from typing import Dict, List, Optional, Sequence, Set
 import logging
 
+import numpy as np
+
 from sqanti3.__about__ import __version__
 from sqanti3 import __path__ as sqpath
+from sqanti3.utilities.fasta_index import copy_records
+from sqanti3.utilities.filter_rules import (
+    DEFAULT_RULES,
+    ClassificationTable,
+    CompiledRules,
+    load_rules,
+)
+from sqanti3.utilities.programs import find_program
 
 """
 Lightweight filtering of SQANTI by using .classification.txt output
@@ -31,11 +39,26 @@
 
 
 UTILITIESPATH = f"{sqpath[0]}{os.sep}utilities"
-RSCRIPTPATH = distutils.spawn.find_executable("Rscript")
+RSCRIPT = "Rscript"
 RSCRIPT_REPORT = "SQANTI3_report.R"
 
 # necessary for use in f-strings since \n and \t do not work
 
+# types of the rule parameters set by the command-line options, for --sweep values
+PARAM_TYPES = {
+    "intrapriming"         : float,
+    "runAlength"           : int,
+    "max_dist_to_known_end": int,
+    "min_cov"              : int,
+    "filter_mono_exonic"   : bool,
+}
+
+# (min, max) allowed values of the parameters, for the command-line options and --sweep values
+PARAM_RANGES = {
+    "intrapriming": (0.25, 1.0),
+    "runAlength"  : (4, 20),
+}
+
 CATEGORY_DICT = {
     "full-splice_match"      : "FSM",
     "incomplete-splice_match": "ISM",
@@ -46,9 +69,139 @@
     "genic_intron"           : "intron",
     "genic"                  : "genic",
     "fusion"                 : "fusion",
+    "moreJunctions"          : "moreJunctions",
 }
 
 
+def fasta_id(header: str) -> str:
+    """
+    :return: record ID of a FASTA/FASTQ header line, the first word after ">" or "@"
+    """
+    return header[1:].split(None, 1)[0] if len(header) > 1 else ""
+
+
+def gtf_transcript_id(line: str) -> Optional[str]:
+    """
+    :return: transcript_id attribute of a GTF line, None if it has none
+    """
+    i = line.find('transcript_id "')
+    if i < 0:
+        return None
+    i += len('transcript_id "')
+    return line[i : line.index('"', i)]
+
+
+def filter_fasta(src: str, dst: str, seqids_to_keep: Set[str]) -> str:
+    """
+    Copy the FASTA records of src whose ID is in seqids_to_keep, line by line
+    """
+    keep = False
+    with open(src) as f, open(dst, "w") as out:
+        for line in f:
+            if line.startswith(">"):
+                keep = fasta_id(line) in seqids_to_keep
+            if keep:
+                out.write(line)
+    return dst
+
+
+def filter_fastq(src: str, dst: str, seqids_to_keep: Set[str]) -> str:
+    """
+    Copy the (4-line) FASTQ records of src whose ID is in seqids_to_keep
+    """
+    with open(src) as f, open(dst, "w") as out:
+        while True:
+            record = [f.readline() for _ in range(4)]
+            if not record[0]:
+                break
+            if fasta_id(record[0]) in seqids_to_keep:
+                out.writelines(record)
+    return dst
+
+
+def filter_indexed(src: str, dst: str, seqids_to_keep: Set[str], fastq: bool = False) -> str:
+    """
+    Copy the FASTA/FASTQ records of src whose ID is in seqids_to_keep by byte range,
+    using (and building if needed) the src.fai index. Falls back to a line by line
+    copy for files that cannot be indexed.
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        return copy_records(src, dst, seqids_to_keep, fastq, logger)
+    except ValueError as e:
+        logger.warning(f"{e} Filtering {src} line by line.")
+        return (filter_fastq if fastq else filter_fasta)(src, dst, seqids_to_keep)
+
+
+def filter_table(src: str, dst: str, seqids_to_keep: Set[str]) -> str:
+    """
+    Copy the header and the rows of a tab-separated file (ex: junctions) whose "isoform" is in seqids_to_keep
+    """
+    with open(src) as f, open(dst, "w") as out:
+        header = f.readline()
+        out.write(header)
+        column = header.rstrip("\n").split("\t").index("isoform")
+        for line in f:
+            if line.split("\t", column + 1)[column] in seqids_to_keep:
+                out.write(line)
+    return dst
+
+
+def filter_gtf(src: str, dst: str, seqids_to_keep: Set[str]) -> str:
+    """
+    Copy the GTF lines of src whose transcript_id is in seqids_to_keep
+    """
+    with open(src) as f, open(dst, "w") as out:
+        for line in f:
+            if gtf_transcript_id(line) in seqids_to_keep:
+                out.write(line)
+    return dst
+
+
+def filter_sam(src: str, dst: str, seqids_to_keep: Set[str]) -> str:
+    """
+    Copy the header and the alignments of src whose query name is in seqids_to_keep,
+    comparing the raw QNAME bytes without decoding or parsing the alignment
+    """
+    qnames = {seqid.encode() for seqid in seqids_to_keep}
+    with open(src, "rb") as f, open(dst, "wb") as out:
+        for line in f:
+            if line.startswith(b"@") or line[: line.find(b"\t")] in qnames:
+                out.write(line)
+    return dst
+
+
+def filter_bam(src: str, dst: str, seqids_to_keep: Set[str], threads: int = 1) -> str:
+    """
+    Copy the alignments of a BAM file whose query name is in seqids_to_keep, with
+    htslib threads decompressing src and compressing dst. dst is indexed when src
+    is sorted by coordinate.
+    :param threads: number of htslib threads of each file
+    """
+    import pysam
+
+    with pysam.AlignmentFile(src, "rb", threads=threads) as bam, pysam.AlignmentFile(
+        dst, "wb", template=bam, threads=threads
+    ) as out:
+        for read in bam.fetch(until_eof=True):
+            if read.query_name in seqids_to_keep:
+                out.write(read)
+        sort_order = bam.header.to_dict().get("HD", {}).get("SO")
+    if sort_order == "coordinate":
+        pysam.index(dst)
+    return dst
+
+
+def bam_threads(cpus: int, n_jobs: int) -> int:
+    """
+    :param n_jobs: number of output filtering jobs, including the BAM one
+    :return: htslib threads of the BAM job, the CPUs not used by the other jobs running alongside it
+    """
+    if cpus > 1 and n_jobs > 1:
+        return max(1, cpus - (n_jobs - 1))
+    return cpus
+
+
 def sqanti_filter_lite(
     sqanti_class         : str,
     isoforms             : str,
@@ -64,8 +217,22 @@ def sqanti_filter_lite(
     skipGTF              : bool,
     skipFaFq             : bool,
     skipJunction         : bool,
+    skip_report          : bool           = False,
+    cpus                 : int            = 1,
+    rules                : Optional[Dict] = None,
+    prefix               : Optional[str]  = None,
+    table                : Optional[ClassificationTable] = None,
 ) -> None:
-
+    """
+    Decide which isoforms to keep in one pass over the classification file, then
+    write every requested output, in parallel when cpus > 1
+    :param cpus: number of processes writing the outputs, and of htslib threads for a BAM alignment
+    :param rules: (optional) rule set (see utilities/filter_rules.py), DEFAULT_RULES if None.
+                  intrapriming, runAlength, max_dist_to_known_end, min_cov and
+                  filter_mono_exonic are passed to it as parameters.
+    :param prefix: (optional) prefix of the output files, sqanti_class without extension if None
+    :param table: (optional) sqanti_class already read, ex: by a parameter sweep
+    """
     logger = logging.getLogger(__name__)
 
     fafq_type = "fasta"
@@ -73,9 +240,31 @@ def sqanti_filter_lite(
         if h.readline().startswith("@"):
             fafq_type = "fastq"
 
-    prefix = sqanti_class[: sqanti_class.rfind(".")]
+    if prefix is None:
+        prefix = sqanti_class[: sqanti_class.rfind(".")]
+
+    # decide on every isoform with the compiled rules, over whole columns
+    if table is None:
+        table = ClassificationTable.read(sqanti_class)
+    compiled = CompiledRules(DEFAULT_RULES if rules is None else rules, CATEGORY_DICT)
+    reasons = compiled.evaluate(
+        table,
+        {
+            "intrapriming"         : intrapriming,
+            "runAlength"           : runAlength,
+            "max_dist_to_known_end": max_dist_to_known_end,
+            "min_cov"              : min_cov,
+            "filter_mono_exonic"   : filter_mono_exonic,
+        },
+    )
+    isoform_ids = table.strings("isoform")
+    seqids_to_keep = set(isoform_ids[reasons == ""])
+    total_count = len(table)
 
-    with open(f"{prefix}.filtered_lite_reasons.txt", "w") as fcsv:
+    outputClassPath = f"{prefix}.filtered_lite_classification.txt"
+    with open(f"{prefix}.filtered_lite_reasons.txt", "w") as fcsv, open(
+        outputClassPath, "w"
+    ) as fclass:
         header = (
             f"# classification: {sqanti_class}\n"
             f"# isoform: {isoforms}\n"
@@ -84,125 +273,169 @@ def sqanti_filter_lite(
             f"filtered_isoform,reason\n"
         )
         fcsv.write(header)
-
-        seqids_to_keep = set()
-        total_count = 0
-        for r in DictReader(open(sqanti_class), delimiter="\t"):
-            total_count += 1
-            filter_flag, filter_msg = False, ""
-            percA = float(r["perc_A_downstream_TTS"]) / 100
-            assert 0 <= percA <= 1
-            runA = 0
-            while runA < len(r["seq_A_downstream_TTS"]):
-                if r["seq_A_downstream_TTS"][runA] != "A":
-                    break
-                runA += 1
-            calc_min_cov  = float(r["min_cov"]) if r["min_cov"] != "NA" else None
-            num_exon      = int(r["exons"])
-            is_RTS        = r["RTS_stage"] == "TRUE"
-            is_canonical  = r["all_canonical"] == "canonical"
-            is_monoexonic = num_exon == 1
-
-            cat = CATEGORY_DICT[r["structural_category"]]
-
-            potential_intrapriming = (
-                (percA >= intrapriming or runA >= runAlength)
-                and r["polyA_motif"] == "NA"
-                and (
-                    r["diff_to_gene_TSS"] == "NA"
-                    or abs(int(r["diff_to_gene_TTS"])) > max_dist_to_known_end
-                )
-            )
-
-            if cat in ["FSM"]:
-                if potential_intrapriming:
-                    filter_flag, filter_msg = True, "IntraPriming"
-                elif filter_mono_exonic and is_monoexonic:
-                    filter_flag, filter_msg = True, "Mono-Exonic"
+        fclass.write("\t".join(table.fields) + "\n")
+        for line, isoform, reason in zip(table.lines, isoform_ids, reasons):
+            if reason:
+                fcsv.write(f"{isoform},{reason}\n")
             else:
-                if potential_intrapriming:
-                    filter_flag, filter_msg = True, "IntraPriming"
-                elif filter_mono_exonic and is_monoexonic:
-                    filter_flag, filter_msg = True, "Mono-Exonic"
-                elif is_RTS:
-                    filter_flag, filter_msg = True, "RTSwitching"
-                elif (not is_canonical) and (
-                    calc_min_cov is None
-                    or (calc_min_cov is not None and calc_min_cov < min_cov)
-                ):
-                    filter_flag, filter_msg = True, "LowCoverage/Non-Canonical"
-
-            if not filter_flag:
-                seqids_to_keep.add(r["isoform"])
-            else:
-                fcsv.write(f"{r['isoform']},{filter_msg}\n")
+                fclass.write(line)
 
     logger.info(
         f"{total_count} isoforms read from {sqanti_class}. {len(seqids_to_keep)} to be kept."
     )
-
-    with open(f"{prefix}.filtered_lite.{fafq_type}", "w") as fout:
-        if not skipFaFq:
-            for r in SeqIO.parse(open(isoforms), fafq_type):
-                if r.id in seqids_to_keep:
-                    SeqIO.write(r, fout, fafq_type)
-            logger.info(f"Output written to: {fout.name}")
-
-    # write out a new .classification.txt, .junctions.txt
-    outputClassPath = f"{prefix}.filtered_lite_classification.txt"
-    with open(outputClassPath, "w") as f:
-        reader = DictReader(open(sqanti_class), delimiter="\t")
-        writer = DictWriter(f, reader.fieldnames, delimiter="\t")
-        writer.writeheader()
-        for r in reader:
-            if r["isoform"] in seqids_to_keep:
-                writer.writerow(r)
-        logger.info(f"Output written to: {f.name}")
-
-    if not skipJunction:
+    logger.info(f"Output written to: {outputClassPath}")
+
+    # (filter function, input, output) of the other outputs
+    jobs = []
+    if not skipFaFq:
+        jobs.append(
+            (
+                partial(filter_indexed, fastq=fafq_type == "fastq"),
+                isoforms,
+                f"{prefix}.filtered_lite.{fafq_type}",
+            )
+        )
+    if skipJunction:
+        outputJuncPath = junctions  # the report still needs junctions
+    else:
         outputJuncPath = f"{prefix}.filtered_lite_junctions.txt"
-        with open(outputJuncPath, "w") as f:
-            reader = DictReader(open(junctions), delimiter="\t",)
-            writer = DictWriter(f, reader.fieldnames, delimiter="\t")
-            writer.writeheader()
-            for r in reader:
-                if r["isoform"] in seqids_to_keep:
-                    writer.writerow(r)
-            logger.info(f"Output written to: {f.name}")
-
+        jobs.append((filter_table, junctions, outputJuncPath))
     if not skipGTF:
-        outputGTF = f"{prefix}.filtered_lite.gtf"
-        with open(outputGTF, "w") as f:
-            for r in collapseGFFReader(annotation):
-                if r.seqid in seqids_to_keep:
-                    write_collapseGFF_format(f, r)
-            logger.info(f"Output written to: {f.name}")
-
-    if sam is not None:
-        outputSam = f"{prefix}.filtered_lite.sam"
-        with open(outputSam, "w") as f:
-            reader = GMAPSAMReader(sam, True)
-            f.write(reader.header)
-            for r in reader:
-                if r.qID in seqids_to_keep:
-                    f.write(f"{r.record_line}\n")
-            logger.info(f"Output written to: {f.name}")
-
+        jobs.append((filter_gtf, annotation, f"{prefix}.filtered_lite.gtf"))
+    if sam is not None and sam.endswith(".bam"):
+        jobs.append((filter_bam, sam, f"{prefix}.filtered_lite.bam"))
+    elif sam is not None:
+        jobs.append((filter_sam, sam, f"{prefix}.filtered_lite.sam"))
     if faa is not None:
-        outputFAA = f"{prefix}.filtered_lite.faa"
-        with open(outputFAA, "w") as f:
-            for r in SeqIO.parse(open(faa), "fasta"):
-                if r.id in seqids_to_keep:
-                    f.write(f">{r.description}\n{r.seq}\n")
-        logger.info(f"Output written to: {f.name}")
+        jobs.append((filter_fasta, faa, f"{prefix}.filtered_lite.faa"))
+
+    threads = bam_threads(cpus, len(jobs))
+    jobs = [
+        (partial(func, threads=threads) if func is filter_bam else func, src, dst)
+        for func, src, dst in jobs
+    ]
+    if cpus > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(cpus, len(jobs))) as pool:
+            futures = [
+                pool.submit(func, src, dst, seqids_to_keep) for func, src, dst in jobs
+            ]
+            written = [future.result() for future in futures]
+    else:
+        written = [func(src, dst, seqids_to_keep) for func, src, dst in jobs]
+    for filename in written:
+        logger.info(f"Output written to: {filename}")
+
+    if skip_report:
+        return
 
     logger.info("Generating SQANTI3 report...")
-    cmd = f"{RSCRIPTPATH} {UTILITIESPATH}/{RSCRIPT_REPORT} {outputClassPath} {outputJuncPath} {'mock'} {UTILITIESPATH}"
+    cmd = f"{find_program(RSCRIPT)} {UTILITIESPATH}/{RSCRIPT_REPORT} {outputClassPath} {outputJuncPath} {'mock'} {UTILITIESPATH}"
     if subprocess.check_call(cmd, shell=True) != 0:
         logger.error(f"Running command failed: {cmd}")
         sys.exit(-1)
 
 
+def parse_param_value(name: str, value: str):
+    """
+    :return: value of a --sweep parameter, typed as the option of the same name
+    """
+    kind = PARAM_TYPES.get(name)
+    if kind is bool or (kind is None and value.lower() in ("true", "false")):
+        return value.lower() in ("true", "1", "yes")
+    if kind is not None:
+        return kind(value)
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def in_range(name: str, value) -> bool:
+    """
+    :return: True if the value is allowed for the parameter (always for those without a range)
+    """
+    if name not in PARAM_RANGES:
+        return True
+    low, high = PARAM_RANGES[name]
+    return low <= value <= high
+
+
+def parse_sweep(specs: Sequence[str], rule_params: Sequence[str] = ()) -> Dict[str, List]:
+    """
+    :param specs: grid axes, as name=value1,value2,...
+    :param rule_params: names of the parameters of the rule set, besides those of the command-line options
+    :return: name --> list of values
+    """
+    known = set(PARAM_TYPES).union(rule_params)
+    grid = {}
+    for spec in specs:
+        name, sep, values = spec.partition("=")
+        if not sep or not name or not values:
+            raise ValueError(f"invalid --sweep {spec}, expected name=value1,value2,...")
+        if name not in known:
+            raise ValueError(
+                f"unknown --sweep parameter {name}, expected one of {', '.join(sorted(known))}"
+            )
+        grid[name] = [parse_param_value(name, v) for v in values.split(",")]
+        for value in grid[name]:
+            if not in_range(name, value):
+                low, high = PARAM_RANGES[name]
+                raise ValueError(
+                    f"invalid --sweep {spec}, {name} must be between {low:g}-{high:g}"
+                )
+    return grid
+
+
+def grid_points(grid: Dict[str, List]) -> List[Dict]:
+    """
+    :return: every combination of the grid values, in order
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def filter_sweep(
+    table      : ClassificationTable,
+    rules      : CompiledRules,
+    base_params: Dict,
+    points     : List[Dict],
+) -> List[Dict]:
+    """
+    Evaluate the rules at every point of a parameter grid
+    :param base_params: parameter values of the points (overridden by the point values)
+    :return: one row per (point, structural_category, reason) with the number of isoforms, reason "kept" for those kept
+    """
+    categories = table.strings("structural_category")
+    rows = []
+    for i, point in enumerate(points):
+        reasons = rules.evaluate(table, dict(base_params, **point))
+        reasons = np.where(reasons == "", "kept", reasons).astype(str)
+        pairs, counts = np.unique(
+            np.stack([categories, reasons]), axis=1, return_counts=True
+        )
+        for (category, reason), count in zip(pairs.T, counts):
+            rows.append(
+                dict(
+                    point,
+                    point               = i,
+                    structural_category = category,
+                    reason              = reason,
+                    count               = int(count),
+                )
+            )
+    return rows
+
+
+def write_sweep(filename: str, grid: Dict[str, List], rows: List[Dict]) -> None:
+    fields = ["point"] + list(grid) + ["structural_category", "reason", "count"]
+    with open(filename, "w") as f:
+        f.write("\t".join(fields) + "\n")
+        for row in rows:
+            f.write("\t".join(str(row[k]) for k in fields) + "\n")
+
+
 @click.command()
 @click.argument("sqanti_class")
 @click.argument("isoforms")
@@ -210,7 +443,7 @@ def sqanti_filter_lite(
 @click.argument("junctions")
 @click.option(
     "--sam",
-    help         = "(Optional) SAM alignment of the input fasta/fastq",
+    help         = "(Optional) SAM or BAM (.bam) alignment of the input fasta/fastq",
     type         = str,
     default      = None,
 )
@@ -282,6 +515,32 @@ def sqanti_filter_lite(
     show_default = True,
     is_flag      = True,
 )
+@click.option(
+    "--rules",
+    help         = "(Optional) JSON or YAML rule set replacing the default filtering rules",
+    type         = str,
+    default      = None,
+)
+@click.option(
+    "--sweep",
+    help         = "Evaluate a grid of rule parameters instead of filtering, as name=value1,value2,... (can be repeated, ex: --sweep intrapriming=0.5,0.6,0.7 --sweep min_cov=2,3)",
+    type         = str,
+    multiple     = True,
+)
+@click.option(
+    "--materialize",
+    help         = "With --sweep, write the filtered outputs of this grid point (index in the sweep table, can be repeated)",
+    type         = int,
+    multiple     = True,
+)
+@click.option(
+    "-t",
+    "--cpus",
+    help         = "Number of processes writing the filtered output files",
+    type         = click.IntRange(min = 1),
+    default      = 1,
+    show_default = True,
+)
 @click.version_option()
 @click.help_option(show_default=False)
 def main(
@@ -299,6 +558,10 @@ def main(
     skipgtf              : bool          = False,
     skipfafq             : bool          = False,
     skipjunction         : bool          = False,
+    cpus                 : int           = 1,
+    rules                : Optional[str] = None,
+    sweep                : tuple         = (),
+    materialize          : tuple         = (),
 ) -> None:
     """"Filtering of Isoforms based on SQANTI3 attributes
     
@@ -328,21 +591,21 @@ def main(
     st.setFormatter(formatter)
     logger.addHandler(st)
 
-    if RSCRIPTPATH is None or os.system(f"{RSCRIPTPATH} --version") != 0:
+    # a sweep only writes the report of the points it materializes
+    needs_report = not sweep or materialize
+    if needs_report and (
+        find_program(RSCRIPT) is None or os.system(f"{find_program(RSCRIPT)} --version") != 0
+    ):
         logger.error("Rscript executable not found! Abort!")
         sys.exit(-1)
 
-    if intrapriming < 0.25 or intrapriming > 1.0:
-        logger.error(
-            f"--intrapriming must be between 0.25-1, instead given {intrapriming}! Abort!"
-        )
-        sys.exit(-1)
-
-    if runalength < 4 or runalength > 20:
-        logger.error(
-            f"--runAlength must be between 4-20, instead given {runalength}! Abort!"
-        )
-        sys.exit(-1)
+    for name, value in (("intrapriming", intrapriming), ("runAlength", runalength)):
+        if not in_range(name, value):
+            low, high = PARAM_RANGES[name]
+            logger.error(
+                f"--{name} must be between {low:g}-{high:g}, instead given {value}! Abort!"
+            )
+            sys.exit(-1)
 
     sqanti_class = os.path.abspath(sqanti_class)
     if not os.path.isfile(sqanti_class):
@@ -369,6 +632,45 @@ def main(
         logger.error(f"{faa} doesn't exist. Abort!")
         sys.exit(-1)
 
+    if rules is not None:
+        try:
+            ruleset = load_rules(rules)
+            CompiledRules(ruleset, CATEGORY_DICT)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Invalid rule set {rules}: {e}. Abort!")
+            sys.exit(-1)
+    else:
+        ruleset = None
+
+    if sweep:
+        run_sweep(
+            sqanti_class = sqanti_class,
+            ruleset      = ruleset,
+            base_params  = {
+                "intrapriming"         : intrapriming,
+                "runAlength"           : runalength,
+                "max_dist_to_known_end": max_dist_to_known_end,
+                "min_cov"              : min_cov,
+                "filter_mono_exonic"   : filter_mono_exonic,
+            },
+            sweep        = sweep,
+            materialize  = materialize,
+            filter_args  = {
+                "isoforms"    : isoforms,
+                "annotation"  : annotation,
+                "junctions"   : junctions,
+                "sam"         : sam,
+                "faa"         : faa,
+                "skipGTF"     : skipgtf,
+                "skipFaFq"    : skipfafq,
+                "skipJunction": skipjunction,
+                "cpus"        : cpus,
+            },
+        )
+        return
+    if materialize:
+        logger.warning("--materialize is only used with --sweep.")
+
     logger.info("Running SQANTI2 filtering...")
 
     sqanti_filter_lite(
@@ -386,8 +688,73 @@ def main(
         skipGTF               = skipgtf,
         skipFaFq              = skipfafq,
         skipJunction          = skipjunction,
+        cpus                  = cpus,
+        rules                 = ruleset,
     )
 
 
+def run_sweep(
+    sqanti_class: str,
+    ruleset     : Optional[Dict],
+    base_params : Dict,
+    sweep       : Sequence[str],
+    materialize : Sequence[int],
+    filter_args : Dict,
+) -> None:
+    """
+    Read the classification once, count kept and filtered isoforms at every grid
+    point into <prefix>.filtered_lite_sweep.tsv, and write the filtered outputs
+    of the `materialize` points only (prefix <prefix>.sweep<point>)
+    """
+    logger = logging.getLogger(__name__)
+    compiled = CompiledRules(DEFAULT_RULES if ruleset is None else ruleset, CATEGORY_DICT)
+    try:
+        grid = parse_sweep(sweep, rule_params=list(compiled.params))
+    except ValueError as e:
+        logger.error(f"{e}. Abort!")
+        sys.exit(-1)
+    points = grid_points(grid)
+    for i in materialize:
+        if not 0 <= i < len(points):
+            logger.error(f"--materialize {i} is not a grid point (0-{len(points) - 1}). Abort!")
+            sys.exit(-1)
+
+    prefix = sqanti_class[: sqanti_class.rfind(".")]
+    table = ClassificationTable.read(sqanti_class)
+    logger.info(f"Evaluating {len(points)} parameter combinations on {len(table)} isoforms...")
+    try:
+        rows = filter_sweep(table, compiled, base_params, points)
+    except (ValueError, KeyError) as e:
+        logger.error(f"Unable to evaluate the rules: {e}. Abort!")
+        sys.exit(-1)
+    write_sweep(f"{prefix}.filtered_lite_sweep.tsv", grid, rows)
+    kept = Counter()
+    for row in rows:
+        if row["reason"] == "kept":
+            kept[row["point"]] += row["count"]
+    for i, point in enumerate(points):
+        settings = ", ".join(f"{k}={v}" for k, v in point.items())
+        logger.info(f"point {i} ({settings}): {kept[i]} kept")
+    logger.info(f"Output written to: {prefix}.filtered_lite_sweep.tsv")
+
+    for i in materialize:
+        params = dict(base_params, **points[i])
+        sqanti_filter_lite(
+            sqanti_class          = sqanti_class,
+            intrapriming          = params.pop("intrapriming"),
+            runAlength            = params.pop("runAlength"),
+            max_dist_to_known_end = params.pop("max_dist_to_known_end"),
+            min_cov               = params.pop("min_cov"),
+            filter_mono_exonic    = params.pop("filter_mono_exonic"),
+            # other parameters of the point belong to the rule set
+            rules                 = dict(
+                compiled.ruleset, params=dict(compiled.params, **params)
+            ),
+            prefix                = f"{prefix}.sweep{i}",
+            table                 = table,
+            **filter_args,
+        )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+"""
+Long-running sqanti3_qc service with resident genomes and reference annotations.
+
+    sqanti3_daemon serve --socket sq3.sock --reference hg38=hg38.fa,gencode.gtf
+    sqanti3_daemon submit --socket sq3.sock --reference hg38 sample1.fasta -d sample1
+
+`serve` reads the genome and parses the reference annotation of every
+--reference once, then listens on a Unix socket. Every classification job runs
+sqanti3_qc in a process forked from the server, which shares the resident
+genome and reference (copy-on-write) instead of paying for imports, the genome
+load and the reference parsing again. Jobs are isolated from each other and
+from the server: whatever a job modifies, or a failure, stays in its process.
+
+Protocol: one JSON object per line, in both directions.
+    requests    {"command": "ping"}
+                {"command": "shutdown"}
+                {"command": "classify", "reference": <name>, "isoforms": <path>,
+                 "options": {<sqanti3_qc option>: <value>, ...}}
+    responses   {"event": "status", "references": [...], "running": <n>}
+                {"event": "log", "level": <level>, "message": <message>}
+                {"event": "done", "outputs": {<name>: <path>}, "categories": {...}, "stages": [...]}
+                {"event": "error", "message": <message>}
+A classify job streams "log" events until a final "done" or "error" event.
+Paths are used as sent, `submit` makes them absolute.
+"""
+
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from collections import Counter
+from csv import DictReader
+from typing import Dict, Optional
+
+import click
+from sqanti3.__about__ import __version__
+from sqanti3.sqanti3_qc import (
+    get_class_junc_filenames,
+    get_corr_filenames,
+    reference_parser,
+    run_qc,
+    setup_logging,
+)
+from sqanti3.sqanti3_qc import main as qc_main
+
+# run_qc() arguments that are set by the server: the reference, and a job is never split
+SERVER_OPTIONS = {
+    "isoforms",
+    "annotation",
+    "genome",
+    "min_ref_len",
+    "genename",
+    "genome_dict",
+    "reference",
+    "chunks",
+}
+# run_qc() arguments a classify job can set
+JOB_OPTIONS = [
+    name for name in inspect.signature(run_qc).parameters if name not in SERVER_OPTIONS
+]
+# run_qc() options that are paths (or comma-separated paths), made absolute by `submit`
+PATH_OPTIONS = [
+    "cage_peak",
+    "polya_motif_list",
+    "polya_peak",
+    "phylop_bed",
+    "expression",
+    "gmap_index",
+    "directory",
+    "coverage",
+    "fl_count",
+    "gff3",
+]
+
+
+def send_message(stream, message: Dict) -> None:
+    stream.write((json.dumps(message) + "\n").encode())
+    stream.flush()
+
+
+def read_message(stream) -> Optional[Dict]:
+    """
+    :return: next message of the stream, None at end of stream
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class PipeHandler(logging.Handler):
+    """
+    Send the log records of a job to the server as "log" events
+    """
+
+    def __init__(self, conn):
+        super().__init__(level=logging.INFO)
+        self.conn = conn
+
+    def emit(self, record):
+        try:
+            self.conn.send(
+                {"event": "log", "level": record.levelname, "message": self.format(record)}
+            )
+        except (OSError, ValueError):
+            pass
+
+
+class Reference:
+    def __init__(
+        self,
+        name       : str,
+        genome     : str,
+        annotation : str,
+        min_ref_len: int,
+        genename   : bool,
+        cache_dir  : str,
+    ):
+        """
+        Load the genome and parse the annotation
+        :param cache_dir: directory of the refAnnotation_<name>.genePred file
+        """
+        from Bio import SeqIO
+
+        logger = logging.getLogger("sqanti3_qc")
+        self.name = name
+        self.genome = os.path.abspath(genome)
+        self.annotation = os.path.abspath(annotation)
+        self.min_ref_len = min_ref_len
+        self.genename = genename
+        logger.info(f"[{name}] Reading genome fasta {self.genome}...")
+        with open(self.genome) as f:
+            self.genome_dict = {r.name: r for r in SeqIO.parse(f, "fasta")}
+        logger.info(f"[{name}] Parsing reference annotation {self.annotation}...")
+        self.reference = reference_parser(
+            directory     = cache_dir,
+            output        = name,
+            genename      = genename,
+            annotation    = self.annotation,
+            min_ref_len   = min_ref_len,
+            genome_chroms = list(self.genome_dict.keys()),
+        )
+        logger.info(
+            f"[{name}] {len(self.genome_dict)} sequences, "
+            f"{len(self.reference[-1])} reference genes loaded."
+        )
+
+
+def job_outputs(isoforms: str, options: Dict) -> Dict[str, str]:
+    """
+    :return: name --> path of the output files of a finished job
+    """
+    output = options.get("output") or os.path.splitext(os.path.basename(isoforms))[0]
+    directory = options.get("directory") or os.getcwd()
+    classification, junctions = get_class_junc_filenames(output, directory)
+    corrGTF, corrSAM, corrFASTA, corrORF = get_corr_filenames(output, directory)
+    prefix = os.path.join(directory, output)
+    outputs = {
+        "classification": classification,
+        "junctions"     : junctions,
+        "corrected_gtf" : corrGTF,
+        "corrected_sam" : corrSAM,
+        "corrected_fa"  : corrFASTA,
+        "corrected_faa" : corrORF,
+        "params"        : f"{prefix}.params.txt",
+        "run_profile"   : f"{prefix}.run_profile.json",
+        "report"        : f"{prefix}_SQANTI3_report.html",
+    }
+    return {name: path for name, path in outputs.items() if os.path.exists(path)}
+
+
+def job_summary(outputs: Dict[str, str]) -> Dict:
+    """
+    :return: isoforms per structural category and run profile stages of a finished job
+    """
+    summary = {"categories": {}, "stages": []}
+    if "classification" in outputs:
+        with open(outputs["classification"]) as f:
+            summary["categories"] = dict(
+                Counter(r["structural_category"] for r in DictReader(f, delimiter="\t"))
+            )
+    if "run_profile" in outputs:
+        with open(outputs["run_profile"]) as f:
+            summary["stages"] = json.load(f)["stages"]
+    return summary
+
+
+def run_job(conn, reference: Reference, isoforms: str, options: Dict) -> None:
+    """
+    Body of the forked job process: run sqanti3_qc with the resident genome and reference
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handler = PipeHandler(conn)
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    try:
+        directory = options.get("directory")
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            os.chdir(directory)
+        fh = logging.FileHandler(filename="sqanti3_qc.log")
+        fh.setLevel(logging.DEBUG)
+        fh.setFormatter(formatter)
+        logger.addHandler(fh)
+        # fusion isoforms keep the short references, parse the annotation again for them
+        resident = not options.get("is_fusion")
+        run_qc(
+            isoforms    = isoforms,
+            annotation  = reference.annotation,
+            genome      = reference.genome,
+            min_ref_len = reference.min_ref_len,
+            genename    = reference.genename,
+            genome_dict = reference.genome_dict,
+            reference   = reference.reference if resident else None,
+            chunks      = 1,
+            **options,
+        )
+        outputs = job_outputs(isoforms, options)
+        conn.send(dict({"event": "done", "outputs": outputs}, **job_summary(outputs)))
+    except SystemExit as e:
+        conn.send({"event": "error", "message": f"sqanti3_qc exited with status {e.code}"})
+    except Exception:
+        conn.send({"event": "error", "message": traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        logger = logging.getLogger("sqanti3_qc")
+        try:
+            request = read_message(self.rfile)
+        except ValueError as e:
+            send_message(self.wfile, {"event": "error", "message": f"Invalid request ({e})."})
+            return
+        if request is None:
+            return
+        command = request.get("command")
+        if command == "ping":
+            send_message(self.wfile, self.server.status())
+        elif command == "shutdown":
+            send_message(self.wfile, self.server.status())
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command == "classify":
+            try:
+                self.classify(request)
+            except OSError as e:
+                logger.warning(f"Client disconnected ({e}).")
+        else:
+            send_message(self.wfile, {"event": "error", "message": f"Unknown command {command}."})
+
+    def classify(self, request: Dict) -> None:
+        logger = logging.getLogger("sqanti3_qc")
+        server = self.server
+        name = request.get("reference")
+        options = request.get("options", {})
+        error = None
+        if name not in server.references:
+            error = f"Unknown reference {name}, loaded: {', '.join(server.references)}."
+        elif not request.get("isoforms"):
+            error = "No isoforms given."
+        elif set(options) - set(JOB_OPTIONS):
+            error = f"Unknown options: {', '.join(sorted(set(options) - set(JOB_OPTIONS)))}."
+        if error is not None:
+            send_message(self.wfile, {"event": "error", "message": error})
+            return
+
+        with server.slots:
+            parent_conn, child_conn = server.context.Pipe(duplex=False)
+            job = server.context.Process(
+                target = run_job,
+                args   = (child_conn, server.references[name], request["isoforms"], options),
+            )
+            with server.lock:
+                server.running += 1
+            logger.info(f"[{name}] Classifying {request['isoforms']}...")
+            try:
+                job.start()
+                child_conn.close()
+                while True:
+                    try:
+                        message = parent_conn.recv()
+                    except EOFError:
+                        message = {"event": "error", "message": f"Job exited with status {job.exitcode}."}
+                    send_message(self.wfile, message)
+                    if message["event"] in ("done", "error"):
+                        logger.info(f"[{name}] {request['isoforms']}: {message['event']}.")
+                        break
+            except OSError:
+                job.terminate()
+                raise
+            finally:
+                job.join()
+                parent_conn.close()
+                with server.lock:
+                    server.running -= 1
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, references: Dict[str, Reference], jobs: int):
+        """
+        :param jobs: number of jobs run at the same time, the others wait
+        """
+        super().__init__(path, Handler)
+        self.references = references
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.lock = threading.Lock()
+        self.running = 0
+        # jobs inherit the resident genomes and references
+        self.context = multiprocessing.get_context("fork")
+
+    def status(self) -> Dict:
+        return {
+            "event"     : "status",
+            "version"   : __version__,
+            "references": sorted(self.references),
+            "running"   : self.running,
+        }
+
+
+@click.group()
+@click.version_option(version=__version__)
+def main():
+    """
+    Run sqanti3_qc as a service keeping genomes and reference annotations in memory
+    """
+    pass
+
+
+@main.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    help         = "Path of the Unix socket to listen on",
+    type         = click.Path(),
+    required     = True,
+)
+@click.option(
+    "--reference",
+    "references",
+    help         = "Reference to keep in memory, as name=genome.fasta,annotation.gtf (can be repeated)",
+    type         = str,
+    multiple     = True,
+    required     = True,
+)
+@click.option(
+    "--min_ref_len",
+    help         = "Minimum reference transcript length",
+    type         = int,
+    default      = 200,
+    show_default = True,
+)
+@click.option(
+    "--genename",
+    help         = "Use gene_name tag from GTF to define genes. Default: gene_id used to define genes",
+    type         = bool,
+    default      = False,
+    show_default = True,
+    is_flag      = True,
+)
+@click.option(
+    "--cache_dir",
+    help         = "Directory of the parsed reference annotations",
+    type         = click.Path(),
+    default      = "sqanti3_daemon_cache",
+    show_default = True,
+)
+@click.option(
+    "--jobs",
+    help         = "Number of classification jobs run at the same time",
+    type         = int,
+    default      = 1,
+    show_default = True,
+)
+def serve(
+    socket_path: str,
+    references : tuple,
+    min_ref_len: int  = 200,
+    genename   : bool = False,
+    cache_dir  : str  = "sqanti3_daemon_cache",
+    jobs       : int  = 1,
+) -> None:
+    """
+    Load the references and serve classification jobs
+    """
+    setup_logging("sqanti3_daemon.log")
+    logger = logging.getLogger("sqanti3_qc")
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_dir = os.path.abspath(cache_dir)
+
+    loaded = {}
+    for spec in references:
+        name, _, files = spec.partition("=")
+        files = files.split(",")
+        if not name or len(files) != 2:
+            logger.error(f"Invalid --reference {spec}, expected name=genome.fasta,annotation.gtf. Abort!")
+            sys.exit(-1)
+        for filename in files:
+            if not os.path.isfile(filename):
+                logger.error(f"Reference file {filename} doesn't exist. Abort!")
+                sys.exit(-1)
+        loaded[name] = Reference(name, files[0], files[1], min_ref_len, genename, cache_dir)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with Server(socket_path, loaded, jobs) as server:
+        logger.info(f"Listening on {socket_path} ({', '.join(loaded)}).")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+    logger.info("Server stopped.")
+
+
+@main.command()
+@click.argument("isoforms", type=str, required=False)
+@click.option(
+    "--socket",
+    "socket_path",
+    help         = "Path of the Unix socket of the server",
+    type         = click.Path(),
+    required     = True,
+)
+@click.option(
+    "--reference",
+    help         = "Name of the reference to classify against",
+    type         = str,
+)
+@click.option(
+    "--ping",
+    help         = "Print the status of the server",
+    type         = bool,
+    default      = False,
+    is_flag      = True,
+)
+@click.option(
+    "--shutdown",
+    help         = "Stop the server",
+    type         = bool,
+    default      = False,
+    is_flag      = True,
+)
+def submit(
+    isoforms   : Optional[str],
+    socket_path: str,
+    reference  : Optional[str],
+    ping       : bool,
+    shutdown   : bool,
+    **options,
+) -> None:
+    """
+    Send a classification job to a running server and print its log and outputs
+    """
+    if ping or shutdown:
+        request = {"command": "shutdown" if shutdown else "ping"}
+    elif isoforms is None or reference is None:
+        raise click.UsageError("ISOFORMS and --reference are required to classify.")
+    else:
+        if options["directory"] is None:
+            options["directory"] = os.getcwd()
+        for k in PATH_OPTIONS:
+            if options.get(k) is not None:
+                options[k] = ",".join(os.path.abspath(p) for p in options[k].split(","))
+        request = {
+            "command"  : "classify",
+            "reference": reference,
+            "isoforms" : os.path.abspath(isoforms),
+            "options"  : options,
+        }
+
+    status = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        stream = sock.makefile("rwb")
+        send_message(stream, request)
+        while True:
+            message = read_message(stream)
+            if message is None:
+                click.echo("Connection closed by the server.", err=True)
+                status = 1
+                break
+            event = message["event"]
+            if event == "log":
+                click.echo(message["message"], err=True)
+                continue
+            if event == "error":
+                click.echo(message["message"], err=True)
+                status = 1
+            elif event == "done":
+                for name, path in message["outputs"].items():
+                    click.echo(f"{name}\t{path}")
+            else:
+                click.echo(json.dumps(message))
+            break
+    sys.exit(status)
+
+
+# the job options of `submit` are those of sqanti3_qc
+submit.params.extend(p for p in qc_main.params if p.name in JOB_OPTIONS)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,7 @@
 
 import bisect
 import copy
-import distutils.spawn
 import glob
-import itertools
 import logging
 import os
 import re
@@ -24,27 +22,38 @@
 from collections.abc import Iterable
 from csv import DictReader, DictWriter
 from multiprocessing import Process
-from typing import Dict, List, Optional, Tuple, Sequence
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, Sequence
 from contextlib import contextmanager
 
 # import argparse
 import click
 
 import numpy as np
-from Bio import SeqIO, SeqRecord
 from bx.intervals.intersection import Interval, IntervalTree
-from cupcake.cupcake.tofu.compare_junctions import compare_junctions
-from cupcake.sequence.BED import LazyBEDPointReader
-from cupcake.sequence.err_correct_w_genome import err_correct
-from cupcake.sequence.GFF import collapseGFFReader, write_collapseGFF_format
-from cupcake.sequence.sam_to_gff3 import convert_sam_to_gff3
-from cupcake.sequence.STAR import STARJunctionReader
-from pygmst.pygmst import gmst
+# Bio, cupcake, pygmst, pysam and IsoAnnotLite (pandas) are imported by the
+# stages that use them, so that `--help` and argument checks start quickly
 from sqanti3.__about__ import __version__
 from sqanti3 import __path__ as sqpath
-from sqanti3.utilities.indels_annot import calc_indels_from_sam
-from sqanti3.utilities.rt_switching import rts
-from sqanti3.utilities import IsoAnnotLite_SQ1
+from sqanti3.utilities.genome_arrays import (
+    PAD,
+    GenomeArrays,
+    as_strings,
+    find_motifs,
+    reverse_complement,
+    to_upper,
+)
+from sqanti3.utilities.peak_index import PeakArrays, build_peak_index, load_peak_index
+from sqanti3.utilities.profiling import StageProfiler
+from sqanti3.utilities.programs import find_program
+from sqanti3.utilities.score_track import (
+    build_score_index,
+    format_score,
+    is_bigwig,
+    open_score_track,
+)
+
+if TYPE_CHECKING:
+    from Bio.SeqRecord import SeqRecord
 
 UTILITIESPATH = f"{sqpath[0]}{os.sep}utilities"
 sys.path.insert(0, UTILITIESPATH)
@@ -55,9 +64,24 @@
 )
 DESALT_CMD = "deSALT aln {dir} {i} -t {cpus} -x ccs -o {o}"
 
-GTF2GENEPRED_PROG = distutils.spawn.find_executable("gtfToGenePred")
-GFFREAD_PROG = distutils.spawn.find_executable("gffread")
-RSCRIPTPATH = distutils.spawn.find_executable("Rscript")
+# external programs, searched in PATH on first use (see find_program)
+GTF2GENEPRED = "gtfToGenePred"
+GFFREAD = "gffread"
+RSCRIPT = "Rscript"
+# module attributes kept for scripts that read the program paths
+_PROGRAM_PATHS = {
+    "GTF2GENEPRED_PROG": GTF2GENEPRED,
+    "GFFREAD_PROG"     : GFFREAD,
+    "RSCRIPTPATH"      : RSCRIPT,
+}
+
+
+def __getattr__(name):
+    if name in _PROGRAM_PATHS:
+        return find_program(_PROGRAM_PATHS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 RSCRIPT_REPORT = os.path.join(UTILITIESPATH, "SQANTI3_report.R")
 
 ISOANNOT_PROG = os.path.join(UTILITIESPATH, "IsoAnnotLite_SQ3.py")
@@ -136,6 +160,7 @@
     "within_polya_site",
     "polyA_motif",
     "polyA_dist",
+    "runA_downstream_TTS",
 ]
 
 
@@ -197,6 +222,15 @@ def __init__(
     def segments(self):
         return self.exons
 
+    def count_exon_overlaps(self, start, end):
+        """
+        Number of exons overlapping [start, end), using the sorted exon boundaries
+        (exons of a genePred are sorted and do not overlap)
+        """
+        return bisect.bisect_left(self.exonStarts, end) - bisect.bisect_right(
+            self.exonEnds, start
+        )
+
     @classmethod
     def from_line(cls, line):
         raw = line.strip().split("\t")
@@ -241,6 +275,48 @@ def get_splice_site(self, genome_dict, i):
             ).upper()
 
 
+class IntronIndex:
+    """
+    Sorted intron interval index of one chromosome for containment queries
+    Introns are (donor, acceptor) junctions: 1-based last base of the prev exon and
+    0-based first base of the next exon, as in genePredRecord.junctions.
+    """
+
+    def __init__(self, da_pairs):
+        """
+        :param da_pairs: list of (donor, acceptor) junctions sorted by donor
+        """
+        self.starts = [d for d, _ in da_pairs]
+        self.ends = [a for _, a in da_pairs]
+        # running max of ends from the left and running min of ends from the right
+        self.max_end_before = []
+        for a in self.ends:
+            self.max_end_before.append(
+                max(a, self.max_end_before[-1]) if self.max_end_before else a
+            )
+        self.min_end_after = [0] * len(self.ends)
+        for i in range(len(self.ends) - 1, -1, -1):
+            self.min_end_after[i] = (
+                min(self.ends[i], self.min_end_after[i + 1])
+                if i + 1 < len(self.ends)
+                else self.ends[i]
+            )
+
+    def any_within(self, start, end):
+        """
+        :return: True if some intron has start <= donor and acceptor < end
+        """
+        i = bisect.bisect_left(self.starts, start)
+        return i < len(self.starts) and self.min_end_after[i] < end
+
+    def any_containing(self, start, end):
+        """
+        :return: True if some intron has donor <= start and end <= acceptor
+        """
+        i = bisect.bisect_right(self.starts, start)
+        return i > 0 and self.max_end_before[i - 1] >= end
+
+
 class myQueryTranscripts:
     def __init__(
         self,
@@ -286,6 +362,7 @@ def __init__(
         FSM_class=None,
         percAdownTTS=None,
         seqAdownTTS=None,
+        runAdownTTS=None,
         dist_cage="NA",
         within_cage="NA",
         dist_polya_site="NA",
@@ -343,6 +420,7 @@ def __init__(
         self.bite              = bite
         self.percAdownTTS      = percAdownTTS
         self.seqAdownTTS       = seqAdownTTS
+        self.runAdownTTS       = runAdownTTS
         self.dist_cage         = dist_cage
         self.within_cage       = within_cage
         self.within_polya_site = within_polya_site
@@ -422,6 +500,7 @@ def __str__(self):
             f"{str(self.within_polya_site)}\t"
             f"{str(self.polyA_motif)}\t"
             f"{str(self.polyA_dist)}\t"
+            f"{str(self.runAdownTTS)}\t"
         )
         return stringrep
 
@@ -473,6 +552,7 @@ def as_dict(self):
             "within_polya_site"    : self.within_polya_site,
             "polyA_motif"          : self.polyA_motif,
             "polyA_dist"           : self.polyA_dist,
+            "runA_downstream_TTS"  : self.runAdownTTS,
         }
         for sample, count in self.FL_dict.items():
             d["FL." + sample] = count
@@ -545,6 +625,8 @@ def write_collapsed_GFF_with_CDS(isoforms_info, input_gff, output_gff):
     :param input_gff:  input GFF filename
     :param output_gff: output GFF filename
     """
+    from cupcake.sequence.GFF import collapseGFFReader, write_collapseGFF_format
+
     with open(output_gff, "w") as f:
         reader = collapseGFFReader(input_gff)
         for r in reader:
@@ -609,16 +691,24 @@ def correctionPlusORFpred(
     isoforms: str,
     is_fusion: bool,
     skipORF: bool,
-    genome_dict: Dict[str, SeqRecord.SeqRecord],
+    genome_dict: Dict[str, "SeqRecord"],
     genome: str = None,
     gmap_index: str = None,
     orf_input: str = None,
+    profiler: Optional[StageProfiler] = None,
 ) -> Dict[str, myQueryProteins]:
     """
     Use the reference genome to correct the sequences (unless a pre-corrected GTF is given)
+    :param profiler: (optional) StageProfiler recording the alignment, correction and ORF prediction stages
     """
+    from Bio import SeqIO
+    from cupcake.sequence.err_correct_w_genome import err_correct
+    from cupcake.sequence.sam_to_gff3 import convert_sam_to_gff3
+    from pygmst.pygmst import gmst
 
     logger = logging.getLogger("sqanti3_qc")
+    if profiler is None:
+        profiler = StageProfiler()
     corrGTF, corrSAM, corrFASTA, corrORF = get_corr_filenames(output, directory)
 
     n_cpu = max(1, cpus // chunks)
@@ -632,181 +722,186 @@ def correctionPlusORFpred(
             if os.path.exists(corrSAM):
                 logger.info(f"Aligned SAM {corrSAM} already exists. Using it...")
             else:
-                if aligner_choice == "gmap":
-                    logger.info("Aligning reads with GMAP...")
-                    cmd = GMAP_CMD.format(
-                        cpus=n_cpu,
-                        dir=os.path.dirname(gmap_index),
-                        name=os.path.basename(gmap_index),
-                        sense=sense,
-                        i=isoforms,
-                        o=corrSAM,
-                    )
-                elif aligner_choice == "minimap2":
-                    logger.info("Aligning reads with Minimap2...")
-                    cmd = MINIMAP2_CMD.format(
-                        cpus=n_cpu, sense=sense, g=genome, i=isoforms, o=corrSAM
-                    )
-                elif aligner_choice == "deSALT":
-                    logger.info("Aligning reads with deSALT...")
-                    cmd = DESALT_CMD.format(
-                        cpus=n_cpu, dir=gmap_index, i=isoforms, o=corrSAM
-                    )
-                try:
-                    subprocess.run(cmd, shell=True, check=True)
-                except subprocess.CalledProcessError as error:
-                    logger.error(f"{error}: {error.output}")
+                with profiler.stage("alignment"):
+                    if aligner_choice == "gmap":
+                        logger.info("Aligning reads with GMAP...")
+                        cmd = GMAP_CMD.format(
+                            cpus=n_cpu,
+                            dir=os.path.dirname(gmap_index),
+                            name=os.path.basename(gmap_index),
+                            sense=sense,
+                            i=isoforms,
+                            o=corrSAM,
+                        )
+                    elif aligner_choice == "minimap2":
+                        logger.info("Aligning reads with Minimap2...")
+                        cmd = MINIMAP2_CMD.format(
+                            cpus=n_cpu, sense=sense, g=genome, i=isoforms, o=corrSAM
+                        )
+                    elif aligner_choice == "deSALT":
+                        logger.info("Aligning reads with deSALT...")
+                        cmd = DESALT_CMD.format(
+                            cpus=n_cpu, dir=gmap_index, i=isoforms, o=corrSAM
+                        )
+                    try:
+                        subprocess.run(cmd, shell=True, check=True)
+                    except subprocess.CalledProcessError as error:
+                        logger.error(f"{error}: {error.output}")
+                        sys.exit(-1)
+                    logger.debug(cmd)
+
+            with profiler.stage("correction"):
+                # if is fusion - go in and change the IDs to reflect PBfusion.X.1, PBfusion.X.2...
+                if is_fusion:
+                    corrSAM = rewrite_sam_for_fusion_ids(corrSAM)
+                # error correct the genome (input: corrSAM, output: corrFASTA)
+                err_correct(
+                    genome_file=genome,
+                    sam_file=corrSAM,
+                    output_err_corrected_fasta=corrFASTA,
+                    genome_dict=genome_dict,
+                )
+                # convert SAM to GFF --> GTF
+                logger.debug(f"corrSAM: {corrSAM}")
+                logger.debug(f"corrFASTA: {corrFASTA}")
+                logger.debug(f"corrGTF: {corrGTF}")
+                logger.debug(f"genome: {genome}")
+
+                convert_sam_to_gff3(
+                    sam_filename=corrSAM,
+                    output_gff3=f"{corrGTF}.tmp",
+                    source=os.path.basename(genome).split(".")[0],
+                )  # convert SAM to GFF3
+                cmd = f"{find_program(GFFREAD)} {corrGTF}.tmp -T -o {corrGTF}"
+                if subprocess.check_call(cmd.split()) != 0:
+                    logger.error(f"running cmd: {cmd}")
                     sys.exit(-1)
-                logger.debug(cmd)
-
-            # if is fusion - go in and change the IDs to reflect PBfusion.X.1, PBfusion.X.2...
-            if is_fusion:
-                corrSAM = rewrite_sam_for_fusion_ids(corrSAM)
-            # error correct the genome (input: corrSAM, output: corrFASTA)
-            err_correct(
-                genome_file=genome,
-                sam_file=corrSAM,
-                output_err_corrected_fasta=corrFASTA,
-                genome_dict=genome_dict,
-            )
-            # convert SAM to GFF --> GTF
-            logger.debug(f"corrSAM: {corrSAM}")
-            logger.debug(f"corrFASTA: {corrFASTA}")
-            logger.debug(f"corrGTF: {corrGTF}")
-            logger.debug(f"genome: {genome}")
-
-            convert_sam_to_gff3(
-                sam_filename=corrSAM,
-                output_gff3=f"{corrGTF}.tmp",
-                source=os.path.basename(genome).split(".")[0],
-            )  # convert SAM to GFF3
-            cmd = f"{GFFREAD_PROG} {corrGTF}.tmp -T -o {corrGTF}"
-            if subprocess.check_call(cmd.split()) != 0:
-                logger.error(f"running cmd: {cmd}")
-                sys.exit(-1)
-            else:
-                logger.debug(cmd)
+                else:
+                    logger.debug(cmd)
         else:
-            logger.info("Skipping aligning of sequences because GTF file was provided.")
-
-            ind = 0
-            with open(isoforms, "r") as isoforms_gtf:
-                for line in isoforms_gtf:
-                    if line[0] != "#" and len(line.split("\t")) != 9:
-                        logger.error("ERROR: input isoforms file with not GTF format.")
-                        sys.exit()
-                    elif len(line.split("\t")) == 9:
-                        ind += 1
-                if ind == 0:
-                    logger.warning(f"GTF has {isoforms} no annotation lines.")
-
-            # GFF to GTF (in case the user provides gff instead of gtf)
-            corrGTF_tpm = f"{corrGTF}.tmp"
-            try:
-                subprocess.run([GFFREAD_PROG, isoforms, "-T", "-o", corrGTF_tpm])
-            except (RuntimeError, TypeError, NameError):
-                logger.error(f"File {isoforms} without GTF/GFF format.")
-                raise SystemExit(1)
-
-            # check if gtf chromosomes inside genome file
-            with open(corrGTF, "w") as corrGTF_out:
-                with open(corrGTF_tpm, "r") as isoforms_gtf:
+            with profiler.stage("correction"):
+                logger.info("Skipping aligning of sequences because GTF file was provided.")
+
+                ind = 0
+                with open(isoforms, "r") as isoforms_gtf:
                     for line in isoforms_gtf:
-                        if line[0] != "#":
-                            chrom = line.split("\t")[0]
-                            type = line.split("\t")[2]
-                            if chrom not in list(genome_dict.keys()):
-                                logger.error(
-                                    f"gtf '{chrom}' chromosome not found in genome reference file."
-                                )
-                                sys.exit()
-                            elif type in ("transcript", "exon"):
-                                corrGTF_out.write(line)
-            os.remove(corrGTF_tpm)
-
-            if not os.path.exists(corrSAM):
-                logger.info(
-                    "Indels will be not calculated since you ran SQANTI3 without alignment step (SQANTI3 with gtf format as transcriptome input)."
-                )
+                        if line[0] != "#" and len(line.split("\t")) != 9:
+                            logger.error("ERROR: input isoforms file with not GTF format.")
+                            sys.exit()
+                        elif len(line.split("\t")) == 9:
+                            ind += 1
+                    if ind == 0:
+                        logger.warning(f"GTF has {isoforms} no annotation lines.")
+
+                # GFF to GTF (in case the user provides gff instead of gtf)
+                corrGTF_tpm = f"{corrGTF}.tmp"
+                try:
+                    subprocess.run([find_program(GFFREAD), isoforms, "-T", "-o", corrGTF_tpm])
+                except (RuntimeError, TypeError, NameError):
+                    logger.error(f"File {isoforms} without GTF/GFF format.")
+                    raise SystemExit(1)
+
+                # check if gtf chromosomes inside genome file
+                with open(corrGTF, "w") as corrGTF_out:
+                    with open(corrGTF_tpm, "r") as isoforms_gtf:
+                        for line in isoforms_gtf:
+                            if line[0] != "#":
+                                chrom = line.split("\t")[0]
+                                type = line.split("\t")[2]
+                                if chrom not in list(genome_dict.keys()):
+                                    logger.error(
+                                        f"gtf '{chrom}' chromosome not found in genome reference file."
+                                    )
+                                    sys.exit()
+                                elif type in ("transcript", "exon"):
+                                    corrGTF_out.write(line)
+                os.remove(corrGTF_tpm)
+
+                if not os.path.exists(corrSAM):
+                    logger.info(
+                        "Indels will be not calculated since you ran SQANTI3 without alignment step (SQANTI3 with gtf format as transcriptome input)."
+                    )
 
-            # GTF to FASTA
-            subprocess.run([GFFREAD_PROG, corrGTF, "-g", genome, "-w", corrFASTA])
+                # GTF to FASTA
+                subprocess.run([find_program(GFFREAD), corrGTF, "-g", genome, "-w", corrFASTA])
 
     # ORF generation
-    logger.info("Predicting ORF sequences...")
-
-    gmst_dir = os.path.join(os.path.abspath(directory), "GMST")
-    logger.debug(f"gmst_dir: {gmst_dir}")
-    gmst_pre = os.path.join(gmst_dir, "GMST_tmp")
-    if not os.path.exists(gmst_dir):
-        os.makedirs(gmst_dir)
-
-    # sequence ID example: PB.2.1 gene_4|GeneMark.hmm|264_aa|+|888|1682
-    gmst_rex = re.compile(r"(\S+\t\S+\|GeneMark.hmm)\|(\d+)_aa\|(\S)\|(\d+)\|(\d+)")
-    orfDict = {}  # GMST seq id --> myQueryProteins object
-    if skipORF:
-        logger.warning(
-            "Skipping ORF prediction because user requested it. All isoforms will be non-coding!"
-        )
-    elif os.path.exists(corrORF):
-        logger.info(f"ORF file {corrORF} already exists. Using it....")
-        for r in SeqIO.parse(open(corrORF), "fasta"):
-            # now process ORFs into myQueryProtein objects
-            m             = gmst_rex.match(r.description)
-            if m is None:
-                logger.error(
-                    f"Expected GMST output IDs to be of format '<pbid> gene_4|GeneMark.hmm|<orf>_aa|<strand>|<cds_start>|<cds_end>' but instead saw: {r.description}! Abort!"
-                )
-                sys.exit(-1)
-            orf_length    = int(m.group(2))
-            cds_start     = int(m.group(4))
-            cds_end       = int(m.group(5))
-            orfDict[r.id] = myQueryProteins(
-                cds_start, cds_end, orf_length, str(r.seq), proteinID=r.id
+    with profiler.stage("orf_prediction") as record:
+        logger.info("Predicting ORF sequences...")
+
+        gmst_dir = os.path.join(os.path.abspath(directory), "GMST")
+        logger.debug(f"gmst_dir: {gmst_dir}")
+        gmst_pre = os.path.join(gmst_dir, "GMST_tmp")
+        if not os.path.exists(gmst_dir):
+            os.makedirs(gmst_dir)
+
+        # sequence ID example: PB.2.1 gene_4|GeneMark.hmm|264_aa|+|888|1682
+        gmst_rex = re.compile(r"(\S+\t\S+\|GeneMark.hmm)\|(\d+)_aa\|(\S)\|(\d+)\|(\d+)")
+        orfDict = {}  # GMST seq id --> myQueryProteins object
+        if skipORF:
+            logger.warning(
+                "Skipping ORF prediction because user requested it. All isoforms will be non-coding!"
             )
-    else:
-        cur_dir = os.path.abspath(os.getcwd())
-        os.chdir(directory)
-        logger.info(corrFASTA)
-        if orf_input is not None:
-            logger.info(f"Running ORF predction on {orf_input}")
-            gmst(seqfile=orf_input, output=gmst_pre, faa=True, fnn=True, strand="direct")
-        else:
-            gmst(seqfile=corrFASTA, output=gmst_pre, faa=True, fnn=True, strand="direct")
-        os.chdir(cur_dir)
-        # Modifying ORF sequences by removing sequence before ATG
-        with open(corrORF, "w") as f:
-            for r in SeqIO.parse(open(gmst_pre + ".faa"), "fasta"):
-                m = gmst_rex.match(r.description)
+        elif os.path.exists(corrORF):
+            logger.info(f"ORF file {corrORF} already exists. Using it....")
+            for r in SeqIO.parse(open(corrORF), "fasta"):
+                # now process ORFs into myQueryProtein objects
+                m             = gmst_rex.match(r.description)
                 if m is None:
                     logger.error(
                         f"Expected GMST output IDs to be of format '<pbid> gene_4|GeneMark.hmm|<orf>_aa|<strand>|<cds_start>|<cds_end>' but instead saw: {r.description}! Abort!"
                     )
                     sys.exit(-1)
-                id_pre = m.group(1)
-                orf_length = int(m.group(2))
-                orf_strand = m.group(3)
-                cds_start = int(m.group(4))
-                cds_end = int(m.group(5))
-                pos = r.seq.find("M")
-                if pos != -1:
-                    # must modify both the sequence ID and the sequence
-                    orf_length -= pos
-                    cds_start += pos * 3
-                    newid = (
-                        f"{id_pre}|{orf_length}_aa|{orf_strand}|{cds_start}|{cds_end}"
-                    )
-                    newseq = str(r.seq)[pos:]
-                    orfDict[r.id] = myQueryProteins(
-                        cds_start, cds_end, orf_length, str(r.seq), proteinID=newid
-                    )
-                    f.write(f">{newid}\n{newseq}\n")
-                else:
-                    new_rec = r
-                    orfDict[r.id] = myQueryProteins(
-                        cds_start, cds_end, orf_length, str(r.seq), proteinID=r.id
-                    )
-                    f.write(f">{new_rec.description}\n{new_rec.seq}\n")
+                orf_length    = int(m.group(2))
+                cds_start     = int(m.group(4))
+                cds_end       = int(m.group(5))
+                orfDict[r.id] = myQueryProteins(
+                    cds_start, cds_end, orf_length, str(r.seq), proteinID=r.id
+                )
+        else:
+            cur_dir = os.path.abspath(os.getcwd())
+            os.chdir(directory)
+            logger.info(corrFASTA)
+            if orf_input is not None:
+                logger.info(f"Running ORF predction on {orf_input}")
+                gmst(seqfile=orf_input, output=gmst_pre, faa=True, fnn=True, strand="direct")
+            else:
+                gmst(seqfile=corrFASTA, output=gmst_pre, faa=True, fnn=True, strand="direct")
+            os.chdir(cur_dir)
+            # Modifying ORF sequences by removing sequence before ATG
+            with open(corrORF, "w") as f:
+                for r in SeqIO.parse(open(gmst_pre + ".faa"), "fasta"):
+                    m = gmst_rex.match(r.description)
+                    if m is None:
+                        logger.error(
+                            f"Expected GMST output IDs to be of format '<pbid> gene_4|GeneMark.hmm|<orf>_aa|<strand>|<cds_start>|<cds_end>' but instead saw: {r.description}! Abort!"
+                        )
+                        sys.exit(-1)
+                    id_pre = m.group(1)
+                    orf_length = int(m.group(2))
+                    orf_strand = m.group(3)
+                    cds_start = int(m.group(4))
+                    cds_end = int(m.group(5))
+                    pos = r.seq.find("M")
+                    if pos != -1:
+                        # must modify both the sequence ID and the sequence
+                        orf_length -= pos
+                        cds_start += pos * 3
+                        newid = (
+                            f"{id_pre}|{orf_length}_aa|{orf_strand}|{cds_start}|{cds_end}"
+                        )
+                        newseq = str(r.seq)[pos:]
+                        orfDict[r.id] = myQueryProteins(
+                            cds_start, cds_end, orf_length, str(r.seq), proteinID=newid
+                        )
+                        f.write(f">{newid}\n{newseq}\n")
+                    else:
+                        new_rec = r
+                        orfDict[r.id] = myQueryProteins(
+                            cds_start, cds_end, orf_length, str(r.seq), proteinID=r.id
+                        )
+                        f.write(f">{new_rec.description}\n{new_rec.seq}\n")
+        record["records"] = len(orfDict)
 
     if len(orfDict) == 0:
         logger.warning("All input isoforms were predicted as non-coding")
@@ -821,11 +916,13 @@ def reference_parser(
     annotation: str,
     min_ref_len: int,
     genome_chroms: List[str],
+    is_fusion: bool = False,
 ):  # -> Tuple[Dict, Dict, Dict, Dict, Dict]: # not sure exactly what the outputs are yet
     """
     Read the reference GTF file
     :param args:
     :param genome_chroms: list of chromosome names from the genome fasta, used for sanity checking
+    :param is_fusion: keep the references shorter than min_ref_len
     :return: (refs_1exon_by_chr, refs_exons_by_chr, junctions_by_chr, junctions_by_gene)
     """
     # global referenceFiles
@@ -840,7 +937,7 @@ def reference_parser(
         # gtf to genePred
         if not genename:
             cmd = [
-                GTF2GENEPRED_PROG,
+                find_program(GTF2GENEPRED),
                 annotation,
                 referenceFiles,
                 "-genePredExt",
@@ -849,7 +946,7 @@ def reference_parser(
             ]
         else:
             cmd = [
-                GTF2GENEPRED_PROG,
+                find_program(GTF2GENEPRED),
                 annotation,
                 referenceFiles,
                 "-genePredExt",
@@ -871,16 +968,25 @@ def reference_parser(
     refs_exons_by_chr = defaultdict(lambda: IntervalTree())
     # store donors as the exon end (1-based) and acceptor as the exon start (0-based)
     # will convert the sets to sorted list later
+    # "chains" hashes the intron chain of each multi-exon reference: (strand, chain) --> set of references
+    # "genes" is the junction --> set of genes that have it
     junctions_by_chr = defaultdict(
-        lambda: {"donors": set(), "acceptors": set(), "da_pairs": set()}
+        lambda: {
+            "donors"   : set(),
+            "acceptors": set(),
+            "da_pairs" : set(),
+            "chains"   : defaultdict(lambda: set()),
+            "genes"    : defaultdict(lambda: set()),
+        }
     )
     # dict of gene name --> set of junctions (don't need to record chromosome)
     junctions_by_gene = defaultdict(lambda: set())
     # dict of gene name --> list of known begins and ends (begin always < end, regardless of strand)
+    # will convert the sets to sorted arrays and add the gene span later
     known_5_3_by_gene = defaultdict(lambda: {"begin": set(), "end": set()})
 
     for r in genePredReader(referenceFiles):
-        if r.length < min_ref_len and not args.is_fusion:
+        if r.length < min_ref_len and not is_fusion:
             continue  # ignore miRNAs
         if r.exonCount == 1:
             refs_1exon_by_chr[r.chrom].insert(r.txStart, r.txEnd, r)
@@ -894,6 +1000,8 @@ def reference_parser(
                 junctions_by_chr[r.chrom]["acceptors"].add(a)
                 junctions_by_chr[r.chrom]["da_pairs"].add((d, a))
                 junctions_by_gene[r.gene].add((d, a))
+                junctions_by_chr[r.chrom]["genes"][(d, a)].add(r.gene)
+            junctions_by_chr[r.chrom]["chains"][(r.strand, tuple(r.junctions))].add(r)
             known_5_3_by_gene[r.gene]["begin"].add(r.txStart)
             known_5_3_by_gene[r.gene]["end"].add(r.txEnd)
 
@@ -913,6 +1021,12 @@ def reference_parser(
         junctions_by_chr[k]["acceptors"].sort()
         junctions_by_chr[k]["da_pairs"] = list(junctions_by_chr[k]["da_pairs"])
         junctions_by_chr[k]["da_pairs"].sort()
+        junctions_by_chr[k]["introns"] = IntronIndex(junctions_by_chr[k]["da_pairs"])
+        junctions_by_chr[k]["chains"] = dict(junctions_by_chr[k]["chains"])
+        junctions_by_chr[k]["genes"] = dict(junctions_by_chr[k]["genes"])
+
+    for k, sites in known_5_3_by_gene.items():
+        known_5_3_by_gene[k] = gene_sites(sites["begin"], sites["end"])
 
     return (
         dict(refs_1exon_by_chr),  # Dict[str, ]
@@ -934,7 +1048,7 @@ def isoforms_parser(corrGTF: str) -> Tuple[List[str], str]:
 
     # gtf to genePred
     cmd = (
-        f"{GTF2GENEPRED_PROG} {corrGTF} {queryFile} "
+        f"{find_program(GTF2GENEPRED)} {corrGTF} {queryFile} "
         f"-genePredExt -allErrors -ignoreGroupsWithoutExons"
     )
     if subprocess.check_call(cmd, shell=True) != 0:
@@ -960,6 +1074,8 @@ def STARcov_parser(
     :param coverageFiles: comma-separated list of STAR junction output files or a directory containing junction files
     :return: list of samples, dict of (chrom,strand) --> (0-based start, 1-based end) --> {dict of sample -> unique reads supporting this junction}
     """
+    from cupcake.sequence.STAR import STARJunctionReader
+
     logger = logging.getLogger("sqanti3_qc")
 
     if os.path.isdir(coverageFiles) is True:
@@ -1096,17 +1212,77 @@ def expression_parser(expressionFile):
         return exp_dict
 
 
+def gene_sites(begins, ends) -> Dict:
+    """
+    Known begins and ends of a gene as sorted arrays, with the span (first begin, last end) of the gene
+    """
+    begins = np.array(sorted(begins), dtype=np.int64)
+    ends = np.array(sorted(ends), dtype=np.int64)
+    return {
+        "begin": begins,
+        "end"  : ends,
+        "span" : (int(begins[0]), int(ends[-1])),
+    }
+
+
+def nearest_site_diff(sites, pos: int) -> int:
+    """
+    :param sites: sorted array of sites
+    :return: pos minus the nearest site, the upstream (lower) site wins ties
+    """
+    i = int(np.searchsorted(sites, pos))
+    if i == 0:
+        return pos - int(sites[0])
+    elif i == len(sites):
+        return pos - int(sites[-1])
+    a, b = pos - int(sites[i - 1]), pos - int(sites[i])
+    return a if abs(a) <= abs(b) else b
+
+
+def nearest_gene_sites_diff(start_ends_by_gene, genes, txStart: int, txEnd: int):
+    """
+    :param start_ends_by_gene: dict of gene --> gene_sites(), see reference_parser
+    :return: txStart minus the nearest begin and txEnd minus the nearest end of the
+        genes, inf if there are no genes; on ties the first gene in genes wins
+    """
+    nearest_start_diff, nearest_end_diff = float("inf"), float("inf")
+    for ref_gene in genes:
+        d = nearest_site_diff(start_ends_by_gene[ref_gene]["begin"], txStart)
+        if abs(d) < abs(nearest_start_diff):
+            nearest_start_diff = d
+        d = nearest_site_diff(start_ends_by_gene[ref_gene]["end"], txEnd)
+        if abs(d) < abs(nearest_end_diff):
+            nearest_end_diff = d
+    return nearest_start_diff, nearest_end_diff
+
+
+def sort_genes_by_start(genes: List[str], start_ends_by_gene) -> None:
+    """
+    Sort genes in place by their first known begin, genes starting together keep their order
+    """
+    genes.sort(key=lambda x: start_ends_by_gene[x]["span"][0])
+
+
 def transcriptsKnownSpliceSites(
-    refs_1exon_by_chr, refs_exons_by_chr, start_ends_by_gene, trec, genome_dict, nPolyA
+    refs_1exon_by_chr,
+    refs_exons_by_chr,
+    start_ends_by_gene,
+    junctions_by_chr,
+    trec,
+    downTTS,
+    known_chains: bool = True,
 ):
     """
     :param refs_1exon_by_chr: dict of single exon references (chr -> IntervalTree)
     :param refs_exons_by_chr: dict of multi exon references (chr -> IntervalTree)
+    :param junctions_by_chr: dict of chr -> junction information, see reference_parser
     :param trec: id record (genePredRecord) to be compared against reference
-    :param genome_dict: dict of genome (chrom --> SeqRecord)
-    :param nPolyA: window size to look for polyA
+    :param downTTS: (percent A, sequence, leading A run length) downstream of the TTS, see batch_intrapriming
+    :param known_chains: try the FSM/ISM fast path on the hashed reference intron chains
+        first, False always uses the full scoring
     :return: myQueryTranscripts object that indicates the best reference hit
     """
+    from cupcake.cupcake.tofu.compare_junctions import compare_junctions
 
     def calc_overlap(s1, e1, s2, e2):
         if s1 == "NA" or s2 == "NA":
@@ -1119,14 +1295,8 @@ def gene_overlap(ref1, ref2):
         if ref1 == ref2:
             return True  # same gene, diff isoforms
         # return True if the two reference genes overlap
-        s1, e1 = (
-            min(start_ends_by_gene[ref1]["begin"]),
-            max(start_ends_by_gene[ref1]["end"]),
-        )
-        s2, e2 = (
-            min(start_ends_by_gene[ref2]["begin"]),
-            max(start_ends_by_gene[ref2]["end"]),
-        )
+        s1, e1 = start_ends_by_gene[ref1]["span"]
+        s2, e2 = start_ends_by_gene[ref2]["span"]
         if s1 <= s2:
             return e1 <= s2
         else:
@@ -1168,16 +1338,9 @@ def get_diff_tss_tts(trec, ref):
     def get_gene_diff_tss_tts(isoform_hit):
         # now that we know the reference (isoform) it hits
         # add the nearest start/end site for that gene (all isoforms of the gene)
-        nearest_start_diff, nearest_end_diff = float("inf"), float("inf")
-        for ref_gene in isoform_hit.genes:
-            for x in start_ends_by_gene[ref_gene]["begin"]:
-                d = trec.txStart - x
-                if abs(d) < abs(nearest_start_diff):
-                    nearest_start_diff = d
-            for x in start_ends_by_gene[ref_gene]["end"]:
-                d = trec.txEnd - x
-                if abs(d) < abs(nearest_end_diff):
-                    nearest_end_diff = d
+        nearest_start_diff, nearest_end_diff = nearest_gene_sites_diff(
+            start_ends_by_gene, isoform_hit.genes, trec.txStart, trec.txEnd
+        )
 
         if trec.strand == "+":
             isoform_hit.tss_gene_diff = (
@@ -1203,12 +1366,9 @@ def categorize_incomplete_matches(trec, ref):
         internal_fragment --- all junctions agree but trec has less 5' and 3' exons
         """
         # check intron retention
-        ref_exon_tree = IntervalTree()
-        for i, e in enumerate(ref.exons):
-            ref_exon_tree.insert(e.start, e.end, i)
         for e in trec.exons:
             if (
-                len(ref_exon_tree.find(e.start, e.end)) > 1
+                ref.count_exon_overlaps(e.start, e.end) > 1
             ):  # multiple ref exons covered
                 return "intron_retention"
 
@@ -1225,21 +1385,83 @@ def categorize_incomplete_matches(trec, ref):
             else:
                 return "internal_fragment"
 
-    # Transcript information for a single query id and comparison with reference.
+    def contains_chain(ref):
+        # True if the query junctions appear consecutively in the (sorted) ref junctions
+        i = bisect.bisect_left(ref.junctions, trec.junctions[0])
+        return ref.junctions[i : i + len(trec.junctions)] == trec.junctions
 
-    # Intra-priming: calculate percentage of "A"s right after the end
-    if trec.strand == "+":
-        pos_TTS = trec.exonEnds[-1]
-        seq_downTTS = str(
-            genome_dict[trec.chrom].seq[pos_TTS : pos_TTS + nPolyA]
-        ).upper()
-    else:  # id on - strand
-        pos_TTS = trec.exonStarts[0]
-        seq_downTTS = str(
-            genome_dict[trec.chrom].seq[pos_TTS - nPolyA : pos_TTS].reverse_complement()
-        ).upper()
+    def match_known_chain(refs):
+        """
+        Fast path for a multi-exon query whose overlapping references all belong to one gene
+        and are on the same strand. The FSM hit (same intron chain) is found by hashing the
+        query chain, the ISM hit by comparing only references containing the query chain.
+        Picks the same reference as the full scoring: the first one with the smallest tss/tts diff.
+        :return: myQueryTranscripts, or None if neither FSM nor ISM (needs full scoring)
+        """
+        exact_refs = (
+            junctions_by_chr[trec.chrom]["chains"].get(
+                (trec.strand, tuple(trec.junctions)), ()
+            )
+            if trec.chrom in junctions_by_chr
+            else ()
+        )
+        str_class = "full-splice_match"
+        candidates = [ref for ref in refs if ref in exact_refs]
+        if len(candidates) == 0:
+            str_class = "incomplete-splice_match"
+            candidates = [
+                ref
+                for ref in refs
+                if ref.exonCount > 1
+                and contains_chain(ref)
+                and compare_junctions(
+                    trec,
+                    ref,
+                    internal_fuzzy_max_dist=0,
+                    max_5_diff=999999,
+                    max_3_diff=999999,
+                )
+                == "subset"
+            ]
+        if len(candidates) == 0:
+            return None
+
+        best_ref, best_diff = None, None
+        for ref in candidates:
+            diff_tss, diff_tts = get_diff_tss_tts(trec, ref)
+            if best_ref is None or abs(diff_tss) + abs(diff_tts) < best_diff:
+                best_ref, best_diff = ref, abs(diff_tss) + abs(diff_tts)
+                best_tss, best_tts = diff_tss, diff_tts
+        ref = best_ref
+        return myQueryTranscripts(
+            trec.id,
+            best_tss,
+            best_tts,
+            trec.exonCount,
+            trec.length,
+            str_class=str_class,
+            subtype="multi-exon"
+            if str_class == "full-splice_match"
+            else categorize_incomplete_matches(trec, ref),
+            chrom=trec.chrom,
+            strand=trec.strand,
+            genes=[ref.gene],
+            transcripts=[ref.id],
+            refLen=ref.length,
+            refExons=ref.exonCount,
+            refStart=ref.txStart,
+            refEnd=ref.txEnd,
+            q_splicesite_hit=calc_splicesite_agreement(trec.exons, ref.exons),
+            q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
+            percAdownTTS=str(percA),
+            seqAdownTTS=seq_downTTS,
+            runAdownTTS=runA_downTTS,
+        )
 
-    percA = float(seq_downTTS.count("A")) / nPolyA * 100
+    # Transcript information for a single query id and comparison with reference.
+
+    # Intra-priming: percentage of "A"s right after the end, computed for the whole chromosome
+    percA, seq_downTTS, runA_downTTS = downTTS
 
     isoform_hit = myQueryTranscripts(
         id=trec.id,
@@ -1253,6 +1475,7 @@ def categorize_incomplete_matches(trec, ref):
         subtype="no_subcategory",
         percAdownTTS=str(percA),
         seqAdownTTS=seq_downTTS,
+        runAdownTTS=runA_downTTS,
     )
 
     # SPLICED TRANSCRIPTS
@@ -1282,6 +1505,15 @@ def categorize_incomplete_matches(trec, ref):
         if len(hits_by_gene) == 0:
             return isoform_hit
 
+        # most isoforms hit a single gene on their own strand: try FSM/ISM directly
+        if known_chains and len(hits_by_gene) == 1:
+            refs = next(iter(hits_by_gene.values()))
+            if all(ref.strand == trec.strand for ref in refs):
+                known_chain_hit = match_known_chain(refs)
+                if known_chain_hit is not None:
+                    get_gene_diff_tss_tts(known_chain_hit)
+                    return known_chain_hit
+
         for ref_gene in hits_by_gene:
             isoform_hit = myQueryTranscripts(
                 id=trec.id,
@@ -1295,6 +1527,7 @@ def categorize_incomplete_matches(trec, ref):
                 subtype="no_subcategory",
                 percAdownTTS=str(percA),
                 seqAdownTTS=seq_downTTS,
+                runAdownTTS=runA_downTTS,
             )
 
             for ref in hits_by_gene[ref_gene]:
@@ -1331,6 +1564,7 @@ def categorize_incomplete_matches(trec, ref):
                             q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
                             percAdownTTS=str(percA),
                             seqAdownTTS=seq_downTTS,
+                            runAdownTTS=runA_downTTS,
                         )
 
                 else:  # multi-exonic reference
@@ -1390,6 +1624,7 @@ def categorize_incomplete_matches(trec, ref):
                                 q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
                                 percAdownTTS=str(percA),
                                 seqAdownTTS=seq_downTTS,
+                                runAdownTTS=runA_downTTS,
                             )
                     # #######################################################
                     # SQANTI's incomplete-splice_match
@@ -1429,6 +1664,7 @@ def categorize_incomplete_matches(trec, ref):
                                 q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
                                 percAdownTTS=str(percA),
                                 seqAdownTTS=seq_downTTS,
+                                runAdownTTS=runA_downTTS,
                             )
                     # #######################################################
                     # Some kind of junction match that isn't ISM/FSM
@@ -1478,6 +1714,7 @@ def categorize_incomplete_matches(trec, ref):
                                 q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
                                 percAdownTTS=str(percA),
                                 seqAdownTTS=seq_downTTS,
+                                runAdownTTS=runA_downTTS,
                             )
                     else:  # must be nomatch
                         assert match_type == "nomatch"
@@ -1510,6 +1747,7 @@ def categorize_incomplete_matches(trec, ref):
                                 q_exon_overlap=calc_exon_overlap(trec.exons, ref.exons),
                                 percAdownTTS=str(percA),
                                 seqAdownTTS=seq_downTTS,
+                                runAdownTTS=runA_downTTS,
                             )
 
                         if (
@@ -1544,6 +1782,7 @@ def categorize_incomplete_matches(trec, ref):
                                     ),
                                     percAdownTTS=str(percA),
                                     seqAdownTTS=seq_downTTS,
+                                    runAdownTTS=runA_downTTS,
                                 )
 
             best_by_gene[ref_gene] = isoform_hit
@@ -1623,6 +1862,7 @@ def categorize_incomplete_matches(trec, ref):
                         refExons=ref.exonCount,
                         percAdownTTS=str(percA),
                         seqAdownTTS=seq_downTTS,
+                        runAdownTTS=runA_downTTS,
                     )
                 elif abs(diff_tss) + abs(diff_tts) < isoform_hit.get_total_diff():
                     isoform_hit.modify(
@@ -1682,7 +1922,7 @@ def categorize_incomplete_matches(trec, ref):
                 isoform_hit.genes.append(ref.gene)
 
     get_gene_diff_tss_tts(isoform_hit)
-    isoform_hit.genes.sort(key=lambda x: start_ends_by_gene[x]["begin"])
+    sort_genes_by_start(isoform_hit.genes, start_ends_by_gene)
     return isoform_hit
 
 
@@ -1695,19 +1935,11 @@ def novelIsoformsKnownGenes(
     """
 
     def has_intron_retention():
-        for e in trec.exons:
-            m = bisect.bisect_left(
-                junctions_by_chr[trec.chrom]["da_pairs"], (e.start, e.end)
-            )
-            if (
-                m < len(junctions_by_chr[trec.chrom]["da_pairs"])
-                and e.start
-                <= junctions_by_chr[trec.chrom]["da_pairs"][m][0]
-                < junctions_by_chr[trec.chrom]["da_pairs"][m][1]
-                < e.end
-            ):
-                return True
-        return False
+        # a known intron lies inside one of the query exons
+        if trec.chrom not in junctions_by_chr:
+            return False
+        introns = junctions_by_chr[trec.chrom]["introns"]
+        return any(introns.any_within(e.start, e.end) for e in trec.exons)
 
     ref_genes = list(set(isoforms_hit.genes))
 
@@ -1745,23 +1977,23 @@ def has_intron_retention():
             isoforms_hit.str_class = "novel_not_in_catalog"
             isoforms_hit.subtype = "at_least_one_novel_splicesite"
     else:  # see if it is fusion
-        # list of a ref junctions from all genes, including potential shared junctions
+        # junction --> ref genes that have it, including potential shared junctions
         # NOTE: some ref genes could be mono-exonic so no junctions
-        all_ref_junctions = list(
-            itertools.chain(
-                junctions_by_gene[ref_gene]
-                for ref_gene in ref_genes
-                if ref_gene in junctions_by_gene
-            )
+        genes_by_junction = (
+            junctions_by_chr[trec.chrom]["genes"]
+            if trec.chrom in junctions_by_chr
+            else {}
         )
+        ref_genes_set = set(ref_genes)
 
-        # (junction index) --> number of refs that have this junction
+        # (junction index) --> number of hit ref genes that have this junction
         junction_ref_hit = {
-            i: all_ref_junctions.count(junc) for i, junc in enumerate(trec.junctions)
+            i: len(ref_genes_set.intersection(genes_by_junction.get(junc, ())))
+            for i, junc in enumerate(trec.junctions)
         }
 
         # if the same query junction appears in more than one of the hit references, it is not a fusion
-        if max(junction_ref_hit.values()) > 1:
+        if max(junction_ref_hit.values(), default=0) > 1:
             isoforms_hit.str_class = "moreJunctions"
         else:
             isoforms_hit.str_class = "fusion"
@@ -1793,13 +2025,10 @@ def associationOverlapping(isoforms_hit, trec, junctions_by_chr):
         if len(isoforms_hit.AS_genes) == 0 and trec.chrom in junctions_by_chr:
             # no hit even on opp strand
             # see if it is completely contained within a junction
-            da_pairs = junctions_by_chr[trec.chrom]["da_pairs"]
-            i = bisect.bisect_left(da_pairs, (trec.txStart, trec.txEnd))
-            while i < len(da_pairs) and da_pairs[i][0] <= trec.txStart:
-                if da_pairs[i][0] <= trec.txStart <= trec.txStart <= da_pairs[i][1]:
-                    isoforms_hit.str_class = "genic_intron"
-                    break
-                i += 1
+            if junctions_by_chr[trec.chrom]["introns"].any_containing(
+                trec.txStart, trec.txEnd
+            ):
+                isoforms_hit.str_class = "genic_intron"
         else:
             # hits one or more genes on the opposite strand
             isoforms_hit.str_class = "antisense"
@@ -1819,27 +2048,86 @@ def associationOverlapping(isoforms_hit, trec, junctions_by_chr):
     return isoforms_hit
 
 
+def batch_phyloP_lookup(score_track, chrom, records):
+    """
+    Fetch the phyloP scores around the junctions of all isoforms of one chromosome in one gather
+    :param score_track: BigWigTrack or MemmapTrack
+    :param records: list of genePredRecord on chrom
+    :return: dict of 0-based coord --> phyloP score (as text, "NA" if missing) of the
+             three bases centred on every donor and acceptor
+    """
+    positions = np.unique(
+        np.array(
+            [
+                p
+                for rec in records
+                for d, a in rec.junctions
+                for p in (d - 1, d, d + 1, a - 1, a, a + 1)
+            ],
+            dtype=np.int64,
+        )
+    )
+    scores = score_track.get_many(chrom, positions)
+    return dict(zip(positions.tolist(), (format_score(x) for x in scores)))
+
+
+def batch_splice_sites(
+    genome_arrays: GenomeArrays, chrom: str, records, accepted_canonical_sites: Set[str]
+) -> Dict[str, List[Tuple[str, bool]]]:
+    """
+    Donor-acceptor sites (ex: GTAG) of every junction of all isoforms of one chromosome
+    Same as genePredRecord.get_splice_site, with one gather for the whole chromosome.
+    :param genome_arrays: GenomeArrays of the genome
+    :param records: list of genePredRecord on chrom
+    :param accepted_canonical_sites: set of accepted canonical splice sites
+    :return: dict of isoform id --> list of (splice site, is canonical) per junction
+    """
+    donors, acceptors, minus = [], [], []
+    for rec in records:
+        for d, a in rec.junctions:
+            donors.append(d)
+            acceptors.append(a)
+            minus.append(rec.strand != "+")
+    donors = np.array(donors, dtype=np.int64)
+    acceptors = np.array(acceptors, dtype=np.int64)
+    minus = np.array(minus, dtype=bool)
+
+    seq_d = genome_arrays.windows(chrom, donors, 2)
+    seq_a = genome_arrays.windows(chrom, acceptors - 2, 2)
+    motifs = np.where(
+        minus[:, None],
+        reverse_complement(np.hstack([seq_d, seq_a])),
+        np.hstack([seq_d, seq_a]),
+    )
+    sites = as_strings(to_upper(motifs))
+
+    result, i = {}, 0
+    for rec in records:
+        n = len(rec.junctions)
+        result[rec.id] = [(x, x in accepted_canonical_sites) for x in sites[i : i + n]]
+        i += n
+    return result
+
+
 def write_junctionInfo(
     trec,
     junctions_by_chr,
-    accepted_canonical_sites,
+    splice_sites,
     indelInfo,
-    genome_dict,
     fout,
     covInf=None,
     covNames=None,
-    phyloP_reader=None,
+    phyloP_scores=None,
 ):
     """
     :param trec: query isoform genePredRecord
-    :param junctions_by_chr: dict of chr -> {'donors': <sorted list of donors>, 'acceptors': <sorted list of acceptors>, 'da_pairs': <sorted list of junctions>}
-    :param accepted_canonical_sites: list of accepted canonical splice sites
+    :param junctions_by_chr: dict of chr -> {'donors': <sorted list of donors>, 'acceptors': <sorted list of acceptors>, 'da_pairs': <sorted list of junctions>, 'introns': <IntronIndex of da_pairs>, ...}
+    :param splice_sites: list of (splice site, is canonical) for each junction of trec, see batch_splice_sites
     :param indelInfo: indels near junction information, dict of pbid --> list of junctions near indel (in Interval format)
-    :param genome_dict: genome fasta dict
     :param fout: DictWriter handle
     :param covInf: (optional) junction coverage information, dict of (chrom,strand) -> (0-based start,1-based end) -> dict of {sample -> unique read count}
     :param covNames: (optional) list of sample names for the junction coverage information
-    :param phyloP_reader: (optional) dict of (chrom,0-based coord) --> phyloP score
+    :param phyloP_scores: (optional) dict of 0-based coord on trec.chrom --> phyloP score, see batch_phyloP_lookup
 
     Write a record for each junction in query isoform
     """
@@ -1869,7 +2157,7 @@ def find_closest_in_list(lst, pos):
         # find the closest junction end site
         min_diff_e = find_closest_in_list(junctions_by_chr[trec.chrom]["acceptors"], a)
 
-        splice_site = trec.get_splice_site(genome_dict, junction_index)
+        splice_site, is_canonical = splice_sites[junction_index]
 
         indel_near_junction = "NA"
         if indelInfo is not None:
@@ -1885,27 +2173,9 @@ def find_closest_in_list(lst, pos):
 
         # if phyloP score dict exists, give the triplet score of (last base in donor exon), donor site -- similarly for acceptor
         phyloP_start, phyloP_end = "NA", "NA"
-        if phyloP_reader is not None:
-            phyloP_start = ",".join(
-                [
-                    str(x)
-                    for x in [
-                        phyloP_reader.get_pos(trec.chrom, d - 1),
-                        phyloP_reader.get_pos(trec.chrom, d),
-                        phyloP_reader.get_pos(trec.chrom, d + 1),
-                    ]
-                ]
-            )
-            phyloP_end = ",".join(
-                [
-                    str(x)
-                    for x in [
-                        phyloP_reader.get_pos(trec.chrom, a - 1),
-                        phyloP_reader.get_pos(trec.chrom, a),
-                        phyloP_reader.get_pos(trec.chrom, a + 1),
-                    ]
-                ]
-            )
+        if phyloP_scores is not None:
+            phyloP_start = ",".join(phyloP_scores[p] for p in (d - 1, d, d + 1))
+            phyloP_end = ",".join(phyloP_scores[p] for p in (a - 1, a, a + 1))
 
         qj = {
             "isoform": trec.id,
@@ -1929,9 +2199,7 @@ def find_closest_in_list(lst, pos):
             )
             else "FALSE",
             "splice_site": splice_site,
-            "canonical": "canonical"
-            if splice_site in accepted_canonical_sites
-            else "non_canonical",
+            "canonical": "canonical" if is_canonical else "non_canonical",
             "RTS_junction": "????",  # First write ???? in _tmp, later is TRUE/FALSE
             "indel_near_junct": indel_near_junction,
             "phyloP_start": phyloP_start,
@@ -1949,6 +2217,8 @@ def find_closest_in_list(lst, pos):
         fout.writerow(qj)
 
 def get_fusion_component(fusion_gtf):
+    from cupcake.sequence.GFF import collapseGFFReader
+
     components = defaultdict(lambda: {})
     for r in collapseGFFReader(fusion_gtf):
         m = seqid_fusion.match(r.seqid)
@@ -1985,9 +2255,18 @@ def isoformClassification(
     orfDict,
     outputClassPath,
     outputJuncPath,
+    fusion_components=None,
+    latency=None,
 ):
+    """
+    :param fusion_components: (only for fusion input) dict of PBfusion isoform --> (start, end) of the
+                              component in the fused transcript, see get_fusion_component()
+    :param latency: (optional) IsoformLatency collecting the classification time of every isoform
+                    (the per-chromosome batch lookups are not included)
+    """
     logger = logging.getLogger("sqanti3_qc")
 
+    is_fusion = fusion_components is not None
     novel_gene_prefix = None
     if coverage is not None:
         logger.info("Reading Splice Junctions coverage files.")
@@ -2023,15 +2302,18 @@ def isoformClassification(
         polyA_motifs = None
 
     if phyloP_bed is not None:
-        logger.info("Reading PhyloP BED file.")
-        phyloP_reader = LazyBEDPointReader(phyloP_bed)
+        logger.info("Reading PhyloP score track.")
+        phyloP_reader = open_score_track(phyloP_bed)
     else:
         phyloP_reader = None
 
+    # sequence windows are sliced from byte arrays of the current chromosome
+    genome_arrays = GenomeArrays(genome_dict)
+
     # running classification
     logger.info("Performing Classification of Isoforms....")
 
-    accepted_canonical_sites = list(sites.split(","))
+    accepted_canonical_sites = set(sites.split(","))
 
     handle_class = open(f"{outputClassPath}_tmp", "w")
     fout_class = DictWriter(handle_class, fieldnames=FIELDS_CLASS, delimiter="\t")
@@ -2046,15 +2328,38 @@ def isoformClassification(
     novel_gene_index = 1
 
     for chrom, records in isoforms_by_chr.items():
+        # peak lookups are resolved for the whole chromosome in one sorted pass
+        if cage_peak_obj is not None:
+            cage_hits = batch_peak_lookup(cage_peak_obj, records)
+        if polya_peak_obj is not None:
+            polya_hits = batch_peak_lookup(polya_peak_obj, records)
+        if polyA_motifs is not None:
+            polyA_motif_hits = batch_polyA_motif_lookup(
+                genome_arrays, chrom, records, polyA_motifs
+            )
+        # so are the phyloP scores around every junction
+        phyloP_scores = (
+            batch_phyloP_lookup(phyloP_reader, chrom, records)
+            if phyloP_reader is not None
+            else None
+        )
+
+        downTTS = batch_intrapriming(genome_arrays, chrom, records, nPolyA=window)
+        splice_sites = batch_splice_sites(
+            genome_arrays, chrom, records, accepted_canonical_sites
+        )
+
         for rec in records:
+            if latency is not None:
+                rec_start = timeit.default_timer()
             # Find best reference hit
             isoform_hit = transcriptsKnownSpliceSites(
                 refs_1exon_by_chr,
                 refs_exons_by_chr,
                 start_ends_by_gene,
+                junctions_by_chr,
                 rec,
-                genome_dict,
-                nPolyA=window,
+                downTTS[rec.id],
             )
 
             if isoform_hit.str_class in ("anyKnownJunction", "anyKnownSpliceSite"):
@@ -2074,13 +2379,12 @@ def isoformClassification(
             write_junctionInfo(
                 rec,
                 junctions_by_chr,
-                accepted_canonical_sites,
+                splice_sites[rec.id],
                 indelsJunc,
-                genome_dict,
                 fout_junc,
                 covInf=SJcovInfo,
                 covNames=SJcovNames,
-                phyloP_reader=phyloP_reader,
+                phyloP_scores=phyloP_scores,
             )
 
             if isoform_hit.str_class in ("intergenic", "genic_intron"):
@@ -2098,46 +2402,19 @@ def isoformClassification(
 
             # look at Cage Peak info (if available)
             if cage_peak_obj is not None:
-                if rec.strand == "+":
-                    within_cage, dist_cage = cage_peak_obj.find(
-                        rec.chrom, rec.strand, rec.txStart
-                    )
-                else:
-                    within_cage, dist_cage = cage_peak_obj.find(
-                        rec.chrom, rec.strand, rec.txEnd
-                    )
+                within_cage, dist_cage = cage_hits[rec.id]
                 isoform_hit.within_cage = within_cage
                 isoform_hit.dist_cage = dist_cage
 
             # look at PolyA Peak info (if available)
             if polya_peak_obj is not None:
-                if rec.strand == "+":
-                    within_polya_site, dist_polya_site = polya_peak_obj.find(
-                        rec.chrom, rec.strand, rec.txStart
-                    )
-                else:
-                    within_polya_site, dist_polya_site = polya_peak_obj.find(
-                        rec.chrom, rec.strand, rec.txEnd
-                    )
+                within_polya_site, dist_polya_site = polya_hits[rec.id]
                 isoform_hit.within_polya_site = within_polya_site
                 isoform_hit.dist_polya_site   = dist_polya_site
 
             # polyA motif finding: look within 50 bp upstream of 3' end for the highest ranking polyA motif signal (user provided)
             if polyA_motifs is not None:
-                if rec.strand == "+":
-                    polyA_motif, polyA_dist = find_polyA_motif(
-                        str(genome_dict[rec.chrom][rec.txEnd - 50 : rec.txEnd].seq),
-                        polyA_motifs,
-                    )
-                else:
-                    polyA_motif, polyA_dist = find_polyA_motif(
-                        str(
-                            genome_dict[rec.chrom][rec.txStart : rec.txStart + 50]
-                            .reverse_complement()
-                            .seq
-                        ),
-                        polyA_motifs,
-                    )
+                polyA_motif, polyA_dist = polyA_motif_hits[rec.id]
                 isoform_hit.polyA_motif = polyA_motif
                 isoform_hit.polyA_dist = polyA_dist
 
@@ -2145,7 +2422,7 @@ def isoformClassification(
             if is_fusion:
                 # pdb.set_trace()
                 # fusion - special case handling, need to see which part of the ORF this segment falls on
-                fusion_gene = f"PBfusion.{str(seqid_fusion.match(rec.id).group(1))}""
+                fusion_gene = f"PBfusion.{str(seqid_fusion.match(rec.id).group(1))}"
                 rec_component_start, rec_component_end = fusion_components[rec.id]
                 rec_len = rec_component_end - rec_component_start + 1
                 if fusion_gene in orfDict:
@@ -2245,23 +2522,95 @@ def isoformClassification(
 
             isoforms_info[rec.id] = isoform_hit
             fout_class.writerow(isoform_hit.as_dict())
+            if latency is not None:
+                latency.add(
+                    rec.id,
+                    chrom,
+                    isoform_hit.str_class,
+                    rec.exonCount,
+                    timeit.default_timer() - rec_start,
+                )
 
     handle_class.close()
     handle_junc.close()
     return isoforms_info
 
 
-def find_polyA_motif(genome_seq: str, polyA_motif_list: List[str]) -> Tuple[str, str]:
+def batch_intrapriming(
+    genome_arrays: GenomeArrays, chrom: str, records, nPolyA: int
+) -> Dict[str, Tuple[float, str, int]]:
+    """
+    Intra-priming evidence right after the 3' end of all isoforms of one chromosome
+    :param genome_arrays: GenomeArrays of the genome
+    :param records: list of genePredRecord on chrom
+    :param nPolyA: window size to look for polyA
+    :return: dict of isoform id --> (percentage of "A"s, upper-cased sequence, length of the
+             leading run of "A"s), sequence oriented by strand
+    """
+    minus = np.array([r.strand != "+" for r in records], dtype=bool)
+    starts = np.array(
+        [r.exonStarts[0] - nPolyA if r.strand != "+" else r.exonEnds[-1] for r in records],
+        dtype=np.int64,
+    )
+    windows = to_upper(genome_arrays.windows(chrom, starts, nPolyA, reverse=minus))
+    # a window that would start before the chromosome is an empty slice
+    windows[starts < 0] = PAD
+
+    is_A = windows == ord("A")
+    percA = is_A.sum(axis=1) / nPolyA * 100
+    # leading run of "A"s, skipping the padding put in front of reversed windows
+    cols = np.arange(nPolyA)
+    first_base = (windows != PAD).argmax(axis=1)
+    first_not_A = np.where(
+        ~is_A & (cols >= first_base[:, None]), cols, nPolyA
+    ).min(axis=1)
+    runA = first_not_A - first_base
+
+    return {
+        rec.id: (p, seq, r)
+        for rec, p, seq, r in zip(
+            records, percA.tolist(), as_strings(windows), runA.tolist()
+        )
+    }
+
+
+POLYA_MOTIF_WINDOW = 50
+
+
+def batch_polyA_motif_lookup(
+    genome_arrays: GenomeArrays,
+    chrom: str,
+    records,
+    polyA_motif_list: List[str],
+    window: int = POLYA_MOTIF_WINDOW,
+) -> Dict[str, Tuple[str, str]]:
     """
-    :param genome_seq: genomic sequence to search polyA motifs from, must already be oriented
+    Search the top ranking polyA motif upstream of the 3' end of all isoforms of one chromosome
+    :param genome_arrays: GenomeArrays of the genome
+    :param records: list of genePredRecord on chrom
     :param polyA_motif_list: ranked list of motifs to find, report the top one found
-    :return: polyA_motif, polyA_dist (how many bases upstream is this found)
+    :param window: how many bases upstream of the 3' end to search, oriented by strand
+    :return: dict of isoform id --> (polyA_motif, polyA_dist (how many bases upstream is this found))
+             or ("NA", "NA") if none of the motifs is found
     """
-    for motif in polyA_motif_list:
-        i = genome_seq.find(motif)
-        if i >= 0:
-            return motif, -(len(genome_seq) - i - len(motif) + 1)
-    return "NA", "NA"
+    minus = np.array([r.strand != "+" for r in records], dtype=bool)
+    starts = np.array(
+        [r.txStart if r.strand != "+" else r.txEnd - window for r in records],
+        dtype=np.int64,
+    )
+    windows = genome_arrays.windows(chrom, starts, window, reverse=minus)
+    best, pos = find_motifs(windows, polyA_motif_list)
+    # a window that would start before the chromosome is an empty slice
+    best[starts < 0] = -1
+
+    result = {}
+    for rec, i, p in zip(records, best.tolist(), pos.tolist()):
+        if i < 0:
+            result[rec.id] = ("NA", "NA")
+        else:
+            motif = polyA_motif_list[i]
+            result[rec.id] = (motif, -(window - p - len(motif) + 1))
+    return result
 
 
 def FLcount_parser(fl_count_filename: str) -> Tuple[Sequence[str], Dict[str, int]]:
@@ -2380,17 +2729,37 @@ def sqanti3_qc(
     skip_report     : bool,
     isoAnnotLite    : bool,
     doc             : str,
-    gff3            : Optional[str] = None,
+    gff3            : Optional[str]   = None,
+    profile         : bool            = False,
+    genome_dict     : Optional[Dict]  = None,
+    reference       : Optional[Tuple] = None,
 ) -> None:
+    """
+    Run the QC of one set of isoforms
+    :param genome_dict: (optional) dict of chrom --> SeqRecord of `genome`, read from `genome` if None
+    :param reference: (optional) output of reference_parser() for `annotation`, parsed if None
+    """
+    from Bio import SeqIO
+    from sqanti3.utilities import IsoAnnotLite_SQ1
+    from sqanti3.utilities.indels_annot import calc_indels_from_sam
+    from sqanti3.utilities.rt_switching import rts
+
     logger = logging.getLogger("sqanti3_qc")
     start3 = timeit.default_timer()
     outputClassPath, outputJuncPath = get_class_junc_filenames(output, directory)
     corrGTF, corrSAM, corrFASTA, corrORF = get_corr_filenames(output, directory)
+    # per-stage timings and memory, written next to the params file
+    profiler = StageProfiler(os.path.join(directory, output), cprofile=profile)
 
     logger.info("Parsing provided files...")
-    logger.info(f"Reading genome fasta {genome}...")
-    # NOTE: can't use LazyFastaReader because inefficient. Bring the whole genome in!
-    genome_dict = {r.name: r for r in SeqIO.parse(open(genome), "fasta")}
+    with profiler.stage("genome_load") as record:
+        if genome_dict is None:
+            logger.info(f"Reading genome fasta {genome}...")
+            # NOTE: can't use LazyFastaReader because inefficient. Bring the whole genome in!
+            genome_dict = {r.name: r for r in SeqIO.parse(open(genome), "fasta")}
+        else:
+            logger.info(f"Using preloaded genome {genome}.")
+        record["records"] = len(genome_dict)
 
     # correction of sequences and ORF prediction (if gtf provided instead of fasta file, correction of sequences will be skipped)
     orfDict = correctionPlusORFpred(
@@ -2407,57 +2776,73 @@ def sqanti3_qc(
         genome_dict,
         genome,
         gmap_index,
+        profiler=profiler,
     )
 
-    # parse reference id (GTF) to dicts
-    (
-        refs_1exon_by_chr,
-        refs_exons_by_chr,
-        junctions_by_chr,
-        junctions_by_gene,
-        start_ends_by_gene,
-    ) = reference_parser(
-        directory     = directory,
-        output        = output,
-        genename      = genename,
-        annotation    = annotation,
-        min_ref_len   = min_ref_len,
-        genome_chroms = list(genome_dict.keys()),
-    )
+    with profiler.stage("reference_parse") as record:
+        # parse reference id (GTF) to dicts
+        if reference is None:
+            reference = reference_parser(
+                directory     = directory,
+                output        = output,
+                genename      = genename,
+                annotation    = annotation,
+                min_ref_len   = min_ref_len,
+                genome_chroms = list(genome_dict.keys()),
+                is_fusion     = is_fusion,
+            )
+        else:
+            logger.info(f"Using preloaded reference {annotation}.")
+        (
+            refs_1exon_by_chr,
+            refs_exons_by_chr,
+            junctions_by_chr,
+            junctions_by_gene,
+            start_ends_by_gene,
+        ) = reference
+        record["records"] = len(start_ends_by_gene)
 
     # parse query isoforms
-    isoforms_by_chr, queryFile = isoforms_parser(corrGTF)
+    with profiler.stage("isoform_parse") as record:
+        isoforms_by_chr, queryFile = isoforms_parser(corrGTF)
+        record["records"] = sum(len(v) for v in isoforms_by_chr.values())
 
     # Run indel computation if sam exists
     # indelsJunc: dict of pbid --> list of junctions near indel (in Interval format)
     # indelsTotal: dict of pbid --> total indels count
-    if os.path.exists(corrSAM):
-        (indelsJunc, indelsTotal) = calc_indels_from_sam(corrSAM)
-    else:
-        indelsJunc = None
-        indelsTotal = None
+    with profiler.stage("indels", hot=True) as record:
+        if os.path.exists(corrSAM):
+            (indelsJunc, indelsTotal) = calc_indels_from_sam(corrSAM)
+            record["records"] = len(indelsTotal)
+        else:
+            indelsJunc = None
+            indelsTotal = None
 
     # isoform classification + intra-priming + id and junction characterization
-    isoforms_info = isoformClassification(
-        coverage,
-        cage_peak,
-        polyA_peak,
-        polyA_motif_list,
-        phyloP_bed,
-        sites,
-        window,
-        isoforms_by_chr,
-        refs_1exon_by_chr,
-        refs_exons_by_chr,
-        junctions_by_chr,
-        junctions_by_gene,
-        start_ends_by_gene,
-        genome_dict,
-        indelsJunc,
-        orfDict,
-        outputClassPath,
-        outputJuncPath,
-    )
+    with profiler.stage("classification", hot=True) as record:
+        isoforms_info = isoformClassification(
+            coverage,
+            cage_peak,
+            polyA_peak,
+            polyA_motif_list,
+            phyloP_bed,
+            sites,
+            window,
+            isoforms_by_chr,
+            refs_1exon_by_chr,
+            refs_exons_by_chr,
+            junctions_by_chr,
+            junctions_by_gene,
+            start_ends_by_gene,
+            genome_dict,
+            indelsJunc,
+            orfDict,
+            outputClassPath,
+            outputJuncPath,
+            fusion_components=get_fusion_component(isoforms) if is_fusion else None,
+            latency=profiler.latency,
+        )
+        record["records"] = len(isoforms_info)
 
     logger.info(f"Number of classified isoforms: {len(isoforms_info)}")
 
@@ -2467,184 +2852,191 @@ def sqanti3_qc(
     # RT-switching computation
     logger.info("RT-switching computation....")
 
-    # RTS_info: dict of (pbid) -> list of RT junction. if RTS_info[pbid] == [], means all junctions are non-RT.
-    RTS_info = rts([f"{outputJuncPath}_tmp", genome, "-a"], genome_dict)
-    for pbid in isoforms_info:
-        if pbid in RTS_info and len(RTS_info[pbid]) > 0:
-            isoforms_info[pbid].RT_switching = "TRUE"
+    with profiler.stage("rts", hot=True) as record:
+        # RTS_info: dict of (pbid) -> list of RT junction. if RTS_info[pbid] == [], means all junctions are non-RT.
+        RTS_info = rts([f"{outputJuncPath}_tmp", genome, "-a"], genome_dict)
+        for pbid in isoforms_info:
+            if pbid in RTS_info and len(RTS_info[pbid]) > 0:
+                isoforms_info[pbid].RT_switching = "TRUE"
+            else:
+                isoforms_info[pbid].RT_switching = "FALSE"
+        record["records"] = len(RTS_info)
+
+    with profiler.stage("aggregation") as record:
+        # FSM classification
+        geneFSM_dict = defaultdict(lambda: [])
+        for iso in isoforms_info:
+            gene = isoforms_info[
+                iso
+            ].geneName()  # if multi-gene, returns "geneA_geneB_geneC..."
+            geneFSM_dict[gene].append(isoforms_info[iso].str_class)
+
+        fields_class_cur = FIELDS_CLASS
+        # FL count file
+        if fl_count:
+            if not os.path.exists(fl_count):
+                logger.error(f"FL count file {fl_count} does not exist!")
+                sys.exit(-1)
+            logger.info("Reading Full-length read abundance files...")
+            fl_samples, fl_count_dict = FLcount_parser(fl_count)
+            for pbid in fl_count_dict:
+                if pbid not in isoforms_info:
+                    logger.warning(f"{pbid} found in FL count file but not in input fasta.")
+            if len(fl_samples) == 1:  # single sample from PacBio
+                logger.info("Single-sample PacBio FL count format detected.")
+                for iso in isoforms_info:
+                    if iso in fl_count_dict:
+                        isoforms_info[iso].FL = fl_count_dict[iso]
+                    else:
+                        logger.warning(
+                            f"{iso} not found in FL count file. Assign count as 0."
+                        )
+                        isoforms_info[iso].FL = 0
+            else:  # multi-sample
+                logger.info("Multi-sample PacBio FL count format detected.")
+                fields_class_cur = FIELDS_CLASS + ["FL." + s for s in fl_samples]
+                for iso in isoforms_info:
+                    if iso in fl_count_dict:
+                        isoforms_info[iso].FL_dict = fl_count_dict[iso]
+                    else:
+                        logger.warning(
+                            f"{iso} not found in FL count file. Assign count as 0."
+                        )
+                        isoforms_info[iso].FL_dict = defaultdict(lambda: 0)
         else:
-            isoforms_info[pbid].RT_switching = "FALSE"
-
-    # FSM classification
-    geneFSM_dict = defaultdict(lambda: [])
-    for iso in isoforms_info:
-        gene = isoforms_info[
-            iso
-        ].geneName()  # if multi-gene, returns "geneA_geneB_geneC..."
-        geneFSM_dict[gene].append(isoforms_info[iso].str_class)
-
-    fields_class_cur = FIELDS_CLASS
-    # FL count file
-    if fl_count:
-        if not os.path.exists(fl_count):
-            logger.error(f"FL count file {fl_count} does not exist!")
-            sys.exit(-1)
-        logger.info("Reading Full-length read abundance files...")
-        fl_samples, fl_count_dict = FLcount_parser(fl_count)
-        for pbid in fl_count_dict:
-            if pbid not in isoforms_info:
-                logger.warning(f"{pbid} found in FL count file but not in input fasta.")
-        if len(fl_samples) == 1:  # single sample from PacBio
-            logger.info("Single-sample PacBio FL count format detected.")
+            logger.info("Full-length read abundance files not provided.")
+
+        # Isoform expression information
+        if expression:
+            logger.info("Reading Isoform Expression Information.")
+            exp_dict = expression_parser(expression)
+            gene_exp_dict = {}
             for iso in isoforms_info:
-                if iso in fl_count_dict:
-                    isoforms_info[iso].FL = fl_count_dict[iso]
-                else:
+                if iso not in exp_dict:
+                    exp_dict[iso] = 0
                     logger.warning(
-                        f"{iso} not found in FL count file. Assign count as 0."
+                        f"isoform {iso} not found in expression matrix. Assigning TPM of 0."
                     )
-                    isoforms_info[iso].FL = 0
-        else:  # multi-sample
-            logger.info("Multi-sample PacBio FL count format detected.")
-            fields_class_cur = FIELDS_CLASS + ["FL." + s for s in fl_samples]
-            for iso in isoforms_info:
-                if iso in fl_count_dict:
-                    isoforms_info[iso].FL_dict = fl_count_dict[iso]
+                gene = isoforms_info[iso].geneName()
+                if gene not in gene_exp_dict:
+                    gene_exp_dict[gene] = exp_dict[iso]
                 else:
-                    logger.warning(
-                        f"{iso} not found in FL count file. Assign count as 0."
-                    )
-                    isoforms_info[iso].FL_dict = defaultdict(lambda: 0)
-    else:
-        logger.info("Full-length read abundance files not provided.")
+                    gene_exp_dict[gene] = gene_exp_dict[gene] + exp_dict[iso]
+        else:
+            exp_dict = None
+            gene_exp_dict = None
+            logger.info("Isoforms expression files not provided.")
 
-    # Isoform expression information
-    if expression:
-        logger.info("Reading Isoform Expression Information.")
-        exp_dict = expression_parser(expression)
-        gene_exp_dict = {}
+        # Adding indel, FSM class and expression information
         for iso in isoforms_info:
-            if iso not in exp_dict:
-                exp_dict[iso] = 0
-                logger.warning(
-                    f"isoform {iso} not found in expression matrix. Assigning TPM of 0."
-                )
             gene = isoforms_info[iso].geneName()
-            if gene not in gene_exp_dict:
-                gene_exp_dict[gene] = exp_dict[iso]
+            if exp_dict is not None and gene_exp_dict is not None:
+                isoforms_info[iso].geneExp = gene_exp_dict[gene]
+                isoforms_info[iso].isoExp = exp_dict[iso]
+            if len(geneFSM_dict[gene]) == 1:
+                isoforms_info[iso].FSM_class = "A"
+            elif "full-splice_match" in geneFSM_dict[gene]:
+                isoforms_info[iso].FSM_class = "C"
             else:
-                gene_exp_dict[gene] = gene_exp_dict[gene] + exp_dict[iso]
-    else:
-        exp_dict = None
-        gene_exp_dict = None
-        logger.info("Isoforms expression files not provided.")
-
-    # Adding indel, FSM class and expression information
-    for iso in isoforms_info:
-        gene = isoforms_info[iso].geneName()
-        if exp_dict is not None and gene_exp_dict is not None:
-            isoforms_info[iso].geneExp = gene_exp_dict[gene]
-            isoforms_info[iso].isoExp = exp_dict[iso]
-        if len(geneFSM_dict[gene]) == 1:
-            isoforms_info[iso].FSM_class = "A"
-        elif "full-splice_match" in geneFSM_dict[gene]:
-            isoforms_info[iso].FSM_class = "C"
-        else:
-            isoforms_info[iso].FSM_class = "B"
+                isoforms_info[iso].FSM_class = "B"
 
-    if indelsTotal is not None:
-        for iso in isoforms_info:
-            if iso in indelsTotal:
-                isoforms_info[iso].nIndels = indelsTotal[iso]
-            else:
-                isoforms_info[iso].nIndels = 0
-
-    # Read junction files and create attributes per id
-    # Read the junction information to fill in several remaining unfilled fields in classification
-    # (1) "canonical": is "canonical" if all junctions are canonical, otherwise "non_canonical"
-    # (2) "bite": is TRUE if any of the junction "bite_junction" field is TRUE
-
-    reader = DictReader(open(outputJuncPath + "_tmp"), delimiter="\t")
-    fields_junc_cur = reader.fieldnames
-
-    sj_covs_by_isoform = defaultdict(
-        lambda: []
-    )  # pbid --> list of total_cov for each junction so we can calculate SD later
-    for r in reader:
-        # only need to do assignment if:
-        # (1) the .canonical field is still "NA"
-        # (2) the junction is non-canonical
-        assert r["canonical"] in ("canonical", "non_canonical")
-        if (isoforms_info[r["isoform"]].canonical == "NA") or (
-            r["canonical"] == "non_canonical"
-        ):
-            isoforms_info[r["isoform"]].canonical = r["canonical"]
-
-        if (isoforms_info[r["isoform"]].bite == "NA") or (r["bite_junction"] == "TRUE"):
-            isoforms_info[r["isoform"]].bite = r["bite_junction"]
-
-        if r["indel_near_junct"] == "TRUE":
-            if isoforms_info[r["isoform"]].nIndelsJunc == "NA":
-                isoforms_info[r["isoform"]].nIndelsJunc = 0
-            isoforms_info[r["isoform"]].nIndelsJunc += 1
-
-        # min_cov: min( total_cov[j] for each junction j in this isoform )
-        # min_cov_pos: the junction [j] that attributed to argmin(total_cov[j])
-        # min_sample_cov: min( sample_cov[j] for each junction in this isoform )
-        # sd_cov: sd( total_cov[j] for each junction j in this isoform )
-        if r["sample_with_cov"] != "NA":
-            sample_with_cov = int(r["sample_with_cov"])
-            if (isoforms_info[r["isoform"]].min_samp_cov == "NA") or (
-                isoforms_info[r["isoform"]].min_samp_cov > sample_with_cov
-            ):
-                isoforms_info[r["isoform"]].min_samp_cov = sample_with_cov
+        if indelsTotal is not None:
+            for iso in isoforms_info:
+                if iso in indelsTotal:
+                    isoforms_info[iso].nIndels = indelsTotal[iso]
+                else:
+                    isoforms_info[iso].nIndels = 0
+
+        # Read junction files and create attributes per id
+        # Read the junction information to fill in several remaining unfilled fields in classification
+        # (1) "canonical": is "canonical" if all junctions are canonical, otherwise "non_canonical"
+        # (2) "bite": is TRUE if any of the junction "bite_junction" field is TRUE
 
-        if r["total_coverage"] != "NA":
-            total_cov = int(r["total_coverage"])
-            sj_covs_by_isoform[r["isoform"]].append(total_cov)
-            if (isoforms_info[r["isoform"]].min_cov == "NA") or (
-                isoforms_info[r["isoform"]].min_cov > total_cov
+        reader = DictReader(open(outputJuncPath + "_tmp"), delimiter="\t")
+        fields_junc_cur = reader.fieldnames
+
+        sj_covs_by_isoform = defaultdict(
+            lambda: []
+        )  # pbid --> list of total_cov for each junction so we can calculate SD later
+        for r in reader:
+            # only need to do assignment if:
+            # (1) the .canonical field is still "NA"
+            # (2) the junction is non-canonical
+            assert r["canonical"] in ("canonical", "non_canonical")
+            if (isoforms_info[r["isoform"]].canonical == "NA") or (
+                r["canonical"] == "non_canonical"
             ):
-                isoforms_info[r["isoform"]].min_cov = total_cov
-                isoforms_info[r["isoform"]].min_cov_pos = r["junction_number"]
-
-    for pbid, covs in sj_covs_by_isoform.items():
-        isoforms_info[pbid].sd = np.std(covs)
-
-    # Printing output file:
-    logger.info("Writing output files...")
-
-    # sort isoform keys
-    iso_keys = list(isoforms_info.keys())
-    iso_keys.sort(key=lambda x: (isoforms_info[x].chrom, isoforms_info[x].id))
-    with open(outputClassPath, "w") as h:
-        fout_class = DictWriter(h, fieldnames=fields_class_cur, delimiter="\t")
-        fout_class.writeheader()
-        for iso_key in iso_keys:
-            fout_class.writerow(isoforms_info[iso_key].as_dict())
-
-    # Now that RTS info is obtained, we can write the final junctions.txt
-    with open(outputJuncPath, "w") as h:
-        fout_junc = DictWriter(h, fieldnames=fields_junc_cur, delimiter="\t")
-        fout_junc.writeheader()
-        for r in DictReader(open(outputJuncPath + "_tmp"), delimiter="\t"):
-            if r["isoform"] in RTS_info:
-                if r["junction_number"] in RTS_info[r["isoform"]]:
-                    r["RTS_junction"] = "TRUE"
-                else:
-                    r["RTS_junction"] = "FALSE"
-            fout_junc.writerow(r)
+                isoforms_info[r["isoform"]].canonical = r["canonical"]
+
+            if (isoforms_info[r["isoform"]].bite == "NA") or (r["bite_junction"] == "TRUE"):
+                isoforms_info[r["isoform"]].bite = r["bite_junction"]
+
+            if r["indel_near_junct"] == "TRUE":
+                if isoforms_info[r["isoform"]].nIndelsJunc == "NA":
+                    isoforms_info[r["isoform"]].nIndelsJunc = 0
+                isoforms_info[r["isoform"]].nIndelsJunc += 1
+
+            # min_cov: min( total_cov[j] for each junction j in this isoform )
+            # min_cov_pos: the junction [j] that attributed to argmin(total_cov[j])
+            # min_sample_cov: min( sample_cov[j] for each junction in this isoform )
+            # sd_cov: sd( total_cov[j] for each junction j in this isoform )
+            if r["sample_with_cov"] != "NA":
+                sample_with_cov = int(r["sample_with_cov"])
+                if (isoforms_info[r["isoform"]].min_samp_cov == "NA") or (
+                    isoforms_info[r["isoform"]].min_samp_cov > sample_with_cov
+                ):
+                    isoforms_info[r["isoform"]].min_samp_cov = sample_with_cov
+
+            if r["total_coverage"] != "NA":
+                total_cov = int(r["total_coverage"])
+                sj_covs_by_isoform[r["isoform"]].append(total_cov)
+                if (isoforms_info[r["isoform"]].min_cov == "NA") or (
+                    isoforms_info[r["isoform"]].min_cov > total_cov
+                ):
+                    isoforms_info[r["isoform"]].min_cov = total_cov
+                    isoforms_info[r["isoform"]].min_cov_pos = r["junction_number"]
+
+        for pbid, covs in sj_covs_by_isoform.items():
+            isoforms_info[pbid].sd = np.std(covs)
+        record["records"] = len(isoforms_info)
+
+    with profiler.stage("writing") as record:
+        # Printing output file:
+        logger.info("Writing output files...")
+
+        # sort isoform keys
+        iso_keys = list(isoforms_info.keys())
+        iso_keys.sort(key=lambda x: (isoforms_info[x].chrom, isoforms_info[x].id))
+        with open(outputClassPath, "w") as h:
+            fout_class = DictWriter(h, fieldnames=fields_class_cur, delimiter="\t")
+            fout_class.writeheader()
+            for iso_key in iso_keys:
+                fout_class.writerow(isoforms_info[iso_key].as_dict())
+
+        # Now that RTS info is obtained, we can write the final junctions.txt
+        with open(outputJuncPath, "w") as h:
+            fout_junc = DictWriter(h, fieldnames=fields_junc_cur, delimiter="\t")
+            fout_junc.writeheader()
+            for r in DictReader(open(outputJuncPath + "_tmp"), delimiter="\t"):
+                if r["isoform"] in RTS_info:
+                    if r["junction_number"] in RTS_info[r["isoform"]]:
+                        r["RTS_junction"] = "TRUE"
+                    else:
+                        r["RTS_junction"] = "FALSE"
+                fout_junc.writerow(r)
+        record["records"] = len(iso_keys)
 
     # Generating report
     if not skip_report:
-        logger.info("Generating SQANTI3 report...")
-        cmd = (
-            f"{RSCRIPTPATH} {RSCRIPT_REPORT} "
-            f"{outputClassPath} {outputJuncPath} {doc} {UTILITIESPATH}"
-        )
-        if subprocess.check_call(cmd, shell=True) != 0:
-            logger.error(f"running command: {cmd}")
-            sys.exit(-1)
+        with profiler.stage("report"):
+            logger.info("Generating SQANTI3 report...")
+            cmd = (
+                f"{find_program(RSCRIPT)} {RSCRIPT_REPORT} "
+                f"{outputClassPath} {outputJuncPath} {doc} {UTILITIESPATH}"
+            )
+            if subprocess.check_call(cmd, shell=True) != 0:
+                logger.error(f"running command: {cmd}")
+                sys.exit(-1)
     stop3 = timeit.default_timer()
 
     logger.info("Removing temporary files....")
@@ -2654,23 +3046,25 @@ def sqanti3_qc(
     logger.info(f"SQANTI3 complete in {stop3 - start3} sec.")
 
     # IsoAnnot Lite implementation
-    # TODO why run this as a script when we can just call the functions from
-    # within python?
     if isoAnnotLite:
-        try:
-            IsoAnnotLite_SQ1.main(
-                corrected      = corrGTF,
-                classification = outputClassPath,
-                junctions      = outputJuncPath,
-                gff3           = gff3,
-                output         = output,
-            )
-        except:
-            logger.error("running command: IsoAnnotLite_SQ1")
-            logger.error(
-                f"corrected = {corrGTF}, classification = {outputClassPath}, junctions = {outputJuncPath}, gff3 = {gff3}, output = {output}"
-            )
-            sys.exit(-1)
+        with profiler.stage("isoannotlite"):
+            try:
+                IsoAnnotLite_SQ1.isoannot(
+                    gtf            = corrGTF,
+                    classification = outputClassPath,
+                    junctions      = outputJuncPath,
+                    gff3           = gff3,
+                    output         = output,
+                    cpus           = cpus,
+                )
+            except:
+                logger.error("running command: IsoAnnotLite_SQ1")
+                logger.error(
+                    f"corrected = {corrGTF}, classification = {outputClassPath}, junctions = {outputJuncPath}, gff3 = {gff3}, output = {output}"
+                )
+                sys.exit(-1)
+
+    profiler.write()
 
 
 def rename_isoform_seqids(input_fasta, force_id_ignore=False):
@@ -2684,6 +3078,8 @@ def rename_isoform_seqids(input_fasta, force_id_ignore=False):
     :param input_fasta: Could be either fasta or fastq, autodetect.
     :return: output fasta with the cleaned up sequence ID, is_fusion flag
     """
+    from Bio import SeqIO
+
     logger = logging.getLogger("sqanti3_qc")
     type = "fasta"
     with open(input_fasta) as h:
@@ -2714,24 +3110,109 @@ def rename_isoform_seqids(input_fasta, force_id_ignore=False):
     return f.name
 
 
+# number of queries resolved per vectorised pass, bounds the candidate arrays
+PEAK_QUERY_BLOCK = 65536
+
+
+def peak_candidates(peaks: PeakArrays, queries, search_window: int):
+    """
+    Pair every query with the peaks overlapping [query - search_window, query + search_window)
+    (same overlap semantics as IntervalTree.find)
+    :param queries: 1-D int64 array of 0-based positions
+    :return: (query index, peak index) arrays, peaks of each query in start order
+    """
+    lo = np.searchsorted(
+        peaks.start, queries - search_window - peaks.max_len, side="right"
+    )
+    hi = np.searchsorted(peaks.start, queries + search_window, side="left")
+    counts = np.maximum(hi - lo, 0)
+    qidx = np.repeat(np.arange(len(queries)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pidx = np.repeat(lo, counts) + offsets
+    keep = peaks.end[pidx] > queries[qidx] - search_window
+    return qidx[keep], pidx[keep]
+
+
+def nearest_candidate(qidx, pidx, abs_dist, n_queries):
+    """
+    For each query pick the candidate with the smallest abs_dist, the earliest peak wins ties
+    :return: array of peak indices per query, -1 where the query had no candidate
+    """
+    best = np.full(n_queries, -1, dtype=np.int64)
+    if len(qidx) > 0:
+        order = np.lexsort((pidx, abs_dist, qidx))
+        q_sorted = qidx[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = q_sorted[1:] != q_sorted[:-1]
+        best[q_sorted[first]] = pidx[order][first]
+    return best
+
+
+def scan_cage_candidates(qidx, within, dist, n_queries):
+    """
+    Replay the sequential CAGE hit scan for all queries at once
+    Walking the hits of a query in start order, a hit replaces the current answer when the
+    current answer is not within a peak, or when the hit is strictly closer to its TSS.
+    :return: has_hit, within_peak, dist_peak arrays per query
+    """
+    has_hit = np.zeros(n_queries, dtype=bool)
+    within_peak = np.zeros(n_queries, dtype=bool)
+    dist_peak = np.zeros(n_queries, dtype=np.int64)
+    if len(qidx) == 0:
+        return has_hit, within_peak, dist_peak
+    # rank of every candidate among the candidates of its query
+    first = np.ones(len(qidx), dtype=bool)
+    first[1:] = qidx[1:] != qidx[:-1]
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(qidx)), 0))
+    rank = np.arange(len(qidx)) - group_start
+    by_rank = np.argsort(rank, kind="stable")
+    bounds = np.cumsum(np.bincount(rank))
+    lo = 0
+    for hi in bounds:
+        cand = by_rank[lo:hi]
+        q = qidx[cand]
+        update = ~within_peak[q] | (np.abs(dist[cand]) < np.abs(dist_peak[q]))
+        q, cand = q[update], cand[update]
+        within_peak[q] = within[cand]
+        dist_peak[q] = dist[cand]
+        has_hit[q] = True
+        lo = hi
+    return has_hit, within_peak, dist_peak
+
+
+def batch_peak_lookup(peak_obj, records):
+    """
+    Resolve peak hits for all isoforms of one chromosome with one sorted pass per strand
+    The query position is txStart for + strand isoforms and txEnd for - strand ones.
+    :param peak_obj: CAGEPeak or PolyAPeak
+    :param records: list of genePredRecord on the same chromosome
+    :return: dict of isoform id --> (within_peak, dist_to_peak), as returned by peak_obj.find
+    """
+    result = {}
+    by_strand = defaultdict(lambda: [])
+    for rec in records:
+        by_strand[rec.strand].append(rec)
+    for strand, recs in by_strand.items():
+        queries = np.array(
+            [r.txStart if strand == "+" else r.txEnd for r in recs], dtype=np.int64
+        )
+        order = np.argsort(queries, kind="stable")
+        hits = peak_obj.find_batch(recs[0].chrom, strand, queries[order])
+        for i, hit in zip(order, hits):
+            result[recs[i].id] = hit
+    return result
+
+
 class CAGEPeak:
     def __init__(self, cage_bed_filename):
         self.cage_bed_filename = cage_bed_filename
-        self.cage_peaks = defaultdict(
-            lambda: IntervalTree()
-        )  # (chrom,strand) --> intervals of peaks
+        self.cage_peaks = {}  # (chrom,strand) --> PeakArrays of peaks
 
         self.read_bed()
 
     def read_bed(self):
-        for line in open(self.cage_bed_filename):
-            raw    = line.strip().split()
-            chrom  = raw[0]
-            start0 = int(raw[1])
-            end1   = int(raw[2])
-            strand = raw[5]
-            tss0   = int(raw[6])
-            self.cage_peaks[(chrom, strand)].insert(start0, end1, (tss0, start0, end1))
+        # column 7 of the CAGE peak BED holds the TSS of the peak
+        self.cage_peaks = load_peak_index(self.cage_bed_filename, tss_column=6)
 
     def find(self, chrom, strand, query, search_window=10000):
         """
@@ -2740,45 +3221,54 @@ def find(self, chrom, strand, query, search_window=10000):
         dist to TSS is 0 if right on spot
         dist to TSS is + if downstream, - if upstream (watch for strand!!!)
         """
-        within_peak, dist_peak = False, "NA"
-        for (tss0, start0, end1) in self.cage_peaks[(chrom, strand)].find(
-            query - search_window, query + search_window
-        ):
+        return self.find_batch(chrom, strand, [query], search_window)[0]
+
+    def find_batch(self, chrom, strand, queries, search_window=10000):
+        """
+        Same as find() for many queries on the same (chrom, strand) at once
+        :param queries: 0-based 5' ends to query, sorted for best locality
+        :return: list of (<within cage peak>, <nearest dist to TSS>) in query order
+        """
+        queries = np.asarray(queries, dtype=np.int64)
+        peaks = self.cage_peaks.get((chrom, strand))
+        if peaks is None or len(peaks.start) == 0:
+            return [(False, "NA")] * len(queries)
+        sign = -1 if strand == "-" else +1
+
+        result = []
+        for b in range(0, len(queries), PEAK_QUERY_BLOCK):
+            q = queries[b : b + PEAK_QUERY_BLOCK]
+            qidx, pidx = peak_candidates(peaks, q, search_window)
             # Skip those cage peaks that are downstream the detected TSS because degradation just make the transcript shorter
-            if strand == "+" and start0 > int(query) and end1 > int(query):
-                continue
-            if strand == "-" and start0 < int(query) and end1 < int(query):
-                continue
-            ##
-            if not within_peak:
-                within_peak, dist_peak = (
-                    (start0 <= query < end1),
-                    (query - tss0) * (-1 if strand == "-" else +1),
-                )
+            if strand == "+":
+                keep = ~((peaks.start[pidx] > q[qidx]) & (peaks.end[pidx] > q[qidx]))
+            elif strand == "-":
+                keep = ~((peaks.start[pidx] < q[qidx]) & (peaks.end[pidx] < q[qidx]))
             else:
-                d = (query - tss0) * (-1 if strand == "-" else +1)
-                if abs(d) < abs(dist_peak):
-                    within_peak, dist_peak = (start0 <= query < end1), d
-        return within_peak, dist_peak
+                keep = np.ones(len(pidx), dtype=bool)
+            qidx, pidx = qidx[keep], pidx[keep]
+            has_hit, within_peak, dist_peak = scan_cage_candidates(
+                qidx,
+                (peaks.start[pidx] <= q[qidx]) & (q[qidx] < peaks.end[pidx]),
+                (q[qidx] - peaks.tss[pidx]) * sign,
+                len(q),
+            )
+            for hit, within, dist in zip(
+                has_hit.tolist(), within_peak.tolist(), dist_peak.tolist()
+            ):
+                result.append((within, dist) if hit else (False, "NA"))
+        return result
 
 
 class PolyAPeak:
     def __init__(self, polya_bed_filename):
         self.polya_bed_filename = polya_bed_filename
-        self.polya_peaks = defaultdict(
-            lambda: IntervalTree()
-        )  # (chrom,strand) --> intervals of peaks
+        self.polya_peaks = {}  # (chrom,strand) --> PeakArrays of peaks
 
         self.read_bed()
 
     def read_bed(self):
-        for line in open(self.polya_bed_filename):
-            raw = line.strip().split()
-            chrom = raw[0]
-            start0 = int(raw[1])
-            end1 = int(raw[2])
-            strand = raw[5]
-            self.polya_peaks[(chrom, strand)].insert(start0, end1, (start0, end1))
+        self.polya_peaks = load_peak_index(self.polya_bed_filename)
 
     def find(self, chrom, strand, query, search_window=100):
         """
@@ -2786,25 +3276,40 @@ def find(self, chrom, strand, query, search_window=100):
         :return: <True/False falls within some distance to polyA>, distance to closest
         + if downstream, - if upstream (watch for strand!!!)
         """
+        return self.find_batch(chrom, strand, [query], search_window)[0]
+
+    def find_batch(self, chrom, strand, queries, search_window=100):
+        """
+        Same as find() for many queries on the same (chrom, strand) at once
+        :param queries: 0-based positions to query, sorted for best locality
+        :return: list of (<within some distance to polyA>, <distance to closest>) in query order
+        """
         assert strand in ("+", "-")
-        hits = self.polya_peaks[(chrom, strand)].find(
-            query - search_window, query + search_window
-        )
-        if len(hits) == 0:
-            return False, None
-        else:
-            s0, e1 = hits[0]
-            min_dist = query - s0
-            for s0, e1 in hits[1:]:
-                d = query - s0
-                if abs(d) < abs(min_dist):
-                    min_dist = d
-            if strand == "-":
-                min_dist = -min_dist
-            return True, min_dist
+        queries = np.asarray(queries, dtype=np.int64)
+        peaks = self.polya_peaks.get((chrom, strand))
+        if peaks is None or len(peaks.start) == 0:
+            return [(False, None)] * len(queries)
+        sign = -1 if strand == "-" else +1
+
+        result = []
+        for b in range(0, len(queries), PEAK_QUERY_BLOCK):
+            q = queries[b : b + PEAK_QUERY_BLOCK]
+            qidx, pidx = peak_candidates(peaks, q, search_window)
+            best = nearest_candidate(
+                qidx, pidx, np.abs(q[qidx] - peaks.start[pidx]), len(q)
+            )
+            for query, i in zip(q.tolist(), best.tolist()):
+                if i < 0:
+                    result.append((False, None))
+                else:
+                    result.append((True, int(query - peaks.start[i]) * sign))
+        return result
 
 
 def split_input_run(gtf, isoforms, chunks, arguments):
+    from Bio import SeqIO
+    from cupcake.sequence.GFF import collapseGFFReader, write_collapseGFF_format
+
     logger = logging.getLogger("sqanti3_qc")
     if os.path.exists("splits/"):
         logger.error("'splits/' directory already exists! Abort!")
@@ -2812,6 +3317,23 @@ def split_input_run(gtf, isoforms, chunks, arguments):
     else:
         os.makedirs("splits/")
 
+    # compile the peak and score indexes once here so the workers only map them
+    for peak_bed, tss_column in (
+        (arguments["cage_peak"], 6),
+        (arguments["polyA_peak"], None),
+    ):
+        if peak_bed is not None:
+            try:
+                build_peak_index(peak_bed, tss_column)
+            except OSError as e:
+                logger.warning(f"Unable to write peak index for {peak_bed} ({e}).")
+    phyloP_bed = arguments["phyloP_bed"]
+    if phyloP_bed is not None and not is_bigwig(phyloP_bed):
+        try:
+            build_score_index(phyloP_bed)
+        except OSError as e:
+            logger.warning(f"Unable to write score index for {phyloP_bed} ({e}).")
+
     if gtf:
         recs = [r for r in collapseGFFReader(isoforms)]
         n = len(recs)
@@ -2841,7 +3363,7 @@ def split_input_run(gtf, isoforms, chunks, arguments):
             d = os.path.join("splits/", str(i))
             os.makedirs(d)
             f = open(
-                os.path.join(d, f"{os.path.basename(isoforms)}.split{str(i)}"s), "w"
+                os.path.join(d, f"{os.path.basename(isoforms)}.split{str(i)}"), "w"
             )
             for j in range(i * chunk_size, min((i + 1) * chunk_size, n)):
                 SeqIO.write(recs[j], f, "fasta")
@@ -2870,52 +3392,58 @@ def dummy_with():
     yield None
 
 
-def combine_split_runs(output, directory, skipORF, skip_report, doc, split_dirs):
+def combine_split_runs(
+    output, directory, skipORF, skip_report, doc, split_dirs, profiler=None
+):
     """
     Combine .faa, .fasta, .gtf, .classification.txt, .junctions.txt
     Then write out the PDF report
     """
     logger = logging.getLogger("sqanti3_qc")
+    if profiler is None:
+        profiler = StageProfiler()
 
     corrGTF, corrSAM, corrFASTA, corrORF = get_corr_filenames(output, directory)
     outputClassPath, outputJuncPath = get_class_junc_filenames(output, directory)
 
-    with open(corrORF, "w") if not skipORF else dummy_with() as f_faa:
-        with open(corrFASTA, "w") as f_fasta, open(corrGTF, "w") as f_gtf, open(
-            outputClassPath, "w"
-        ) as f_class, open(outputJuncPath, "w") as f_junc:
-            for i, split_d in enumerate(split_dirs):
-                _gtf, _sam, _fasta, _orf = get_corr_filenames(output, split_d)
-                _class, _junc = get_class_junc_filenames(output, split_d)
-                if not skipORF:
-                    with open(_orf) as h:
-                        f_faa.write(h.read())
-                with open(_gtf) as h:
-                    f_gtf.write(h.read())
-                with open(_fasta) as h:
-                    f_fasta.write(h.read())
-                with open(_class) as h:
-                    if i == 0:
-                        f_class.write(h.readline())
-                    else:
-                        h.readline()
-                    f_class.write(h.read())
-                with open(_junc) as h:
-                    if i == 0:
-                        f_junc.write(h.readline())
-                    else:
-                        h.readline()
-                    f_junc.write(h.read())
+    with profiler.stage("combine"):
+        with open(corrORF, "w") if not skipORF else dummy_with() as f_faa:
+            with open(corrFASTA, "w") as f_fasta, open(corrGTF, "w") as f_gtf, open(
+                outputClassPath, "w"
+            ) as f_class, open(outputJuncPath, "w") as f_junc:
+                for i, split_d in enumerate(split_dirs):
+                    _gtf, _sam, _fasta, _orf = get_corr_filenames(output, split_d)
+                    _class, _junc = get_class_junc_filenames(output, split_d)
+                    if not skipORF:
+                        with open(_orf) as h:
+                            f_faa.write(h.read())
+                    with open(_gtf) as h:
+                        f_gtf.write(h.read())
+                    with open(_fasta) as h:
+                        f_fasta.write(h.read())
+                    with open(_class) as h:
+                        if i == 0:
+                            f_class.write(h.readline())
+                        else:
+                            h.readline()
+                        f_class.write(h.read())
+                    with open(_junc) as h:
+                        if i == 0:
+                            f_junc.write(h.readline())
+                        else:
+                            h.readline()
+                        f_junc.write(h.read())
 
     if not skip_report:
-        logger.info("Generating SQANTI3 report....")
-        cmd = (
-            RSCRIPTPATH
-            + f" {RSCRIPT_REPORT} {outputClassPath} {outputJuncPath} {doc} {UTILITIESPATH}"
-        )
-        if subprocess.check_call(cmd, shell=True) != 0:
-            logger.error(f"running command: {cmd}")
-            sys.exit(-1)
+        with profiler.stage("report"):
+            logger.info("Generating SQANTI3 report....")
+            cmd = (
+                find_program(RSCRIPT)
+                + f" {RSCRIPT_REPORT} {outputClassPath} {outputJuncPath} {doc} {UTILITIESPATH}"
+            )
+            if subprocess.check_call(cmd, shell=True) != 0:
+                logger.error(f"running command: {cmd}")
+                sys.exit(-1)
 
 
 @click.command()
@@ -2959,7 +3487,7 @@ def combine_split_runs(output, directory, skipORF, skip_report, doc, split_dirs)
   )
 @click.option(
     "--phyloP_bed",
-    help         = "PhyloP BED for conservation score (BED, optional)",
+    help         = "PhyloP BED or bigWig for conservation score (BED/bigWig, optional)",
     type         = str
 )
 @click.option(
@@ -3111,6 +3639,15 @@ def combine_split_runs(output, directory, skipORF, skip_report, doc, split_dirs)
     show_default = False,
     required     = False,
 )
+@click.option(
+    "--profile",
+    help         = "Run indels, classification and RT-switching under cProfile and record the classification time of every isoform (<output>.profile.pstats, <output>.isoform_latency*.tsv)",
+    type         = bool,
+    default      = False,
+    show_default = False,
+    is_flag      = True,
+    required     = False,
+)
 @click.version_option()
 @click.help_option(show_default=False)
 def main(
@@ -3141,6 +3678,7 @@ def main(
     skip_report     : bool          = False,
     isoannotlite    : bool          = False,
     gff3            : Optional[str] = None,
+    profile         : bool          = False,
 ) -> None:
     """Structural and Quality Annotation of Novel Transcript Isoforms
 
@@ -3155,15 +3693,84 @@ def main(
         Reference genome in fasta format
     """
     setup_logging("sqanti3_qc.log")
+    run_qc(
+        isoforms         = isoforms,
+        annotation       = annotation,
+        genome           = genome,
+        min_ref_len      = min_ref_len,
+        force_id_ignore  = force_id_ignore,
+        aligner_choice   = aligner_choice,
+        cage_peak        = cage_peak,
+        polya_motif_list = polya_motif_list,
+        polya_peak       = polya_peak,
+        phylop_bed       = phylop_bed,
+        skiporf          = skiporf,
+        is_fusion        = is_fusion,
+        gtf              = gtf,
+        expression       = expression,
+        gmap_index       = gmap_index,
+        cpus             = cpus,
+        chunks           = chunks,
+        output           = output,
+        directory        = directory,
+        coverage         = coverage,
+        sites            = sites,
+        window           = window,
+        genename         = genename,
+        fl_count         = fl_count,
+        skip_report      = skip_report,
+        isoannotlite     = isoannotlite,
+        gff3             = gff3,
+        profile          = profile,
+    )
+
+
+def run_qc(
+    isoforms        : str,
+    annotation      : str,
+    genome          : str,
+    min_ref_len     : int           = 200,
+    force_id_ignore : bool          = False,
+    aligner_choice  : str           = "minimap2",
+    cage_peak       : Optional[str] = None,
+    polya_motif_list: Optional[str] = None,
+    polya_peak      : Optional[str] = None,
+    phylop_bed      : Optional[str] = None,
+    skiporf         : bool          = False,
+    is_fusion       : bool          = False,
+    gtf             : bool          = False,
+    expression      : Optional[str] = None,
+    gmap_index      : Optional[str] = None,
+    cpus            : int           = 10,
+    chunks          : int           = 1,
+    output          : Optional[str] = None,
+    directory       : Optional[str] = None,
+    coverage        : Optional[str] = None,
+    sites           : str           = "ATAC,GCAG,GTAG",
+    window          : int           = 20,
+    genename        : bool          = False,
+    fl_count        : Optional[str] = None,
+    skip_report     : bool          = False,
+    isoannotlite    : bool          = False,
+    gff3            : Optional[str] = None,
+    profile         : bool          = False,
+    genome_dict     : Optional[Dict]  = None,
+    reference       : Optional[Tuple] = None,
+) -> None:
+    """
+    Check the inputs, write the params file and run sqanti3_qc (split in chunks if asked)
+    :param genome_dict: (optional) preloaded dict of chrom --> SeqRecord of the genome
+    :param reference: (optional) preloaded output of reference_parser() for the annotation
+    """
     logger = logging.getLogger("sqanti3_qc")
 
-    if GTF2GENEPRED_PROG is None:
+    if find_program(GTF2GENEPRED) is None:
         logger.error("Cannot find gtf2genepred. Abort!")
         sys.exit(-1)
-    if GFFREAD_PROG is None:
+    if find_program(GFFREAD) is None:
         logger.error("Cannot find gffread. Abort!")
         sys.exit(-1)
-    if RSCRIPTPATH is None:
+    if find_program(RSCRIPT) is None:
         logger.error("Cannot find Rscript. Abort!")
         sys.exit(-1)
 
@@ -3302,7 +3909,11 @@ def main(
     logger.debug(f"skip_report     : {skip_report}")
     logger.debug(f"isoAnnotLite    : {isoannotlite}")
     logger.debug(f"gff3            : {gff3}")
+    logger.debug(f"profile         : {profile}")
     logger.debug(f"doc             : {doc}")
+    if chunks > 1 and (genome_dict is not None or reference is not None):
+        logger.warning("A preloaded genome or reference is only used with --chunks 1, running in 1 chunk.")
+        chunks = 1
     if chunks == 1:
         sqanti3_qc(
             isoforms         = isoforms,
@@ -3334,6 +3945,9 @@ def main(
             isoAnnotLite     = isoannotlite,
             gff3             = gff3,
             doc              = doc,
+            profile          = profile,
+            genome_dict      = genome_dict,
+            reference        = reference,
         )
     else:
         args = {
@@ -3365,13 +3979,17 @@ def main(
             "skip_report"     : skip_report,
             "isoAnnotLite"    : isoannotlite,
             "gff3"            : gff3,
+            "profile"         : profile,
         }
-        split_dirs = split_input_run(
-            gtf      = gtf,
-            isoforms = isoforms,
-            chunks   = chunks,
-            arguments = args
-        )
+        profiler = StageProfiler(os.path.join(directory, output), cprofile=profile)
+        with profiler.stage("chunks") as record:
+            split_dirs = split_input_run(
+                gtf      = gtf,
+                isoforms = isoforms,
+                chunks   = chunks,
+                arguments = args
+            )
+            record["records"] = len(split_dirs)
         combine_split_runs(
             output      = output,
             directory   = directory,
@@ -3379,7 +3997,10 @@ def main(
             skip_report = skip_report,
             doc         = doc,
             split_dirs  = split_dirs,
+            profiler    = profiler,
         )
+        profiler.add_chunks([os.path.join(d, output) for d in split_dirs])
+        profiler.write()
         shutil.rmtree("splits/")
 
 
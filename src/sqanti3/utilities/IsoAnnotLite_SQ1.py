@@ -2,10 +2,12 @@
 
 import logging
 import math
+import multiprocessing
 import os
 import sys
 import time
 import re
+from contextlib import nullcontext
 from typing import Optional, Tuple, Dict, List
 from tqdm import tqdm
 
@@ -305,16 +307,25 @@ def to_Series(self):
         _ = pd.Series(data=self.to_dict())
         return _
 
-    def write(self, filename, mode="a"):
-        with open(filename, mode) as output:
-            output.write(
-                str(self).rstrip("\n") + "\n"
-            )  # this makes sure we only only use one newline char
+    def write(self, output, mode="a"):
+        """
+        :param output: open file to write the line to, or name of a file to open with mode
+        """
+        if isinstance(output, str):
+            with open(output, mode) as f:
+                return self.write(f)
+        output.write(
+            str(self).rstrip("\n") + "\n"
+        )  # this makes sure we only only use one newline char
 
 
 # Functions
 def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
-    res = filename
+    """
+    :param filename: auxiliary GFF3 file, or a FeatureBuffer
+    """
+    # every feature goes through this one buffered handle
+    res = open(filename, "w") if isinstance(filename, str) else filename
 
     desc = ""
 
@@ -457,42 +468,20 @@ def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
             pattern=r"\.\d+$", repl="", string=fields.associated_transcript
         )
 
-        if fields.isoform not in dc_gene:
-            dc_gene.update(
-                {
-                    fields.isoform: [
-                        fields.associated_gene,
-                        fields.structural_category,
-                        transAssociated,
-                    ]
-                }
-            )
-        else:
-            dc_gene.update(
-                {
-                    fields.isoform: dc_gene[fields.isoform]
-                    + [
-                        fields.associated_gene,
-                        fields.structural_category,
-                        transAssociated,
-                    ]
-                }
-            )
+        dc_gene.setdefault(fields.isoform, []).extend(
+            [
+                fields.associated_gene,
+                fields.structural_category,
+                transAssociated,
+            ]
+        )
 
         ### Coding Dictionary
         CDSstart = fields.CDS_start
         CDSend = fields.CDS_end
         orf = fields.FSM_class
 
-        if not dc_coding.get(cds_entry.seqname):
-            dc_coding.update({str(cds_entry.seqname): [CDSstart, CDSend, orf]})
-        else:
-            dc_coding.update(
-                {
-                    str(cds_entry.seqname): dc_coding.get(cds_entry.seqname)
-                    + [CDSstart, CDSend, orf]
-                }
-            )
+        dc_coding.setdefault(str(cds_entry.seqname), []).extend([CDSstart, CDSend, orf])
 
         genomic_entry.write(res)
 
@@ -578,12 +567,7 @@ def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
         )
 
         # Exons Dictionary
-        if not dc_exons.get(line.gene_id):
-            dc_exons.update({line.gene_id: [[exon.start, exon.end]]})
-        else:
-            dc_exons.update(
-                {line.gene_id: dc_exons.get(line.gene_id) + [[exon.start, exon.end]]}
-            )
+        dc_exons.setdefault(line.gene_id, []).append([exon.start, exon.end])
 
         exon.write(res)
 
@@ -608,6 +592,8 @@ def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
 
         junct.write(res)
 
+    if res is not filename:
+        res.close()
     return dc_exons, dc_coding, dc_gene, dc_SQstrand
 
 
@@ -637,36 +623,15 @@ def readGFF(gff3):
                 line = line + "\n"
 
             if feature == "exon":
-                if not dc_GFF3transExons.get(str(transcript)):
-                    dc_GFF3transExons.update(
-                        {str(transcript): [[int(start), int(end)]]}
-                    )
-                else:
-                    dc_GFF3transExons.update(
-                        {
-                            str(transcript): dc_GFF3transExons.get(str(transcript))
-                            + [[int(start), int(end)]]
-                        }
-                    )
+                dc_GFF3transExons.setdefault(str(transcript), []).append(
+                    [int(start), int(end)]
+                )
 
-                if not dc_GFF3exonsTrans.get(int(start)):
-                    dc_GFF3exonsTrans.update({int(start): [transcript]})
-                else:
-                    dc_GFF3exonsTrans.update(
-                        {int(start): dc_GFF3exonsTrans.get(int(start)) + [transcript]}
-                    )
+                dc_GFF3exonsTrans.setdefault(int(start), []).append(transcript)
             elif feature == "CDS":
-                if not dc_GFF3coding.get(str(transcript)):
-                    dc_GFF3coding.update(
-                        {str(transcript): [int(start), int(end)]}
-                    )  # not int bc can be NA
-                else:
-                    dc_GFF3coding.update(
-                        {
-                            str(transcript): dc_GFF3coding.get(str(transcript))
-                            + [int(start), int(end)]
-                        }
-                    )
+                dc_GFF3coding.setdefault(str(transcript), []).extend(
+                    [int(start), int(end)]
+                )
 
             elif feature in [
                 "splice_junction",
@@ -678,15 +643,7 @@ def readGFF(gff3):
                 continue
 
             else:
-                if not dc_GFF3.get(transcript):
-                    dc_GFF3.update({str(transcript): [[start, end, line]]})
-                else:
-                    dc_GFF3.update(
-                        {
-                            str(transcript): dc_GFF3.get(transcript)
-                            + [[start, end, line]]
-                        }
-                    )
+                dc_GFF3.setdefault(str(transcript), []).append([start, end, line])
         else:
             print("File GFF3 doesn't have the correct number of columns (9).")
 
@@ -735,12 +692,8 @@ def transformTransFeaturesToGenomic(
                 end = int(fields[4])
                 bProt = True
             else:
-                if not newdc_GFF3.get(trans):
-                    newdc_GFF3.update({str(trans): [values]})
-                    continue
-                else:
-                    newdc_GFF3.update({str(trans): newdc_GFF3.get(trans) + [values]})
-                    continue
+                newdc_GFF3.setdefault(str(trans), []).append(values)
+                continue
 
             totalDiff = end - start
             if not bProt:
@@ -829,33 +782,19 @@ def transformTransFeaturesToGenomic(
                                 + "\t"
                                 + fields[8]
                             )
-                        if not newdc_GFF3.get(trans):
-                            newdc_GFF3.update({str(trans): [[startG, endG, newline]]})
-                            break
-                        else:
-                            newdc_GFF3.update(
-                                {
-                                    str(trans): newdc_GFF3.get(trans)
-                                    + [[startG, endG, newline]]
-                                }
-                            )
-                            break
+                        newdc_GFF3.setdefault(str(trans), []).append(
+                            [startG, endG, newline]
+                        )
+                        break
                     else:
                         if strand == "-":
                             aux = startG
                             startG = endG
                             endG = aux
-                        if not newdc_GFF3.get(trans):
-                            newdc_GFF3.update({str(trans): [[startG, endG, values[2]]]})
-                            break
-                        else:
-                            newdc_GFF3.update(
-                                {
-                                    str(trans): newdc_GFF3.get(trans)
-                                    + [[startG, endG, values[2]]]
-                                }
-                            )
-                            break
+                        newdc_GFF3.setdefault(str(trans), []).append(
+                            [startG, endG, values[2]]
+                        )
+                        break
             if bnegative:
                 break
 
@@ -950,17 +889,9 @@ def transformTransFeaturesToLocale(dc_GFF3, dc_SQexons):
                         + "\t"
                         + fields[8]
                     )
-                    if not dc_newGFF3.get(trans):
-                        dc_newGFF3.update({str(trans): [newline]})
-                    else:
-                        dc_newGFF3.update(
-                            {str(trans): dc_newGFF3.get(trans) + [newline]}
-                        )
+                    dc_newGFF3.setdefault(str(trans), []).append(newline)
             else:
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [line]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [line]})
+                dc_newGFF3.setdefault(str(trans), []).append(line)
     return dc_newGFF3
 
 
@@ -1062,15 +993,9 @@ def transformProtFeaturesToLocale(dc_GFF3, dc_SQexons, dc_SQcoding):
                     + "\t"
                     + fields[8]
                 )
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [newline]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [newline]})
+                dc_newGFF3.setdefault(str(trans), []).append(newline)
             else:
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [line]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [line]})
+                dc_newGFF3.setdefault(str(trans), []).append(line)
     return dc_newGFF3
 
 
@@ -1084,10 +1009,7 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
         CDS = dc_SQcoding.get(trans)
 
         if CDS[0] == "NA":
-            if not newdc_coding.get(str(trans)):
-                newdc_coding.update({str(trans): [CDS]})
-            else:
-                newdc_coding.update({str(trans): newdc_coding.get(str(trans)) + [CDS]})
+            newdc_coding.setdefault(str(trans), []).append(CDS)
             continue
 
         totalDiff = int(CDS[1]) - int(CDS[0])
@@ -1115,11 +1037,11 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
                 if exon[0] + totalDiff - 1 <= exon[1]:  # CDS ends here
                     end = exon[0] + totalDiff - 1
                     aux = [[exon[0], end]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     bend = True
                 else:  # CDS ends in other exon and we add the final exon
                     aux = [[exon[0], exon[1]]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     totalDiff = totalDiff - (exon[1] - exon[0] + 1)
 
             # Search for START
@@ -1129,20 +1051,15 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
                 if start + totalDiff - 1 <= exon[1]:  # CDS ends here
                     end = start + totalDiff - 1
                     aux = [[start, end]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     bend = True
                 else:  # CDS ends in other exon and we add the final exon
                     aux = [[start, exon[1]]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     totalDiff = totalDiff - (exon[1] - start + 1)
 
             if bend:
-                if not newdc_coding.get(str(trans)):
-                    newdc_coding.update({str(trans): newCDS})
-                else:
-                    newdc_coding.update(
-                        {str(trans): newdc_coding.get(str(trans)) + newCDS}
-                    )
+                newdc_coding.setdefault(str(trans), []).extend(newCDS)
                 break
         if bnegative:
             break
@@ -1165,13 +1082,12 @@ def checkSameCDS(dc_SQcoding, dc_GFF3coding, transSQ, transGFF3, strand):
                 allExonsGFF3 = sorted(allExonsGFF3)
             else:
                 allExonsGFF3 = sorted(allExonsGFF3, reverse=True)
+            allExonsSQ = dc_SQcoding.get(transSQ)
+            if strand == "+":
+                allExonsSQ = sorted(allExonsSQ)
+            else:
+                allExonsSQ = sorted(allExonsSQ, reverse=True)
             for ex in allExonsGFF3:
-                allExonsSQ = dc_SQcoding.get(transSQ)
-                if strand == "+":
-                    allExonsSQ = sorted(allExonsSQ)
-                else:
-                    allExonsSQ = sorted(allExonsSQ, reverse=True)
-
                 if ex in allExonsSQ:
                     total_annot = total_annot + 1
                     continue
@@ -1341,7 +1257,12 @@ def checkFeatureInTranscript(
     return False
 
 
-def mappingFeatures(
+# mappingFeatures data shared with the forked workers
+_MAPPING_DATA = None
+
+
+def mapTranscriptFeatures(
+    transSQ,
     dc_SQexons,
     dc_SQcoding,
     dc_SQtransGene,
@@ -1349,131 +1270,187 @@ def mappingFeatures(
     dc_GFF3transExons,
     dc_GFF3,
     dc_GFF3coding,
-    filename,
 ):
-    f = open(filename, "a+")
-    print("\n")
-    transcriptsAnnotated = 0
+    """
+    Map the features of the reference transcript of one SQANTI3 isoform
+    :return: (feature lines, reference features, features annotated), None if the
+        isoform has no reference transcript in the GFF3
+    """
+    lines = []
     totalAnotations = 0
     featuresAnnotated = 0
-    for transSQ in dc_SQexons.keys():
-
-        # Be carefully - not all tranSQ must be in SQtransGene
-        if not dc_SQtransGene.get(str(transSQ)):
-            continue
+    #######################
+    # IF FULL-SPLICED-MATCH#
+    #######################
+    infoGenomic = dc_SQtransGene.get(transSQ)
+    transGFF3 = infoGenomic[2]
+
+    ###########################
+    # IF NOT FULL-SPLICED-MATCH#
+    ###########################
+    val = ""
+    if dc_GFF3.get(transGFF3):  # Novel Transcript won't be annoted
+        val = dc_GFF3.get(transGFF3)
+    elif dc_GFF3.get(transSQ):
+        transGFF3 = transSQ
+        val = dc_GFF3.get(transGFF3)
+    else:
+        return None
 
-        perct = transcriptsAnnotated / len(dc_SQexons) * 100
-        print("\t" + "%.2f" % perct + " % of transcripts annotated...", end="\r")
+    line = val[0][2].split("\t")
+    strand = line[6]
+    # Check if we had same CDS to add Protein information
+    coding, semicoding = checkSameCDS(
+        dc_SQcoding, dc_GFF3coding, transSQ, transGFF3, strand
+    )
 
-        #######################
-        # IF FULL-SPLICED-MATCH#
-        #######################
-        infoGenomic = dc_SQtransGene.get(transSQ)
-        transGFF3 = infoGenomic[2]
-
-        ###########################
-        # IF NOT FULL-SPLICED-MATCH#
-        ###########################
-        val = ""
-        if dc_GFF3.get(transGFF3):  # Novel Transcript won't be annoted
-            val = dc_GFF3.get(transGFF3)
-        elif dc_GFF3.get(transSQ):
-            transGFF3 = transSQ
-            val = dc_GFF3.get(transGFF3)
-        else:
+    for values in dc_GFF3.get(transGFF3):
+        fields = values[2].split("\t")
+        text = fields[8].split(" ")
+        strand = fields[6]
+        if fields[1] == "tappAS":
             continue
+        totalAnotations += 1
+        ####################
+        # PROTEIN ANNOTATION#
+        ####################
+        if (
+            text[-1].endswith("P\n")
+            or text[-1].endswith("G\n")
+            or text[-1].endswith("N\n")
+        ):  # protein
+            if coding:
+                index = values[2].find("\t")
+                if values[2].endswith("\n"):
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:])  # write line
+                else:
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:] + "\n")  # write line
 
-        line = val[0][2].split("\t")
-        strand = line[6]
-        # Check if we had same CDS to add Protein information
-        coding, semicoding = checkSameCDS(
-            dc_SQcoding, dc_GFF3coding, transSQ, transGFF3, strand
-        )
-
-        for values in dc_GFF3.get(transGFF3):
-            fields = values[2].split("\t")
-            text = fields[8].split(" ")
-            strand = fields[6]
-            if fields[1] == "tappAS":
-                continue
-            totalAnotations = totalAnotations + 1
-            ####################
-            # PROTEIN ANNOTATION#
-            ####################
-            if (
-                text[-1].endswith("P\n")
-                or text[-1].endswith("G\n")
-                or text[-1].endswith("N\n")
-            ):  # protein
-                if coding:
-                    index = values[2].find("\t")
-                    if values[2].endswith("\n"):
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:])  # write line
-                    else:
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:] + "\n")  # write line
-
-                elif semicoding and not values[0] == "." and not values[1] == ".":
-                    bannot = False
-                    # funcion match annot to its our CDSexons and match to CDSexonsSQ
-                    bannot = checkFeatureInCDS(
-                        dc_SQcoding,
-                        dc_GFF3coding,
-                        transSQ,
-                        transGFF3,
-                        int(values[0]),
-                        int(values[1]),
-                        strand,
-                    )
-                    if bannot:
-                        index = values[2].find("\t")
-                        if values[2].endswith("\n"):
-                            featuresAnnotated = featuresAnnotated + 1
-                            f.write(transSQ + values[2][index:])  # write line
-                        else:
-                            featuresAnnotated = featuresAnnotated + 1
-                            f.write(transSQ + values[2][index:] + "\n")  # write line
-
-                elif semicoding and values[0] == "." and values[1] == ".":
-                    index = values[2].find("\t")
-                    if values[2].endswith("\n"):
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:])  # write line
-                    else:
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:] + "\n")  # write line
-
-            #######################
-            # TRANSCRIPT ANNOTATION#
-            #######################
-
-            if (
-                not values[0] == "."
-                and not values[1] == "."
-                and text[-1].endswith("T\n")
-            ):
+            elif semicoding and not values[0] == "." and not values[1] == ".":
                 bannot = False
-                bannot = checkFeatureInTranscript(
-                    dc_SQexons,
-                    dc_GFF3transExons,
+                # funcion match annot to its our CDSexons and match to CDSexonsSQ
+                bannot = checkFeatureInCDS(
+                    dc_SQcoding,
+                    dc_GFF3coding,
                     transSQ,
                     transGFF3,
                     int(values[0]),
                     int(values[1]),
                     strand,
                 )
-
                 if bannot:
                     index = values[2].find("\t")
                     if values[2].endswith("\n"):
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:])  # write line
+                        featuresAnnotated += 1
+                        lines.append(transSQ + values[2][index:])  # write line
                     else:
-                        featuresAnnotated = featuresAnnotated + 1
-                        f.write(transSQ + values[2][index:] + "\n")  # write line
+                        featuresAnnotated += 1
+                        lines.append(transSQ + values[2][index:] + "\n")  # write line
+
+            elif semicoding and values[0] == "." and values[1] == ".":
+                index = values[2].find("\t")
+                if values[2].endswith("\n"):
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:])  # write line
+                else:
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:] + "\n")  # write line
+
+        #######################
+        # TRANSCRIPT ANNOTATION#
+        #######################
+
+        if not values[0] == "." and not values[1] == "." and text[-1].endswith("T\n"):
+            bannot = False
+            bannot = checkFeatureInTranscript(
+                dc_SQexons,
+                dc_GFF3transExons,
+                transSQ,
+                transGFF3,
+                int(values[0]),
+                int(values[1]),
+                strand,
+            )
+
+            if bannot:
+                index = values[2].find("\t")
+                if values[2].endswith("\n"):
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:])  # write line
+                else:
+                    featuresAnnotated += 1
+                    lines.append(transSQ + values[2][index:] + "\n")  # write line
+    return lines, totalAnotations, featuresAnnotated
+
+
+def _mapTranscriptShard(transcripts):
+    return [mapTranscriptFeatures(transSQ, *_MAPPING_DATA) for transSQ in transcripts]
+
+
+def mappingFeatures(
+    dc_SQexons,
+    dc_SQcoding,
+    dc_SQtransGene,
+    dc_GFF3exonsTrans,
+    dc_GFF3transExons,
+    dc_GFF3,
+    dc_GFF3coding,
+    filename,
+    cpus=1,
+):
+    """
+    Append the features of the reference transcripts that map to each SQANTI3 isoform
+    :param filename: auxiliary GFF3 file, or a FeatureBuffer
+    :param cpus: number of processes; the isoforms are split in shards mapped by
+        forked workers sharing the reference data, and written in their original order
+    """
+    global _MAPPING_DATA
+    f = open(filename, "a+") if isinstance(filename, str) else filename
+    print("\n")
+    transcriptsAnnotated = 0
+    totalAnotations = 0
+    featuresAnnotated = 0
+    # Be carefully - not all tranSQ must be in SQtransGene
+    transcripts = [t for t in dc_SQexons.keys() if dc_SQtransGene.get(str(t))]
+    data = (
+        dc_SQexons,
+        dc_SQcoding,
+        dc_SQtransGene,
+        dc_GFF3exonsTrans,
+        dc_GFF3transExons,
+        dc_GFF3,
+        dc_GFF3coding,
+    )
+    if cpus > 1 and len(transcripts) > 1:
+        # several shards per worker to balance transcripts with many features
+        size = max(1, math.ceil(len(transcripts) / (cpus * 8)))
+        shards = [transcripts[i : i + size] for i in range(0, len(transcripts), size)]
+        _MAPPING_DATA = data
+        try:
+            with multiprocessing.get_context("fork").Pool(cpus) as pool:
+                results = [
+                    r for shard in pool.imap(_mapTranscriptShard, shards) for r in shard
+                ]
+        finally:
+            _MAPPING_DATA = None
+    else:
+        results = (mapTranscriptFeatures(transSQ, *data) for transSQ in transcripts)
+
+    for result in results:
+        perct = transcriptsAnnotated / len(dc_SQexons) * 100
+        print("\t" + "%.2f" % perct + " % of transcripts annotated...", end="\r")
+        if result is None:
+            continue
+        lines, total, annotated = result
+        for line in lines:
+            f.write(line)
+        totalAnotations += total
+        featuresAnnotated += annotated
         transcriptsAnnotated = transcriptsAnnotated + 1
-    f.close()
+    if f is not filename:
+        f.close()
 
     print(
         "\n\n\t·Annoted a total of "
@@ -1496,442 +1473,491 @@ def addPosType(res, line, posType):
         res.write(line[:-1] + "; PosType=" + posType + "\n")
 
 
-def updateGTF(filename, filenameMod):
-    # open new file
-    res = open(filenameMod, "w")
-    # open annotation file and process all data
-    with open(filename, "r") as f:
-        # process all entries - no header line in file
-        for line in f:
-            if len(line) == 0:
-                break
-            else:
-                if line and line[0] != "#":
-                    fields = line.split("\t")
-                    if len(fields) == 9:
+def updateGTFLine(res, line) -> bool:
+    """
+    Write a line of the auxiliary GFF3 to res with its PosType (T, P, G or N)
+    :return: False when the line is invalid and the following ones should be skipped
+    """
+    if not line or line[0] == "#":
+        return True
+    fields = line.split("\t")
+    if len(fields) != 9:
+        print("Error in line (has not 9 fields):\n" + line)
+        return False
+
+    text = fields[8].split(" ")
+    if text[-1].startswith("PosType"):
+        res.write(line)
+
+    elif fields[1] == "tappAS":
+        if fields[2] == "transcript":
+            addPosType(res, line, "T")
+        elif fields[2] == "gene":
+            addPosType(res, line, "T")
+        elif fields[2] == "CDS":
+            addPosType(res, line, "T")
+        elif fields[2] == "genomic":
+            addPosType(res, line, "G")
+        elif fields[2] == "exon":
+            addPosType(res, line, "G")
+        elif fields[2] == "splice_junction":
+            addPosType(res, line, "G")
+        elif fields[2] == "protein":
+            addPosType(res, line, "P")
+        else:
+            print(line)
+            return False
 
-                        text = fields[8].split(" ")
-                        if text[-1].startswith("PosType"):
-                            res.write(line)
-
-                        elif fields[1] == "tappAS":
-                            if fields[2] == "transcript":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "gene":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "CDS":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "genomic":
-                                addPosType(res, line, "G")
-                            elif fields[2] == "exon":
-                                addPosType(res, line, "G")
-                            elif fields[2] == "splice_junction":
-                                addPosType(res, line, "G")
-                            elif fields[2] == "protein":
-                                addPosType(res, line, "P")
-                            else:
-                                print(line)
-                                break
+    elif fields[1] == "COILS":
+        if fields[2] == "COILED":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
+
+    elif fields[1] == "GeneOntology":
+        if fields[2] in ("C", "cellular_component"):
+            addPosType(res, line, "N")
+        elif fields[2] in ("F", "molecular_function"):
+            addPosType(res, line, "N")
+        elif fields[2] in ("P", "biological_process"):
+            addPosType(res, line, "N")
+        elif fields[2] in ("eco"):
+            addPosType(res, line, "N")  # Fran tomato annot
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            ##break
 
-                        elif fields[1] == "COILS":
-                            if fields[2] == "COILED":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
-
-                        elif fields[1] == "GeneOntology":
-                            if fields[2] in ("C", "cellular_component"):
-                                addPosType(res, line, "N")
-                            elif fields[2] in ("F", "molecular_function"):
-                                addPosType(res, line, "N")
-                            elif fields[2] in ("P", "biological_process"):
-                                addPosType(res, line, "N")
-                            elif fields[2] in ("eco"):
-                                addPosType(res, line, "N")  # Fran tomato annot
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                ##break
+    elif fields[1] == "MOBIDB_LITE":
+        if fields[2] == "DISORDER":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "MOBIDB_LITE":
-                            if fields[2] == "DISORDER":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] == "NMD":
+        if fields[2] == "NMD":
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
+
+    elif fields[1] in ("PAR-CLIP", "PAR-clip"):
+        if fields[2] in (
+            "RNA_binding",
+            "RNA_Binding_Protein",
+            "RBP_Binding",
+        ) or fields[2].startswith("RNA_binding_"):
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
+
+    elif fields[1] == "PFAM":
+        if fields[2] == "DOMAIN":
+            addPosType(res, line, "P")
+        elif fields[2] in ("CLAN", "clan"):
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] == "NMD":
-                            if fields[2] == "NMD":
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
-
-                        elif fields[1] in ("PAR-CLIP", "PAR-clip"):
-                            if fields[2] in (
-                                "RNA_binding",
-                                "RNA_Binding_Protein",
-                                "RBP_Binding",
-                            ) or fields[2].startswith("RNA_binding_"):
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
-
-                        elif fields[1] == "PFAM":
-                            if fields[2] == "DOMAIN":
-                                addPosType(res, line, "P")
-                            elif fields[2] in ("CLAN", "clan"):
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    elif fields[1] == "Provean":
+        if fields[2] == "FunctionalImpact":
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] == "Provean":
-                            if fields[2] == "FunctionalImpact":
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    elif fields[1] in ("REACTOME", "Reactome"):
+        if fields[2] in ("PATHWAY", "pathway", "Pathway"):
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] in ("REACTOME", "Reactome"):
-                            if fields[2] in ("PATHWAY", "pathway", "Pathway"):
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    elif fields[1] == "RepeatMasker":
+        if fields[2] == "repeat":
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
 
-                        elif fields[1] == "RepeatMasker":
-                            if fields[2] == "repeat":
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
+    elif fields[1] == "SIGNALP_EUK":
+        if fields[2] == "SIGNAL":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "SIGNALP_EUK":
-                            if fields[2] == "SIGNAL":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] == "TMHMM":
+        if fields[2] == "TRANSMEM":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
+
+    elif fields[1] == "TranscriptAttributes":
+        addPosType(res, line, "T")
+
+    elif fields[1] == "UTRsite":
+        if fields[2] == "uORF":
+            addPosType(res, line, "T")
+        elif fields[2] == "5UTRmotif":
+            addPosType(res, line, "T")
+        elif fields[2] == "PAS":
+            addPosType(res, line, "T")
+        elif fields[2] == "3UTRmotif":
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
 
-                        elif fields[1] == "TMHMM":
-                            if fields[2] == "TRANSMEM":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] in (
+        "UniProtKB/Swiss-Prot_Phosphosite",
+        "Swissprot_Phosphosite",
+    ):
+        if fields[2] == "ACT_SITE":
+            addPosType(res, line, "P")
+        elif fields[2] == "BINDING":
+            addPosType(res, line, "P")
+        elif fields[2] == "PTM":
+            addPosType(res, line, "P")
+        elif fields[2] == "MOTIF":
+            addPosType(res, line, "P")
+        elif fields[2] == "COILED":
+            addPosType(res, line, "P")
+        elif fields[2] == "TRANSMEM":
+            addPosType(res, line, "P")
+        elif fields[2] == "COMPBIAS":
+            addPosType(res, line, "P")
+        elif fields[2] == "INTRAMEM":
+            addPosType(res, line, "P")
+        elif fields[2] == "NON_STD":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "TranscriptAttributes":
-                            addPosType(res, line, "T")
-
-                        elif fields[1] == "UTRsite":
-                            if fields[2] == "uORF":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "5UTRmotif":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "PAS":
-                                addPosType(res, line, "T")
-                            elif fields[2] == "3UTRmotif":
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
-
-                        elif fields[1] in (
-                            "UniProtKB/Swiss-Prot_Phosphosite",
-                            "Swissprot_Phosphosite",
-                        ):
-                            if fields[2] == "ACT_SITE":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "BINDING":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "PTM":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "MOTIF":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "COILED":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "TRANSMEM":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "COMPBIAS":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "INTRAMEM":
-                                addPosType(res, line, "P")
-                            elif fields[2] == "NON_STD":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] in ("cNLS_mapper", "NLS_mapper"):
+        if fields[2] == "MOTIF":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] in ("cNLS_mapper", "NLS_mapper"):
-                            if fields[2] == "MOTIF":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] in ("miRWalk", "mirWalk"):
+        if fields[2] in ("miRNA", "miRNA_Binding"):
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
+
+    elif fields[1] == "scanForMotifs":
+        if fields[2] == "PAS":
+            addPosType(res, line, "T")
+        elif fields[2] in ("3UTRmotif", "3'UTRmotif"):
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
 
-                        elif fields[1] in ("miRWalk", "mirWalk"):
-                            if fields[2] in ("miRNA", "miRNA_Binding"):
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
-
-                        elif fields[1] == "scanForMotifs":
-                            if fields[2] == "PAS":
-                                addPosType(res, line, "T")
-                            elif fields[2] in ("3UTRmotif", "3'UTRmotif"):
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
+    elif fields[1] == "MetaCyc":
+        if fields[2] == "pathway":
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] == "MetaCyc":
-                            if fields[2] == "pathway":
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    elif fields[1] == "KEGG":
+        if fields[2] in ("pathway", "Pathway"):
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] == "KEGG":
-                            if fields[2] in ("pathway", "Pathway"):
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    elif fields[1] == "SUPERFAMILY":
+        if fields[2] == "DOMAIN":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "SUPERFAMILY":
-                            if fields[2] == "DOMAIN":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] == "SMART":
+        if fields[2] == "DOMAIN":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "SMART":
-                            if fields[2] == "DOMAIN":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] == "TIGRFAM":
+        if fields[2] == "DOMAIN":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
 
-                        elif fields[1] == "TIGRFAM":
-                            if fields[2] == "DOMAIN":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
+    elif fields[1] == "psRNATarget":
+        if fields[2] == "miRNA":
+            addPosType(res, line, "T")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using T type to annotate."
+            )
+            addPosType(res, line, "T")
+            # break
 
-                        elif fields[1] == "psRNATarget":
-                            if fields[2] == "miRNA":
-                                addPosType(res, line, "T")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using T type to annotate."
-                                )
-                                addPosType(res, line, "T")
-                                # break
+    elif fields[1] == "CORUM":
+        if fields[2] == "Complex":
+            addPosType(res, line, "P")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using P type to annotate."
+            )
+            addPosType(res, line, "P")
+            # break
+
+    elif fields[1] == "Orthologues":
+        if fields[2] == "S.tuberosum":
+            addPosType(res, line, "N")
+        elif fields[2] in ("A.thaliana"):
+            addPosType(res, line, "N")
+        else:
+            print(
+                "IsoAnnotLite can not identify the feature "
+                + str(fields[2])
+                + " in source "
+                + str(fields[1])
+                + ", using N type to annotate."
+            )
+            addPosType(res, line, "N")
+            # break
 
-                        elif fields[1] == "CORUM":
-                            if fields[2] == "Complex":
-                                addPosType(res, line, "P")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using P type to annotate."
-                                )
-                                addPosType(res, line, "P")
-                                # break
-
-                        elif fields[1] == "Orthologues":
-                            if fields[2] == "S.tuberosum":
-                                addPosType(res, line, "N")
-                            elif fields[2] in ("A.thaliana"):
-                                addPosType(res, line, "N")
-                            else:
-                                print(
-                                    "IsoAnnotLite can not identify the feature "
-                                    + str(fields[2])
-                                    + " in source "
-                                    + str(fields[1])
-                                    + ", using N type to annotate."
-                                )
-                                addPosType(res, line, "N")
-                                # break
+    else:
+        print(
+            "IsoAnnotLite can not identify the source "
+            + str(fields[1])
+            + ", in line:\n"
+            + line
+            + "\nUSing N type to annotate."
+        )
+        addPosType(res, line, "N")
+        # break
 
-                        else:
-                            print(
-                                "IsoAnnotLite can not identify the source "
-                                + str(fields[1])
-                                + ", in line:\n"
-                                + line
-                                + "\nUSing N type to annotate."
-                            )
-                            addPosType(res, line, "N")
-                            # break
+    return True
 
-                    else:
-                        print("Error in line (has not 9 fields):\n" + line)
-                        break
 
-        res.close()
+class _Lines(list):
+    """List of lines that can be written to like a file"""
+
+    write = list.append
+
+
+class FeatureBuffer:
+    """
+    In-memory auxiliary GFF3. Lines written to it get their PosType right away (as
+    updateGTF does on the auxiliary file) and are kept in order in .lines, ready
+    for readGFFandGetData.
+    """
+
+    def __init__(self, keep_raw: bool = False):
+        """
+        :param keep_raw: also keep the lines as written, to dump the auxiliary file
+        """
+        self.lines = _Lines()
+        self.raw = [] if keep_raw else None
+        self.valid = True  # False after an invalid line, as updateGTF stops there
+
+    def write(self, text: str) -> None:
+        for line in text.splitlines(keepends=True):
+            if self.raw is not None:
+                self.raw.append(line)
+            if self.valid:
+                self.valid = updateGTFLine(self.lines, line)
+
+    def dump(self, filename: str, filenameMod: str) -> None:
+        """
+        Write the auxiliary GFF3 (if keep_raw) and its version with PosType
+        """
+        if self.raw is not None:
+            with open(filename, "w") as f:
+                f.writelines(self.raw)
+        with open(filenameMod, "w") as f:
+            f.writelines(self.lines)
+
+
+def updateGTF(filename, filenameMod):
+    # open new file
+    res = open(filenameMod, "w")
+    # open annotation file and process all data
+    with open(filename, "r") as f:
+        # process all entries - no header line in file
+        for line in f:
+            if not updateGTFLine(res, line):
+                break
+
+    res.close()
 
 
 def readGFFandGetData(filenameMod):
+    """
+    :param filenameMod: auxiliary GFF3 with PosType, or its lines (ex: FeatureBuffer.lines)
+    """
     # open annotation file and process all data
     dcTrans = {}
     dcExon = {}
@@ -1944,7 +1970,11 @@ def readGFFandGetData(filenameMod):
 
     dcTransID = {}
 
-    with open(filenameMod, "r") as f:
+    with (
+        open(filenameMod, "r")
+        if isinstance(filenameMod, str)
+        else nullcontext(filenameMod)
+    ) as f:
         # process all entries - no header line in file
         for line in f:
             if len(line) == 0:
@@ -1961,109 +1991,41 @@ def readGFFandGetData(filenameMod):
 
                         if fields[1] == "tappAS":
                             if fields[2] in ["transcript", "gene", "CDS"]:
-                                if not dcTrans.get(str(transcript)):
-                                    dcTrans.update({str(transcript): [line]})
-                                else:
-                                    dcTrans.update(
-                                        {
-                                            str(transcript): dcTrans.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcTrans.setdefault(str(transcript), []).append(line)
                                 # extra dcTransID
                                 # if not dcTransID.get(str(transcriptID)):
                                 #    dcTransID.update({str(transcriptID) : [line]})
                                 # else:
                                 #    dcTransID.update({str(transcriptID) : dcTransID.get(str(transcriptID)) + [line]})
                             elif fields[2] in ["exon"]:
-                                if not dcExon.get(str(transcript)):
-                                    dcExon.update({str(transcript): [line]})
-                                else:
-                                    dcExon.update(
-                                        {
-                                            str(transcript): dcExon.get(str(transcript))
-                                            + [line]
-                                        }
-                                    )
+                                dcExon.setdefault(str(transcript), []).append(line)
                             elif fields[2] in ["genomic"]:
-                                if not dcGenomic.get(str(transcript)):
-                                    dcGenomic.update({str(transcript): [line]})
-                                else:
-                                    dcGenomic.update(
-                                        {
-                                            str(transcript): dcGenomic.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcGenomic.setdefault(str(transcript), []).append(line)
                             elif fields[2] in ["splice_junction"]:
-                                if not dcSpliceJunctions.get(str(transcript)):
-                                    dcSpliceJunctions.update({str(transcript): [line]})
-                                else:
-                                    dcSpliceJunctions.update(
-                                        {
-                                            str(transcript): dcSpliceJunctions.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcSpliceJunctions.setdefault(
+                                    str(transcript), []
+                                ).append(line)
                             elif fields[2] in ["protein"]:
-                                if not dcProt.get(str(transcript)):
-                                    dcProt.update({str(transcript): [line]})
-                                else:
-                                    dcProt.update(
-                                        {
-                                            str(transcript): dcProt.get(str(transcript))
-                                            + [line]
-                                        }
-                                    )
+                                dcProt.setdefault(str(transcript), []).append(line)
                         # Transcript Information
                         elif fields[1] == "TranscriptAttributes":
-                            if not dcTranscriptAttributes.get(str(transcript)):
-                                dcTranscriptAttributes.update({str(transcript): [line]})
-                            else:
-                                dcTranscriptAttributes.update(
-                                    {
-                                        str(transcript): dcTranscriptAttributes.get(
-                                            str(transcript)
-                                        )
-                                        + [line]
-                                    }
-                                )
+                            dcTranscriptAttributes.setdefault(
+                                str(transcript), []
+                            ).append(line)
                         # Feature information
                         else:
                             if text[-1].endswith("T\n"):
-                                if not dcTransFeatures.get(str(transcript)):
-                                    dcTransFeatures.update({str(transcript): [line]})
-                                else:
-                                    dcTransFeatures.update(
-                                        {
-                                            str(transcript): dcTransFeatures.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcTransFeatures.setdefault(str(transcript), []).append(
+                                    line
+                                )
                             elif (
                                 text[-1].endswith("P\n")
                                 or text[-1].endswith("G\n")
                                 or text[-1].endswith("N\n")
                             ):
-                                if not dcProtFeatures.get(str(transcript)):
-                                    dcProtFeatures.update({str(transcript): [line]})
-                                else:
-                                    dcProtFeatures.update(
-                                        {
-                                            str(transcript): dcProtFeatures.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcProtFeatures.setdefault(str(transcript), []).append(
+                                    line
+                                )
 
     return (
         dcTrans,
@@ -2147,7 +2109,14 @@ def isoannot(
     junctions: str,
     output: Optional[str] = None,
     gff3: Optional[str] = None,
+    keep_intermediate: bool = False,
+    cpus: int = 1,
 ) -> None:
+    """
+    :param cpus: number of processes mapping the GFF3 features to the isoforms
+    :param keep_intermediate: also write the auxiliary GFF3 files (<name>_aux.gff3 and
+        <name>_mod.gff3), which are otherwise only kept in memory
+    """
 
     global USE_GFF3
     ########################
@@ -2158,7 +2127,9 @@ def isoannot(
 
         # File names
         filename = "tappAS_annot_from_SQANTI3.gff3"
+        filenameAux = filename[:-5] + "_aux" + filename[-5:]
         filenameMod = filename[:-5] + "_mod" + filename[-5:]
+        features = FeatureBuffer(keep_raw=keep_intermediate)
 
         #################
         # START PROCESS #
@@ -2169,7 +2140,7 @@ def isoannot(
         # dc_SQcoding = {trans : [CDSstart, CDSend, orf]}
         # dc_SQtransGene = {trans : [gene, category, transAssociated]}
         dc_SQexons, dc_SQcoding, dc_SQtransGene, dc_SQstrand = createGTFFromSqanti(
-            gtf, classification, junctions, filename
+            gtf, classification, junctions, features
         )
 
         print("Reading reference annotation file and creating data variables...")
@@ -2209,11 +2180,11 @@ def isoannot(
             dc_GFF3transExons,
             dc_GFF3_Genomic,
             dc_GFF3coding,
-            filename,
+            features,
+            cpus=cpus,
         )  # edit tappAS_annotation_from_Sqanti file
-
-        print("Adding extra information to GFF3 columns...")
-        updateGTF(filename, filenameMod)
+        if keep_intermediate:
+            features.dump(filenameAux, filenameMod)
 
         print("Reading GFF3 to sort it correctly...")
         (
@@ -2225,11 +2196,7 @@ def isoannot(
             dcProt,
             dcProtFeatures,
             dcTranscriptAttributes,
-        ) = readGFFandGetData(filenameMod)
-
-        # Remove old files
-        os.remove(filename)
-        os.remove(filenameMod)
+        ) = readGFFandGetData(features.lines)
 
         dcTransFeatures = transformTransFeaturesToLocale(dcTransFeatures, dc_SQexons)
 
@@ -2255,7 +2222,9 @@ def isoannot(
     else:
         # File names
         filename = "tappAS_annotation_from_SQANTI3.gff3"
+        filenameAux = filename[:-5] + "_aux" + filename[-5:]
         filenameMod = filename[:-5] + "_mod" + filename[-5:]
+        features = FeatureBuffer(keep_raw=keep_intermediate)
 
         #################
         # START PROCESS #
@@ -2266,11 +2235,11 @@ def isoannot(
         # dc_SQcoding = {trans : [CDSstart, CDSend, orf]}
         # dc_SQtransGene = {trans : [gene, category, transAssociated]}
         dc_SQexons, dc_SQcoding, dc_SQtransGene, dc_SQstrand = createGTFFromSqanti(
-            gtf, classification, junctions, filename
+            gtf, classification, junctions, features
         )
 
-        print("Adding extra information to relative columns...")
-        updateGTF(filename, filenameMod)
+        if keep_intermediate:
+            features.dump(filenameAux, filenameMod)
 
         print("Reading GFF3 to sort it correctly...")
         (
@@ -2282,11 +2251,7 @@ def isoannot(
             dcProt,
             dcProtFeatures,
             dcTranscriptAttributes,
-        ) = readGFFandGetData(filenameMod)
-
-        # Remove old files
-        os.remove(filename)
-        os.remove(filenameMod)
+        ) = readGFFandGetData(features.lines)
 
         print("Generating final GFF3...")
         generateFinalGFF3(
@@ -2317,6 +2282,19 @@ def isoannot(
 @click.option(
     "--output", type=str, default=None, help="path and name to use for output gtf"
 )
+@click.option(
+    "--keep_intermediate",
+    is_flag=True,
+    default=False,
+    help="Also write the auxiliary GFF3 files, which are otherwise only kept in memory",
+)
+@click.option(
+    "--cpus",
+    type=int,
+    default=1,
+    help="Number of processes mapping the GFF3 features to the isoforms",
+    show_default=True,
+)
 @click.option(
     "--loglevel",
     type=click.Choice(["info", "debug"]),
@@ -2332,6 +2310,8 @@ def main(
     junctions: str,
     gff3: Optional[str] = None,
     output: Optional[str] = None,
+    keep_intermediate: bool = False,
+    cpus: int = 1,
     loglevel: str = None,
 ) -> None:
     """
@@ -2395,6 +2375,8 @@ def main(
         junctions=junctions,
         gff3=gff3,
         output=output,
+        keep_intermediate=keep_intermediate,
+        cpus=cpus,
     )
     logging.shutdown()
 
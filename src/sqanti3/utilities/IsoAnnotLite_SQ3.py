@@ -153,27 +153,16 @@ def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
             )  # ENSMUS213123.1 -> #ENSMUS213123
             transAssociated = transAssociated[0]
 
-        if not dc_gene.get(transcript):
-            dc_gene.update({str(transcript): [gene, category, transAssociated]})
-        else:
-            dc_gene.update(
-                {
-                    str(transcript): dc_gene.get(transcript)
-                    + [gene, category, transAssociated]
-                }
-            )
+        dc_gene.setdefault(str(transcript), []).extend(
+            [gene, category, transAssociated]
+        )
 
         # Coding Dictionary
         CDSstart = fields[32]  # 30
         CDSend = fields[33]  # 31
         orf = fields[30]  # 28
 
-        if not dc_coding.get(transcript):
-            dc_coding.update({str(transcript): [CDSstart, CDSend, orf]})
-        else:
-            dc_coding.update(
-                {str(transcript): dc_coding.get(transcript) + [CDSstart, CDSend, orf]}
-            )
+        dc_coding.setdefault(str(transcript), []).extend([CDSstart, CDSend, orf])
 
         res.write(
             "\t".join([transcript, source, "genomic", "1", "1", aux, strand, aux, desc])
@@ -286,12 +275,7 @@ def createGTFFromSqanti(file_exons, file_trans, file_junct, filename):
             desc = "Chr=" + str(fields[0]) + "\n"
 
             # Exons Dictionary
-            if not dc_exons.get(transcript):
-                dc_exons.update({str(transcript): [[start, end]]})
-            else:
-                dc_exons.update(
-                    {str(transcript): dc_exons.get(transcript) + [[start, end]]}
-                )
+            dc_exons.setdefault(str(transcript), []).append([start, end])
 
             res.write(
                 "\t".join(
@@ -363,36 +347,15 @@ def readGFF(gff3):
                 line = line + "\n"
 
             if feature == "exon":
-                if not dc_GFF3transExons.get(str(transcript)):
-                    dc_GFF3transExons.update(
-                        {str(transcript): [[int(start), int(end)]]}
-                    )
-                else:
-                    dc_GFF3transExons.update(
-                        {
-                            str(transcript): dc_GFF3transExons.get(str(transcript))
-                            + [[int(start), int(end)]]
-                        }
-                    )
+                dc_GFF3transExons.setdefault(str(transcript), []).append(
+                    [int(start), int(end)]
+                )
 
-                if not dc_GFF3exonsTrans.get(int(start)):
-                    dc_GFF3exonsTrans.update({int(start): [transcript]})
-                else:
-                    dc_GFF3exonsTrans.update(
-                        {int(start): dc_GFF3exonsTrans.get(int(start)) + [transcript]}
-                    )
+                dc_GFF3exonsTrans.setdefault(int(start), []).append(transcript)
             elif feature == "CDS":
-                if not dc_GFF3coding.get(str(transcript)):
-                    dc_GFF3coding.update(
-                        {str(transcript): [int(start), int(end)]}
-                    )  # not int bc can be NA
-                else:
-                    dc_GFF3coding.update(
-                        {
-                            str(transcript): dc_GFF3coding.get(str(transcript))
-                            + [int(start), int(end)]
-                        }
-                    )
+                dc_GFF3coding.setdefault(str(transcript), []).extend(
+                    [int(start), int(end)]
+                )
 
             elif feature in [
                 "splice_junction",
@@ -404,15 +367,7 @@ def readGFF(gff3):
                 continue
 
             else:
-                if not dc_GFF3.get(transcript):
-                    dc_GFF3.update({str(transcript): [[start, end, line]]})
-                else:
-                    dc_GFF3.update(
-                        {
-                            str(transcript): dc_GFF3.get(transcript)
-                            + [[start, end, line]]
-                        }
-                    )
+                dc_GFF3.setdefault(str(transcript), []).append([start, end, line])
         else:
             print("File GFF3 doesn't have the correct number of columns (9).")
 
@@ -461,12 +416,8 @@ def transformTransFeaturesToGenomic(
                 end = int(fields[4])
                 bProt = True
             else:
-                if not newdc_GFF3.get(trans):
-                    newdc_GFF3.update({str(trans): [values]})
-                    continue
-                else:
-                    newdc_GFF3.update({str(trans): newdc_GFF3.get(trans) + [values]})
-                    continue
+                newdc_GFF3.setdefault(str(trans), []).append(values)
+                continue
 
             totalDiff = end - start
             if not bProt:
@@ -555,33 +506,19 @@ def transformTransFeaturesToGenomic(
                                 + "\t"
                                 + fields[8]
                             )
-                        if not newdc_GFF3.get(trans):
-                            newdc_GFF3.update({str(trans): [[startG, endG, newline]]})
-                            break
-                        else:
-                            newdc_GFF3.update(
-                                {
-                                    str(trans): newdc_GFF3.get(trans)
-                                    + [[startG, endG, newline]]
-                                }
-                            )
-                            break
+                        newdc_GFF3.setdefault(str(trans), []).append(
+                            [startG, endG, newline]
+                        )
+                        break
                     else:
                         if strand == "-":
                             aux = startG
                             startG = endG
                             endG = aux
-                        if not newdc_GFF3.get(trans):
-                            newdc_GFF3.update({str(trans): [[startG, endG, values[2]]]})
-                            break
-                        else:
-                            newdc_GFF3.update(
-                                {
-                                    str(trans): newdc_GFF3.get(trans)
-                                    + [[startG, endG, values[2]]]
-                                }
-                            )
-                            break
+                        newdc_GFF3.setdefault(str(trans), []).append(
+                            [startG, endG, values[2]]
+                        )
+                        break
             if bnegative:
                 break
 
@@ -676,17 +613,9 @@ def transformTransFeaturesToLocale(dc_GFF3, dc_SQexons):
                         + "\t"
                         + fields[8]
                     )
-                    if not dc_newGFF3.get(trans):
-                        dc_newGFF3.update({str(trans): [newline]})
-                    else:
-                        dc_newGFF3.update(
-                            {str(trans): dc_newGFF3.get(trans) + [newline]}
-                        )
+                    dc_newGFF3.setdefault(str(trans), []).append(newline)
             else:
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [line]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [line]})
+                dc_newGFF3.setdefault(str(trans), []).append(line)
     return dc_newGFF3
 
 
@@ -788,15 +717,9 @@ def transformProtFeaturesToLocale(dc_GFF3, dc_SQexons, dc_SQcoding):
                     + "\t"
                     + fields[8]
                 )
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [newline]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [newline]})
+                dc_newGFF3.setdefault(str(trans), []).append(newline)
             else:
-                if not dc_newGFF3.get(trans):
-                    dc_newGFF3.update({str(trans): [line]})
-                else:
-                    dc_newGFF3.update({str(trans): dc_newGFF3.get(trans) + [line]})
+                dc_newGFF3.setdefault(str(trans), []).append(line)
     return dc_newGFF3
 
 
@@ -810,10 +733,7 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
         CDS = dc_SQcoding.get(trans)
 
         if CDS[0] == "NA":
-            if not newdc_coding.get(str(trans)):
-                newdc_coding.update({str(trans): [CDS]})
-            else:
-                newdc_coding.update({str(trans): newdc_coding.get(str(trans)) + [CDS]})
+            newdc_coding.setdefault(str(trans), []).append(CDS)
             continue
 
         totalDiff = int(CDS[1]) - int(CDS[0])
@@ -841,11 +761,11 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
                 if exon[0] + totalDiff - 1 <= exon[1]:  # CDS ends here
                     end = exon[0] + totalDiff - 1
                     aux = [[exon[0], end]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     bend = True
                 else:  # CDS ends in other exon and we add the final exon
                     aux = [[exon[0], exon[1]]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     totalDiff = totalDiff - (exon[1] - exon[0] + 1)
 
             # Search for START
@@ -855,20 +775,15 @@ def transformCDStoGenomic(dc_SQcoding, dc_SQexons, dc_SQstrand):
                 if start + totalDiff - 1 <= exon[1]:  # CDS ends here
                     end = start + totalDiff - 1
                     aux = [[start, end]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     bend = True
                 else:  # CDS ends in other exon and we add the final exon
                     aux = [[start, exon[1]]]
-                    newCDS = newCDS + aux
+                    newCDS.extend(aux)
                     totalDiff = totalDiff - (exon[1] - start + 1)
 
             if bend:
-                if not newdc_coding.get(str(trans)):
-                    newdc_coding.update({str(trans): newCDS})
-                else:
-                    newdc_coding.update(
-                        {str(trans): newdc_coding.get(str(trans)) + newCDS}
-                    )
+                newdc_coding.setdefault(str(trans), []).extend(newCDS)
                 break
         if bnegative:
             break
@@ -891,13 +806,12 @@ def checkSameCDS(dc_SQcoding, dc_GFF3coding, transSQ, transGFF3, strand):
                 allExonsGFF3 = sorted(allExonsGFF3)
             else:
                 allExonsGFF3 = sorted(allExonsGFF3, reverse=True)
+            allExonsSQ = dc_SQcoding.get(transSQ)
+            if strand == "+":
+                allExonsSQ = sorted(allExonsSQ)
+            else:
+                allExonsSQ = sorted(allExonsSQ, reverse=True)
             for ex in allExonsGFF3:
-                allExonsSQ = dc_SQcoding.get(transSQ)
-                if strand == "+":
-                    allExonsSQ = sorted(allExonsSQ)
-                else:
-                    allExonsSQ = sorted(allExonsSQ, reverse=True)
-
                 if ex in allExonsSQ:
                     total_annot = total_annot + 1
                     continue
@@ -1687,109 +1601,41 @@ def readGFFandGetData(filenameMod):
 
                         if fields[1] == "tappAS":
                             if fields[2] in ["transcript", "gene", "CDS"]:
-                                if not dcTrans.get(str(transcript)):
-                                    dcTrans.update({str(transcript): [line]})
-                                else:
-                                    dcTrans.update(
-                                        {
-                                            str(transcript): dcTrans.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcTrans.setdefault(str(transcript), []).append(line)
                                 # extra dcTransID
                                 # if not dcTransID.get(str(transcriptID)):
                                 #    dcTransID.update({str(transcriptID) : [line]})
                                 # else:
                                 #    dcTransID.update({str(transcriptID) : dcTransID.get(str(transcriptID)) + [line]})
                             elif fields[2] in ["exon"]:
-                                if not dcExon.get(str(transcript)):
-                                    dcExon.update({str(transcript): [line]})
-                                else:
-                                    dcExon.update(
-                                        {
-                                            str(transcript): dcExon.get(str(transcript))
-                                            + [line]
-                                        }
-                                    )
+                                dcExon.setdefault(str(transcript), []).append(line)
                             elif fields[2] in ["genomic"]:
-                                if not dcGenomic.get(str(transcript)):
-                                    dcGenomic.update({str(transcript): [line]})
-                                else:
-                                    dcGenomic.update(
-                                        {
-                                            str(transcript): dcGenomic.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcGenomic.setdefault(str(transcript), []).append(line)
                             elif fields[2] in ["splice_junction"]:
-                                if not dcSpliceJunctions.get(str(transcript)):
-                                    dcSpliceJunctions.update({str(transcript): [line]})
-                                else:
-                                    dcSpliceJunctions.update(
-                                        {
-                                            str(transcript): dcSpliceJunctions.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcSpliceJunctions.setdefault(
+                                    str(transcript), []
+                                ).append(line)
                             elif fields[2] in ["protein"]:
-                                if not dcProt.get(str(transcript)):
-                                    dcProt.update({str(transcript): [line]})
-                                else:
-                                    dcProt.update(
-                                        {
-                                            str(transcript): dcProt.get(str(transcript))
-                                            + [line]
-                                        }
-                                    )
+                                dcProt.setdefault(str(transcript), []).append(line)
                         # Transcript Information
                         elif fields[1] == "TranscriptAttributes":
-                            if not dcTranscriptAttributes.get(str(transcript)):
-                                dcTranscriptAttributes.update({str(transcript): [line]})
-                            else:
-                                dcTranscriptAttributes.update(
-                                    {
-                                        str(transcript): dcTranscriptAttributes.get(
-                                            str(transcript)
-                                        )
-                                        + [line]
-                                    }
-                                )
+                            dcTranscriptAttributes.setdefault(
+                                str(transcript), []
+                            ).append(line)
                         # Feature information
                         else:
                             if text[-1].endswith("T\n"):
-                                if not dcTransFeatures.get(str(transcript)):
-                                    dcTransFeatures.update({str(transcript): [line]})
-                                else:
-                                    dcTransFeatures.update(
-                                        {
-                                            str(transcript): dcTransFeatures.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcTransFeatures.setdefault(str(transcript), []).append(
+                                    line
+                                )
                             elif (
                                 text[-1].endswith("P\n")
                                 or text[-1].endswith("G\n")
                                 or text[-1].endswith("N\n")
                             ):
-                                if not dcProtFeatures.get(str(transcript)):
-                                    dcProtFeatures.update({str(transcript): [line]})
-                                else:
-                                    dcProtFeatures.update(
-                                        {
-                                            str(transcript): dcProtFeatures.get(
-                                                str(transcript)
-                                            )
-                                            + [line]
-                                        }
-                                    )
+                                dcProtFeatures.setdefault(str(transcript), []).append(
+                                    line
+                                )
 
     return (
         dcTrans,
@@ -1 +1,11 @@
-from . import IsoAnnotLite_SQ1, IsoAnnotLite_SQ3, indels_annot
+import importlib
+
+# submodules are imported on first access, IsoAnnotLite needs pandas and
+# indels_annot needs pysam
+__all__ = ["IsoAnnotLite_SQ1", "IsoAnnotLite_SQ3", "indels_annot"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+samtools-compatible indexes of FASTA/FASTQ files, used to copy a subset of the
+records by byte range instead of parsing every record.
+
+<file>.fai has one line per record, tab-separated:
+    FASTA: NAME LENGTH OFFSET LINEBASES LINEWIDTH
+    FASTQ: NAME LENGTH OFFSET LINEBASES LINEWIDTH QUALOFFSET
+OFFSET (QUALOFFSET) is the byte offset of the first base (quality) of the record,
+LINEBASES and LINEWIDTH the number of bases and bytes of each sequence line, as
+written by `samtools faidx`/`samtools fqidx`. An index written by samtools is
+reused as is; the index is rebuilt when it is older than the file.
+
+Records are assumed to be contiguous: a record spans from the end of the
+previous one to the end of its sequence (FASTA) or quality (FASTQ) lines.
+"""
+
+import logging
+import os
+from collections import namedtuple
+from typing import BinaryIO, List, Optional, Set
+
+FAI_SUFFIX = ".fai"
+# size of the reads and writes of the byte-range copies
+COPY_BUFFER = 1 << 20
+
+FaiRecord = namedtuple(
+    "FaiRecord", ["name", "length", "offset", "linebases", "linewidth", "qualoffset"]
+)
+
+
+def fai_path(filename: str) -> str:
+    return f"{filename}{FAI_SUFFIX}"
+
+
+def _data_bytes(length: int, linebases: int, linewidth: int) -> int:
+    """
+    :return: number of bytes of the sequence (or quality) lines of a record, newlines included
+    """
+    if length == 0 or linebases == 0:
+        return 0
+    full_lines, rest = divmod(length, linebases)
+    return full_lines * linewidth + (rest + linewidth - linebases if rest else 0)
+
+
+def record_end(record: FaiRecord) -> int:
+    """
+    :return: byte offset right after the last sequence (FASTA) or quality (FASTQ) line of record
+    """
+    start = record.offset if record.qualoffset is None else record.qualoffset
+    return start + _data_bytes(record.length, record.linebases, record.linewidth)
+
+
+def _fasta_records(f: BinaryIO) -> List[FaiRecord]:
+    records = []
+    name = None
+    pos = 0
+
+    def close():
+        if name is not None:
+            records.append(FaiRecord(name, length, offset, linebases, linewidth, None))
+
+    for line in f:
+        if line.startswith(b">"):
+            close()
+            name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+            length, offset, linebases, linewidth, last = 0, pos + len(line), 0, 0, False
+        elif name is None or not line.strip():
+            # their bytes would be copied with the next record; samtools faidx refuses them too
+            where = "before the first record" if name is None else f"in record {name}"
+            raise ValueError(f"Blank line or text {where}, the file cannot be indexed.")
+        else:
+            bases = len(line.rstrip(b"\r\n"))
+            if linebases == 0:
+                linebases, linewidth = bases, len(line)
+            elif last or bases > linebases or (bases == linebases and len(line) != linewidth):
+                # only the last line of a record can be shorter
+                raise ValueError(f"Different line lengths in record {name}, the file cannot be indexed.")
+            last = bases < linebases
+            length += bases
+        pos += len(line)
+    close()
+    return records
+
+
+def _fastq_records(f: BinaryIO) -> List[FaiRecord]:
+    records = []
+    pos = 0
+    while True:
+        header = f.readline()
+        if not header:
+            break
+        if not header.strip():  # trailing blank lines
+            pos += len(header)
+            continue
+        seq, plus, qual = f.readline(), f.readline(), f.readline()
+        name = header[1:].split(None, 1)[0].decode()
+        offset = pos + len(header)
+        qualoffset = offset + len(seq) + len(plus)
+        bases = len(seq.rstrip(b"\r\n"))
+        if not plus.startswith(b"+") or len(qual.rstrip(b"\r\n")) != bases:
+            # ex: sequence wrapped over several lines
+            raise ValueError(f"Record {name} is not a 4-line FASTQ record, the file cannot be indexed.")
+        records.append(
+            FaiRecord(
+                name,
+                bases,
+                offset,
+                bases,
+                len(seq),
+                qualoffset,
+            )
+        )
+        pos = qualoffset + len(qual)
+    return records
+
+
+def build_index(
+    filename: str, fastq: bool = False, logger: Optional[logging.Logger] = None
+) -> List[FaiRecord]:
+    """
+    Index filename (4-line records if fastq) and write <filename>.fai
+    :param logger: (optional) logger of the caller, default sqanti3_qc
+    :raise ValueError: if the sequence lines of a FASTA record have different lengths,
+        a FASTA file has blank lines, or a FASTQ record is not 4 lines with as many quality values as bases
+    """
+    with open(filename, "rb") as f:
+        records = _fastq_records(f) if fastq else _fasta_records(f)
+    tmp = f"{fai_path(filename)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as out:
+            for r in records:
+                fields = [r.name, r.length, r.offset, r.linebases, r.linewidth]
+                if fastq:
+                    fields.append(r.qualoffset)
+                out.write("\t".join(map(str, fields)) + "\n")
+        os.replace(tmp, fai_path(filename))  # concurrent builders never see a partial index
+    except OSError as e:  # ex: read-only input directory, the index is only kept in memory
+        (logger or logging.getLogger("sqanti3_qc")).warning(f"Unable to write {fai_path(filename)}: {e}")
+    return records
+
+
+def read_index(filename: str) -> List[FaiRecord]:
+    """
+    :param filename: .fai file, FASTA (5 columns) or FASTQ (6 columns)
+    """
+    records = []
+    with open(filename) as f:
+        for line in f:
+            raw = line.rstrip("\n").split("\t")
+            records.append(
+                FaiRecord(
+                    raw[0],
+                    *map(int, raw[1:5]),
+                    int(raw[5]) if len(raw) > 5 else None,
+                )
+            )
+    return records
+
+
+def load_index(
+    filename: str, fastq: bool = False, logger: Optional[logging.Logger] = None
+) -> List[FaiRecord]:
+    """
+    :param logger: (optional) logger of the caller, default sqanti3_qc
+    :return: records of filename, from <filename>.fai if it is up to date, otherwise indexing filename
+    """
+    logger = logger or logging.getLogger("sqanti3_qc")
+    index = fai_path(filename)
+    if os.path.exists(index) and os.path.getmtime(index) >= os.path.getmtime(filename):
+        records = read_index(index)
+        if all((r.qualoffset is not None) == fastq for r in records):
+            return records
+        logger.warning(f"{index} does not match the {'FASTQ' if fastq else 'FASTA'} format, rebuilding it.")
+    logger.info(f"Indexing {filename}...")
+    return build_index(filename, fastq, logger)
+
+
+def copy_records(
+    src: str,
+    dst: str,
+    seqids_to_keep: Set[str],
+    fastq: bool = False,
+    logger: Optional[logging.Logger] = None,
+) -> str:
+    """
+    Copy the records of src whose name is in seqids_to_keep to dst, in file order,
+    as byte ranges read from src with buffered bulk copies; consecutive kept
+    records are copied as one range and other records are never read.
+    :param logger: (optional) logger of the caller, default sqanti3_qc
+    """
+    ranges = []  # (start, end), merged when contiguous
+    start = 0
+    for record in load_index(src, fastq, logger):
+        end = record_end(record)
+        if record.name in seqids_to_keep:
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        start = end
+
+    with open(src, "rb") as f, open(dst, "wb") as out:
+        for start, end in ranges:
+            f.seek(start)
+            todo = end - start
+            while todo > 0:
+                chunk = f.read(min(COPY_BUFFER, todo))
+                if not chunk:
+                    break
+                out.write(chunk)
+                todo -= len(chunk)
+    return dst
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+Declarative filtering rules over the columns of a SQANTI3 classification file.
+
+A rule set lists, per structural category, the ordered reasons to filter an
+isoform out; the first rule that matches gives the reason, an isoform matching
+none is kept. Rule sets are JSON (or YAML, with the optional PyYAML):
+
+    {
+      "params": {"intrapriming": 0.6, "min_cov": 3},
+      "conditions": {
+        "intrapriming": {"all": [
+          {"column": "perc_A_downstream_TTS", "divide_by": 100, "op": ">=", "value": "$intrapriming"},
+          {"column": "polyA_motif", "op": "is_na"}
+        ]}
+      },
+      "rules": {
+        "FSM": [{"reason": "IntraPriming", "when": {"ref": "intrapriming"}}],
+        "default": [
+          {"reason": "IntraPriming", "when": {"ref": "intrapriming"}},
+          {"reason": "RTSwitching", "when": {"column": "RTS_stage", "op": "==", "value": "TRUE"}}
+        ]
+      }
+    }
+
+Conditions are {"all": [...]}, {"any": [...]}, {"not": ...}, {"ref": <name of
+a shared condition>}, {"param": <name>} (a boolean parameter) or a column test
+{"column", "op", "value", "abs", "divide_by"} with op one of ==, !=, <, <=, >,
+>=, in, not_in, is_na, not_na ("abs" and "divide_by" apply to numeric tests).
+Values starting with "$" are parameters, given in "params" or when evaluating.
+Categories are structural_category values or their short names (FSM, ISM,
+NIC...); "default" applies to the categories not listed.
+
+Rule sets are compiled once into functions evaluating each condition over whole
+columns (numpy arrays) of the table, so one read of the classification file can
+be evaluated for any number of parameter settings.
+"""
+
+import json
+import logging
+import operator
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+NA_VALUES = ("NA", "")
+NUMERIC_OPS = {
+    "<" : operator.lt,
+    "<=": operator.le,
+    ">" : operator.gt,
+    ">=": operator.ge,
+}
+OPS = set(NUMERIC_OPS) | {"==", "!=", "in", "not_in", "is_na", "not_na"}
+
+# the rules sqanti3_RulesFilter has always applied
+DEFAULT_RULES = {
+    "params": {
+        "intrapriming"         : 0.6,
+        "runAlength"           : 6,
+        "max_dist_to_known_end": 50,
+        "min_cov"              : 3,
+        "filter_mono_exonic"   : False,
+    },
+    "conditions": {
+        "intrapriming": {
+            "all": [
+                {
+                    "any": [
+                        {
+                            "column"   : "perc_A_downstream_TTS",
+                            "divide_by": 100,
+                            "op"       : ">=",
+                            "value"    : "$intrapriming",
+                        },
+                        {"column": "runA_downstream_TTS", "op": ">=", "value": "$runAlength"},
+                    ]
+                },
+                {"column": "polyA_motif", "op": "is_na"},
+                {
+                    "any": [
+                        {"column": "diff_to_gene_TSS", "op": "is_na"},
+                        {
+                            "column": "diff_to_gene_TTS",
+                            "abs"   : True,
+                            "op"    : ">",
+                            "value" : "$max_dist_to_known_end",
+                        },
+                    ]
+                },
+            ]
+        },
+        "mono_exonic": {
+            "all": [
+                {"param": "filter_mono_exonic"},
+                {"column": "exons", "op": "==", "value": 1},
+            ]
+        },
+    },
+    "rules": {
+        "FSM": [
+            {"reason": "IntraPriming", "when": {"ref": "intrapriming"}},
+            {"reason": "Mono-Exonic", "when": {"ref": "mono_exonic"}},
+        ],
+        "default": [
+            {"reason": "IntraPriming", "when": {"ref": "intrapriming"}},
+            {"reason": "Mono-Exonic", "when": {"ref": "mono_exonic"}},
+            {"reason": "RTSwitching", "when": {"column": "RTS_stage", "op": "==", "value": "TRUE"}},
+            {
+                "reason": "LowCoverage/Non-Canonical",
+                "when"  : {
+                    "all": [
+                        {"column": "all_canonical", "op": "!=", "value": "canonical"},
+                        {
+                            "any": [
+                                {"column": "min_cov", "op": "is_na"},
+                                {"column": "min_cov", "op": "<", "value": "$min_cov"},
+                            ]
+                        },
+                    ]
+                },
+            },
+        ],
+    },
+}
+
+
+class ClassificationTable:
+    def __init__(self, fields: List[str], lines: List[str]):
+        """
+        :param fields: column names
+        :param lines: rows as read from the file, newline included
+        """
+        self.fields = fields
+        self.lines = lines
+        self._rows = None
+        self._strings = {}
+        self._numbers = {}
+        self._na = {}
+
+    @classmethod
+    def read(cls, filename: str) -> "ClassificationTable":
+        with open(filename) as f:
+            fields = f.readline().rstrip("\n").split("\t")
+            lines = [line for line in f if line.strip()]
+        return cls(fields, lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def strings(self, column: str) -> np.ndarray:
+        """
+        :return: values of column as a str array
+        """
+        if column not in self._strings:
+            if column == "runA_downstream_TTS":
+                self._strings[column] = self._runA()
+            else:
+                self._strings[column] = self._column(column)
+        return self._strings[column]
+
+    def _column(self, column: str) -> np.ndarray:
+        if column not in self.fields:
+            raise KeyError(f"Column {column} not in the classification file.")
+        if self._rows is None:
+            self._rows = [line.rstrip("\n").split("\t") for line in self.lines]
+        i = self.fields.index(column)
+        return np.array([row[i] if i < len(row) else "" for row in self._rows], dtype=str)
+
+    def numbers(self, column: str) -> np.ndarray:
+        """
+        :return: values of column as a float array, NaN for NA
+        """
+        if column not in self._numbers:
+            values = self.strings(column)
+            numbers = np.full(len(values), np.nan)
+            valid = ~self.is_na(column)
+            numbers[valid] = values[valid].astype(float)
+            self._numbers[column] = numbers
+        return self._numbers[column]
+
+    def is_na(self, column: str) -> np.ndarray:
+        if column not in self._na:
+            self._na[column] = np.isin(self.strings(column), NA_VALUES)
+        return self._na[column]
+
+    def _runA(self) -> np.ndarray:
+        if "runA_downstream_TTS" in self.fields:
+            runs = self._column("runA_downstream_TTS")
+            missing = np.isin(runs, NA_VALUES)
+        else:  # classification files written before the runA column existed
+            runs = np.full(len(self), "", dtype=object)
+            missing = np.ones(len(self), dtype=bool)
+        if missing.any():
+            seqs = self.strings("seq_A_downstream_TTS")[missing]
+            runs = runs.astype(object)
+            runs[missing] = [str(len(seq) - len(seq.lstrip("A"))) for seq in seqs]
+            runs = runs.astype(str)
+        return runs
+
+
+Condition = Callable[[ClassificationTable, Dict], np.ndarray]
+
+
+def _param(value, params: Dict):
+    if isinstance(value, str) and value.startswith("$"):
+        name = value[1:]
+        if name not in params:
+            raise ValueError(f"Undefined rule parameter {value}.")
+        return params[name]
+    return value
+
+
+def _compile_test(spec: Dict) -> Condition:
+    column, op = spec["column"], spec.get("op")
+    if op not in OPS:
+        raise ValueError(f"Unknown operator {op!r} for column {column}, use one of {sorted(OPS)}.")
+    divide_by, take_abs = spec.get("divide_by"), spec.get("abs", False)
+
+    def numbers(table):
+        values = table.numbers(column)
+        if take_abs:
+            values = np.abs(values)
+        return values / divide_by if divide_by is not None else values
+
+    if op == "is_na":
+        return lambda table, params: table.is_na(column)
+    if op == "not_na":
+        return lambda table, params: ~table.is_na(column)
+    if "value" not in spec:
+        raise ValueError(f"Operator {op} on column {column} needs a value.")
+    value = spec["value"]
+    if op in NUMERIC_OPS:
+        compare = NUMERIC_OPS[op]
+        # NA compares False
+        return lambda table, params: compare(numbers(table), float(_param(value, params)))
+    if op in ("in", "not_in"):
+        negate = op == "not_in"
+        return lambda table, params: np.isin(
+            table.strings(column), [str(_param(v, params)) for v in value]
+        ) ^ negate
+    negate = op == "!="
+
+    def equals(table, params):
+        v = _param(value, params)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            hits = numbers(table) == v
+        else:
+            hits = table.strings(column) == str(v)
+        return ~hits if negate else hits
+
+    return equals
+
+
+def compile_condition(spec: Dict, conditions: Dict[str, Condition]) -> Condition:
+    """
+    :param conditions: compiled shared conditions, for {"ref": name}
+    :return: function (table, params) --> boolean array, one value per row
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid condition {spec!r}.")
+    if "all" in spec or "any" in spec:
+        combine = np.logical_and if "all" in spec else np.logical_or
+        parts = [compile_condition(s, conditions) for s in spec["all" if "all" in spec else "any"]]
+        if not parts:
+            raise ValueError(f"Empty condition list in {spec!r}.")
+
+        def combined(table, params):
+            result = parts[0](table, params)
+            for part in parts[1:]:
+                result = combine(result, part(table, params))
+            return result
+
+        return combined
+    if "not" in spec:
+        part = compile_condition(spec["not"], conditions)
+        return lambda table, params: ~part(table, params)
+    if "ref" in spec:
+        if spec["ref"] not in conditions:
+            raise ValueError(f"Undefined condition {spec['ref']}.")
+        return conditions[spec["ref"]]
+    if "param" in spec:
+        name = spec["param"]
+        return lambda table, params: np.full(len(table), bool(_param(f"${name}", params)))
+    if "column" in spec:
+        return _compile_test(spec)
+    raise ValueError(f"Invalid condition {spec!r}.")
+
+
+class CompiledRules:
+    def __init__(self, ruleset: Dict, aliases: Optional[Dict[str, str]] = None):
+        """
+        :param ruleset: rule set, see the module documentation
+        :param aliases: structural_category --> short name (ex: CATEGORY_DICT), both can be used as rule keys
+        """
+        self.ruleset = ruleset
+        self.params = dict(ruleset.get("params", {}))
+        self.aliases = aliases or {}
+        conditions = {}
+        for name, spec in ruleset.get("conditions", {}).items():
+            conditions[name] = compile_condition(spec, conditions)
+        self.rules = {}  # category or "default" --> [(reason, condition)]
+        for category, rules in ruleset.get("rules", {}).items():
+            self.rules[category] = [
+                (rule["reason"], compile_condition(rule["when"], conditions))
+                for rule in rules
+            ]
+        self.reasons = sorted({reason for rules in self.rules.values() for reason, _ in rules})
+
+    def rules_for(self, category: str):
+        if category in self.rules:
+            return self.rules[category]
+        if self.aliases.get(category) in self.rules:
+            return self.rules[self.aliases[category]]
+        return self.rules.get("default", [])
+
+    def evaluate(self, table: ClassificationTable, params: Optional[Dict] = None) -> np.ndarray:
+        """
+        :param params: (optional) parameter values overriding those of the rule set
+        :return: reason to filter every row out, "" for the rows kept
+        """
+        params = dict(self.params, **(params or {}))
+        categories = table.strings("structural_category")
+        reasons = np.full(len(table), "", dtype=object)
+        for category in np.unique(categories):
+            todo = categories == category
+            for reason, condition in self.rules_for(category):
+                hits = todo & condition(table, params)
+                reasons[hits] = reason
+                todo &= ~hits
+        return reasons
+
+
+def load_rules(filename: Optional[str] = None) -> Dict:
+    """
+    :param filename: JSON or YAML (.yaml/.yml) rule set, None for DEFAULT_RULES
+    """
+    if filename is None:
+        return DEFAULT_RULES
+    with open(filename) as f:
+        if filename.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                logger = logging.getLogger("sqanti3_qc")
+                logger.error(
+                    "Reading YAML rule sets requires PyYAML (pip install sqanti3[yaml]). Abort!"
+                )
+                raise
+            return yaml.safe_load(f)
+        return json.load(f)
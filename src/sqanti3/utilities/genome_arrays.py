@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Byte-array view of the genome for batched sequence lookups.
+
+Isoforms are classified chromosome by chromosome, so GenomeArrays keeps the
+sequence of the current chromosome as a numpy uint8 array and slices fixed-width
+windows for many positions at once, instead of creating a SeqRecord slice (and
+a reverse complement) for every isoform. Case is kept as in the FASTA file, use
+to_upper() where the lookup is case-insensitive.
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# byte used to pad windows that run off either end of the chromosome
+PAD = 0
+
+_complement_from = b"ACGTUMRWSYKVHDBNacgtumrwsykvhdbn"
+_complement_to = b"TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn"
+COMPLEMENT = np.frombuffer(
+    bytes.maketrans(_complement_from, _complement_to), dtype=np.uint8
+)
+UPPER = np.frombuffer(
+    bytes.maketrans(
+        b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    ),
+    dtype=np.uint8,
+)
+
+
+def to_upper(arr: np.ndarray) -> np.ndarray:
+    return UPPER[arr]
+
+
+def reverse_complement(arr: np.ndarray) -> np.ndarray:
+    """
+    :param arr: 2-D uint8 array, one sequence per row
+    :return: reverse complement of every row
+    """
+    return COMPLEMENT[arr[:, ::-1]]
+
+
+def as_strings(arr: np.ndarray) -> List[str]:
+    """
+    :return: the rows of a uint8 array as str, padding removed
+    """
+    return [row.tobytes().decode("ascii").strip("\x00") for row in arr]
+
+
+class GenomeArrays:
+    def __init__(self, genome_dict: Dict):
+        """
+        :param genome_dict: dict of chrom --> SeqRecord
+        """
+        self.genome_dict = genome_dict
+        self._chrom = None
+        self._seq = None
+
+    def seq(self, chrom: str) -> np.ndarray:
+        """
+        :return: sequence of chrom as uint8 array, only the last chromosome asked for is cached
+        """
+        if chrom != self._chrom:
+            self._seq = np.frombuffer(
+                str(self.genome_dict[chrom].seq).encode("ascii"), dtype=np.uint8
+            )
+            self._chrom = chrom
+        return self._seq
+
+    def windows(
+        self, chrom: str, starts, width: int, reverse=None
+    ) -> np.ndarray:
+        """
+        Gather fixed-width windows [start, start + width) of one chromosome
+        Bases before 0 or past the chromosome end are set to PAD.
+        :param starts: 0-based window starts
+        :param reverse: (optional) boolean per window, reverse complement those windows
+        :return: uint8 array of shape (len(starts), width)
+        """
+        seq = self.seq(chrom)
+        starts = np.asarray(starts, dtype=np.int64)
+        idx = starts[:, None] + np.arange(width, dtype=np.int64)[None, :]
+        inside = (idx >= 0) & (idx < len(seq))
+        out = np.full(idx.shape, PAD, dtype=np.uint8)
+        out[inside] = seq[idx[inside]]
+        if reverse is not None:
+            reverse = np.asarray(reverse, dtype=bool)
+            out[reverse] = reverse_complement(out[reverse])
+        return out
+
+
+def find_motifs(
+    windows: np.ndarray, motif_list: List[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the best-ranked motif present in every window, and its first position
+    Matching is case-sensitive, PAD never matches.
+    :param windows: uint8 array, one oriented sequence per row
+    :param motif_list: ranked list of motifs
+    :return: (index in motif_list, 0-based position in the window) per row, -1 if no motif found
+    """
+    n, width = windows.shape
+    best = np.full(n, -1, dtype=np.int64)
+    pos = np.full(n, -1, dtype=np.int64)
+    for rank, motif in enumerate(motif_list):
+        k = len(motif)
+        todo = np.flatnonzero(best < 0)
+        if len(todo) == 0:
+            break
+        if k == 0:
+            # an empty motif is found right at the start, as with str.find
+            best[todo], pos[todo] = rank, 0
+            break
+        if k > width:
+            continue
+        pattern = np.frombuffer(motif.encode("ascii"), dtype=np.uint8)
+        kmers = windows[todo][:, np.arange(width - k + 1)[:, None] + np.arange(k)]
+        hits = (kmers == pattern).all(axis=2)
+        found = hits.any(axis=1)
+        best[todo[found]] = rank
+        pos[todo[found]] = hits[found].argmax(axis=1)
+    return best, pos
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Prebuilt, memory-mappable indexes of peak BED files (CAGE peaks, polyA sites).
+
+The peaks of every (chrom, strand) are stored as start-sorted slices of three
+concatenated arrays (start, end, tss) saved as .npy files in a directory next
+to the BED file, together with a JSON manifest giving the offset and length of
+each slice. The index is built once and then mapped read-only by every run and
+every chunk worker, instead of reparsing the BED file each time.
+
+Layout of <bed>.idx/:
+    manifest.json   source size/mtime, tss column, (chrom, strand) slices
+    start.npy       0-based peak starts
+    end.npy         1-based peak ends
+    tss.npy         0-based representative position (only if a tss column is used)
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import defaultdict, namedtuple
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+PEAK_INDEX_VERSION = 1
+PEAK_INDEX_SUFFIX = ".idx"
+# times an index replaced by another process while being loaded is read again
+INDEX_LOAD_ATTEMPTS = 3
+
+PeakArrays = namedtuple("PeakArrays", ["start", "end", "tss", "max_len"])
+
+
+def sort_peak_arrays(starts, ends, tss=None) -> PeakArrays:
+    """
+    Convert the peaks of one (chrom, strand) into arrays sorted by start
+    :param starts: 0-based peak starts
+    :param ends: 1-based peak ends
+    :param tss: (optional) 0-based representative position of each peak
+    :return: PeakArrays, ties in start keep the BED file order
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    order = np.argsort(starts, kind="stable")
+    return PeakArrays(
+        start   = starts[order],
+        end     = ends[order],
+        tss     = np.asarray(tss, dtype=np.int64)[order] if tss is not None else None,
+        max_len = int((ends - starts).max()) if len(starts) > 0 else 0,
+    )
+
+
+def read_peak_bed(
+    bed_filename: str, tss_column: Optional[int] = None
+) -> Dict[Tuple[str, str], PeakArrays]:
+    """
+    Parse a peak BED file
+    :param bed_filename: BED6+ file, strand in the 6th column
+    :param tss_column: (optional) 0-based column holding the representative position of the peak
+    :return: dict of (chrom, strand) --> PeakArrays
+    """
+    peaks = defaultdict(lambda: ([], [], []))  # (chrom,strand) --> starts, ends, tss
+    with open(bed_filename) as f:
+        for line in f:
+            raw = line.split()
+            starts, ends, tss = peaks[(raw[0], raw[5])]
+            starts.append(int(raw[1]))
+            ends.append(int(raw[2]))
+            if tss_column is not None:
+                tss.append(int(raw[tss_column]))
+    return {
+        k: sort_peak_arrays(starts, ends, tss if tss_column is not None else None)
+        for k, (starts, ends, tss) in peaks.items()
+    }
+
+
+def peak_index_path(bed_filename: str) -> str:
+    return f"{bed_filename}{PEAK_INDEX_SUFFIX}"
+
+
+def source_stamp(bed_filename: str) -> dict:
+    st = os.stat(bed_filename)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def read_manifest(index_dir: str) -> Optional[dict]:
+    """
+    :return: manifest of an index directory, None if it is missing (ex: being replaced)
+    """
+    try:
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_index_dir(
+    index_dir: str,
+    manifest: dict,
+    write_files: Callable[[str], None],
+    is_current: Callable[[], bool],
+) -> str:
+    """
+    Write an index directory atomically: write_files(tmp_dir) writes the data files
+    into a temporary directory next to index_dir, then the manifest is added and
+    the directory moved in place, so concurrent readers never see a partial index.
+    :param is_current: function () --> True if an up to date index is in place
+    :return: index_dir
+    :raise OSError: if the index cannot be written
+    """
+    tmp_dir = tempfile.mkdtemp(
+        prefix=f".{os.path.basename(index_dir)}.",
+        dir=os.path.dirname(os.path.abspath(index_dir)),
+    )
+    try:
+        write_files(tmp_dir)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, index_dir)
+        except OSError:
+            # another process moved its own copy in first
+            if not is_current():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return index_dir
+
+
+def peak_index_is_current(
+    bed_filename: str, tss_column: Optional[int] = None
+) -> bool:
+    """
+    :return: True if the index of bed_filename exists and was built from the current file
+    """
+    manifest = read_manifest(peak_index_path(bed_filename))
+    return (
+        manifest is not None
+        and manifest.get("version") == PEAK_INDEX_VERSION
+        and manifest.get("tss_column") == tss_column
+        and manifest.get("source") == source_stamp(bed_filename)
+    )
+
+
+def build_peak_index(bed_filename: str, tss_column: Optional[int] = None) -> str:
+    """
+    Compile a peak BED file into its on-disk index, unless an up to date one exists
+    The index is written to a temporary directory and moved in place, so concurrent
+    readers never see a partial index.
+    :param bed_filename: BED6+ file
+    :param tss_column: (optional) 0-based column holding the representative position of the peak
+    :return: path of the index directory
+    :raise OSError: if the index cannot be written next to the BED file
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    index_dir = peak_index_path(bed_filename)
+    if peak_index_is_current(bed_filename, tss_column):
+        return index_dir
+
+    logger.info(f"**** Building peak index for {bed_filename}...")
+    stamp = source_stamp(bed_filename)
+    peaks = read_peak_bed(bed_filename, tss_column)
+
+    keys, offset = [], 0
+    for (chrom, strand), arrays in sorted(peaks.items()):
+        keys.append([chrom, strand, offset, len(arrays.start), arrays.max_len])
+        offset += len(arrays.start)
+    ordered = [peaks[(chrom, strand)] for chrom, strand, *_ in keys]
+
+    def write_files(tmp_dir):
+        columns = ["start", "end"] + (["tss"] if tss_column is not None else [])
+        for column in columns:
+            data = [getattr(arrays, column) for arrays in ordered]
+            np.save(
+                os.path.join(tmp_dir, f"{column}.npy"),
+                np.concatenate(data) if data else np.empty(0, dtype=np.int64),
+            )
+
+    return write_index_dir(
+        index_dir,
+        {
+            "version"   : PEAK_INDEX_VERSION,
+            "source"    : stamp,
+            "tss_column": tss_column,
+            "keys"      : keys,
+        },
+        write_files,
+        lambda: peak_index_is_current(bed_filename, tss_column),
+    )
+
+
+def load_peak_index(
+    bed_filename: str, tss_column: Optional[int] = None
+) -> Dict[Tuple[str, str], PeakArrays]:
+    """
+    Load the peaks of a BED file from its memory-mapped index, building it first if needed
+    Falls back to parsing the BED file in memory if the index cannot be written, or
+    keeps being replaced by other processes while it is loaded.
+    :param bed_filename: BED6+ file
+    :param tss_column: (optional) 0-based column holding the representative position of the peak
+    :return: dict of (chrom, strand) --> PeakArrays (read-only views on the index)
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    for _ in range(INDEX_LOAD_ATTEMPTS):
+        try:
+            index_dir = build_peak_index(bed_filename, tss_column)
+        except OSError as e:
+            logger.warning(
+                f"Unable to write peak index for {bed_filename} ({e}), reading it in memory."
+            )
+            return read_peak_bed(bed_filename, tss_column)
+        manifest = read_manifest(index_dir)
+        if manifest is None:  # another process is replacing the index
+            continue
+        try:
+            data = {
+                column: np.load(os.path.join(index_dir, f"{column}.npy"), mmap_mode="r")
+                for column in ("start", "end", "tss")
+                if column != "tss" or tss_column is not None
+            }
+        except OSError:
+            continue
+        return _peak_slices(manifest, data, tss_column)
+    logger.warning(
+        f"Peak index for {bed_filename} kept changing while loading it, reading it in memory."
+    )
+    return read_peak_bed(bed_filename, tss_column)
+
+
+def _peak_slices(
+    manifest: dict, data: Dict[str, np.ndarray], tss_column: Optional[int]
+) -> Dict[Tuple[str, str], PeakArrays]:
+    peaks = {}
+    for chrom, strand, offset, length, max_len in manifest["keys"]:
+        s = slice(offset, offset + length)
+        peaks[(chrom, strand)] = PeakArrays(
+            start   = data["start"][s],
+            end     = data["end"][s],
+            tss     = data["tss"][s] if tss_column is not None else None,
+            max_len = max_len,
+        )
+    return peaks
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+Per-stage run profile of sqanti3_qc.
+
+Every stage of a run (genome load, alignment, classification, report...) is
+wrapped in StageProfiler.stage(), which records its wall time, CPU time of the
+process and of its finished child processes (aligners, GeneMarkS-T, Rscript),
+peak resident set size and, when the stage sets it, the number of records it
+handled. The profile is written as <output>.run_profile.json and
+<output>.run_profile.tsv next to <output>.params.txt, also when a stage fails.
+With --chunks, the profiles of the workers are attached to the main one, their
+stages are listed as chunk<i>/<stage> in the TSV.
+
+With --profile, the hot stages (indels, classification, RTS) also run under
+cProfile and the classification time of every isoform is recorded:
+    <output>.profile.pstats                 cProfile statistics (pstats / snakeviz)
+    <output>.profile_functions.txt          top functions by cumulative time
+    <output>.isoform_latency.tsv            time of every isoform, slowest first
+    <output>.isoform_latency_summary.tsv    latency histogram per category and exon count
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RUN_PROFILE_VERSION = 1
+PROFILE_FIELDS = [
+    "stage",
+    "status",
+    "wall_s",
+    "cpu_s",
+    "child_cpu_s",
+    "peak_rss_mb",
+    "child_peak_rss_mb",
+    "records",
+]
+LATENCY_FIELDS = ["isoform", "chrom", "structural_category", "exons", "seconds"]
+# upper edges (seconds) of the latency histogram bins, the last bin is open
+LATENCY_BINS = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1, 10]
+# exon count groups of the latency summary: (first, last), last None is open
+EXON_GROUPS = [(1, 1), (2, 3), (4, 7), (8, 15), (16, None)]
+# number of functions listed in <output>.profile_functions.txt
+TOP_FUNCTIONS = 50
+
+
+def _rusage_mb(rusage) -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    return rusage.ru_maxrss / scale
+
+
+def peak_rss_mb() -> float:
+    """
+    :return: peak resident set size of this process so far, in MB
+    """
+    return _rusage_mb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def _exon_group_name(first: int, last: Optional[int]) -> str:
+    if last is None:
+        return f"{first}+"
+    return str(first) if first == last else f"{first}-{last}"
+
+
+EXON_GROUP_NAMES = [_exon_group_name(first, last) for first, last in EXON_GROUPS]
+
+
+def _exon_group(exons: int) -> str:
+    for (_, last), name in zip(EXON_GROUPS, EXON_GROUP_NAMES):
+        if last is None or exons <= last:
+            return name
+
+
+def latency_bin_names() -> List[str]:
+    """
+    :return: column names of the latency histogram bins, ex: "<=1ms"
+    """
+
+    def fmt(x):
+        if x < 1e-3:
+            return f"{x * 1e6:g}us"
+        return f"{x * 1e3:g}ms" if x < 1 else f"{x:g}s"
+
+    return [f"<={fmt(x)}" for x in LATENCY_BINS] + [f">{fmt(LATENCY_BINS[-1])}"]
+
+
+class IsoformLatency:
+    """
+    Classification time of every isoform
+    """
+
+    def __init__(self):
+        self.rows = []  # (isoform, chrom, category, exons, seconds)
+
+    def add(self, isoform: str, chrom: str, category: str, exons: int, seconds: float):
+        self.rows.append((isoform, chrom, category, exons, seconds))
+
+    def read(self, filename: str) -> None:
+        """
+        Add the isoforms of an <output>.isoform_latency.tsv file
+        """
+        with open(filename) as f:
+            f.readline()
+            for line in f:
+                isoform, chrom, category, exons, seconds = line.rstrip("\n").split("\t")
+                self.add(isoform, chrom, category, int(exons), float(seconds))
+
+    def summary(self) -> List[Dict]:
+        """
+        :return: one row per (structural_category, exon group) and per category ("all" exons)
+        """
+        groups = defaultdict(list)
+        for _, _, category, exons, seconds in self.rows:
+            groups[(category, _exon_group(exons))].append(seconds)
+            groups[(category, "all")].append(seconds)
+        edges = np.array(LATENCY_BINS)
+        rows = []
+        order = {name: i for i, name in enumerate(EXON_GROUP_NAMES + ["all"])}
+        for (category, exons), seconds in sorted(
+            groups.items(), key=lambda kv: (kv[0][0], order[kv[0][1]])
+        ):
+            seconds = np.array(seconds)
+            counts = np.bincount(
+                np.searchsorted(edges, seconds, side="left"), minlength=len(edges) + 1
+            )
+            row = {
+                "structural_category": category,
+                "exons"              : exons,
+                "n"                  : len(seconds),
+                "total_s"            : seconds.sum(),
+                "mean_s"             : seconds.mean(),
+                "p50_s"              : np.percentile(seconds, 50),
+                "p90_s"              : np.percentile(seconds, 90),
+                "p99_s"              : np.percentile(seconds, 99),
+                "max_s"              : seconds.max(),
+            }
+            row.update(zip(latency_bin_names(), counts.tolist()))
+            rows.append(row)
+        return rows
+
+    def write(self, prefix: str) -> None:
+        rows = sorted(self.rows, key=lambda r: r[-1], reverse=True)
+        with open(f"{prefix}.isoform_latency.tsv", "w") as f:
+            f.write("\t".join(LATENCY_FIELDS) + "\n")
+            for isoform, chrom, category, exons, seconds in rows:
+                f.write(f"{isoform}\t{chrom}\t{category}\t{exons}\t{seconds:.6g}\n")
+        summary = self.summary()
+        fields = list(summary[0]) if summary else ["structural_category", "exons", "n"]
+        with open(f"{prefix}.isoform_latency_summary.tsv", "w") as f:
+            f.write("\t".join(fields) + "\n")
+            for row in summary:
+                f.write(
+                    "\t".join(
+                        f"{row[k]:.6g}" if isinstance(row[k], float) else str(row[k])
+                        for k in fields
+                    )
+                    + "\n"
+                )
+
+
+class StageProfiler:
+    def __init__(self, prefix: Optional[str] = None, cprofile: bool = False):
+        """
+        :param prefix: (optional) path prefix of the profile files, nothing is written if None
+        :param cprofile: run the hot stages under cProfile and record per-isoform latency
+        """
+        self.prefix = prefix
+        self.stages: List[Dict] = []
+        self.chunks: List[Dict] = []
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.latency = IsoformLatency() if cprofile else None
+        self._pstats_files = []  # cProfile dumps of the --chunks workers
+        self._profiled = False
+
+    @contextmanager
+    def stage(self, name: str, hot: bool = False):
+        """
+        Profile the enclosed block as stage `name`
+        The yielded dict can be given a "records" count. If the block raises
+        (including sys.exit), the stage is marked "failed" and the profile
+        collected so far is written before the exception propagates.
+        :param hot: run the stage under cProfile, if enabled
+        """
+        record = {"stage": name, "status": "ok", "records": None}
+        wall, cpu = time.perf_counter(), time.process_time()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        hot = hot and self.cprofile is not None
+        if hot:
+            self.cprofile.enable()
+            self._profiled = True
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            if hot:
+                self.cprofile.disable()
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            record["wall_s"] = round(time.perf_counter() - wall, 6)
+            record["cpu_s"] = round(time.process_time() - cpu, 6)
+            record["child_cpu_s"] = round(
+                after.ru_utime + after.ru_stime - children.ru_utime - children.ru_stime,
+                6,
+            )
+            record["peak_rss_mb"] = round(peak_rss_mb(), 3)
+            record["child_peak_rss_mb"] = round(_rusage_mb(after), 3)
+            self.stages.append(record)
+            if record["status"] == "failed":
+                self.write()
+
+    def add_chunks(self, prefixes: List[str]) -> None:
+        """
+        Attach the run profiles written by the --chunks workers
+        :param prefixes: <split_dir>/<output> of every chunk, in order
+        """
+        logger = logging.getLogger("sqanti3_qc")
+        for i, prefix in enumerate(prefixes):
+            try:
+                with open(f"{prefix}.run_profile.json") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Unable to read run profile of chunk {i} ({e}).")
+                continue
+            profile["chunk"] = i
+            self.chunks.append(profile)
+            if self.cprofile is not None:
+                if os.path.exists(f"{prefix}.profile.pstats"):
+                    self._pstats_files.append(f"{prefix}.profile.pstats")
+                if os.path.exists(f"{prefix}.isoform_latency.tsv"):
+                    self.latency.read(f"{prefix}.isoform_latency.tsv")
+
+    def write_hot_profile(self) -> None:
+        """
+        Write the cProfile statistics and the per-isoform latency of the hot stages
+        """
+        sources = ([self.cprofile] if self._profiled else []) + self._pstats_files
+        if sources:
+            stats = pstats.Stats(*sources)
+            stats.dump_stats(f"{self.prefix}.profile.pstats")
+            with open(f"{self.prefix}.profile_functions.txt", "w") as f:
+                stats.stream = f
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        self.latency.write(self.prefix)
+
+    def as_dict(self) -> Dict:
+        return {
+            "version"     : RUN_PROFILE_VERSION,
+            "start"       : time.strftime(
+                "%Y-%m-%dT%H:%M:%S%z", time.localtime(self.start_time)
+            ),
+            "total_wall_s": round(time.perf_counter() - self._start, 6),
+            "peak_rss_mb" : round(peak_rss_mb(), 3),
+            "stages"      : [
+                {k: r[k] for k in PROFILE_FIELDS} for r in self.stages
+            ],
+            "chunks"      : self.chunks,
+        }
+
+    def write(self) -> None:
+        """
+        Write <prefix>.run_profile.json and <prefix>.run_profile.tsv
+        """
+        if self.prefix is None:
+            return
+        logger = logging.getLogger("sqanti3_qc")
+        profile = self.as_dict()
+        try:
+            with open(f"{self.prefix}.run_profile.json", "w") as f:
+                json.dump(profile, f, indent=2)
+            with open(f"{self.prefix}.run_profile.tsv", "w") as f:
+                f.write("\t".join(PROFILE_FIELDS) + "\n")
+                rows = list(profile["stages"])
+                for chunk in self.chunks:
+                    rows.extend(
+                        dict(r, stage=f"chunk{chunk['chunk']}/{r['stage']}")
+                        for r in chunk["stages"]
+                    )
+                for r in rows:
+                    f.write(
+                        "\t".join(
+                            "NA" if r[k] is None else str(r[k]) for k in PROFILE_FIELDS
+                        )
+                        + "\n"
+                    )
+            if self.cprofile is not None:
+                self.write_hot_profile()
+        except OSError as e:
+            logger.warning(
+                f"Unable to write run profile {self.prefix}.run_profile.* ({e})."
+            )
+            return
+        logger.info(f"Run profile written to {self.prefix}.run_profile.json")
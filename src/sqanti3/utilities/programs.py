@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""
+Lookup of the external programs run by SQANTI3 (gtfToGenePred, gffread, Rscript...).
+
+Programs are searched in PATH when a stage first needs them, not when the
+modules are imported, so that `--help` and the filter-only path do not pay
+for it.
+"""
+
+import shutil
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def find_program(name: str) -> Optional[str]:
+    """
+    :return: path of the executable `name` in PATH, None if not found
+    """
+    return shutil.which(name)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Indexed access to per-base score tracks (phyloP conservation and the like).
+
+Two on-disk formats are supported:
+    bigWig (.bw/.bigwig)  read through pyBigWig (optional dependency)
+    BED                   compiled once into one float32 .npy array per chromosome,
+                          stored in <bed>.scores/ and memory-mapped read-only
+
+Both expose get_many(chrom, positions), which fetches the scores of many 0-based
+positions of one chromosome with a single vectorized gather. Positions without
+a score come back as NaN.
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from typing import Dict
+
+import numpy as np
+
+from sqanti3.utilities.peak_index import (
+    INDEX_LOAD_ATTEMPTS,
+    read_manifest,
+    source_stamp,
+    write_index_dir,
+)
+
+SCORE_TRACK_VERSION = 1
+SCORE_TRACK_SUFFIX = ".scores"
+BIGWIG_EXTENSIONS = (".bw", ".bigwig")
+
+# BED lines parsed per block when compiling a score track
+SCORE_BED_BLOCK = 1000000
+# positions closer than this are fetched from a bigWig with a single range query
+BIGWIG_MERGE_GAP = 10000
+
+
+def format_score(score) -> str:
+    """
+    :return: shortest text of a float32 score ("3", "0.064", "-1.25"), as written in
+        the score BED file, "NA" if missing
+    """
+    if np.isnan(score):
+        return "NA"
+    return np.format_float_positional(np.float32(score), trim="-")
+
+
+class BigWigTrack:
+    def __init__(self, bigwig_filename):
+        try:
+            import pyBigWig
+        except ImportError:
+            logger = logging.getLogger("sqanti3_qc")
+            logger.error(
+                "Reading bigWig score tracks requires pyBigWig (pip install sqanti3[bigwig]). Abort!"
+            )
+            raise
+        self.bigwig_filename = bigwig_filename
+        self.bw = pyBigWig.open(bigwig_filename)
+        self.chrom_sizes = self.bw.chroms()
+
+    def get_many(self, chrom, positions) -> np.ndarray:
+        """
+        :param chrom: chromosome name
+        :param positions: 0-based positions
+        :return: float array of scores, NaN where missing
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        scores = np.full(len(positions), np.nan, dtype=np.float32)
+        chrom_size = self.chrom_sizes.get(chrom)
+        if chrom_size is None or len(positions) == 0:
+            return scores
+        valid = np.flatnonzero((positions >= 0) & (positions < chrom_size))
+        order = valid[np.argsort(positions[valid], kind="stable")]
+        sorted_pos = positions[order]
+        # split into clusters of nearby positions, one range query per cluster
+        breaks = np.flatnonzero(np.diff(sorted_pos) > BIGWIG_MERGE_GAP) + 1
+        for idx in np.split(np.arange(len(order)), breaks):
+            if len(idx) == 0:
+                continue
+            lo, hi = int(sorted_pos[idx[0]]), int(sorted_pos[idx[-1]]) + 1
+            values = np.asarray(self.bw.values(chrom, lo, hi, numpy=True))
+            scores[order[idx]] = values[sorted_pos[idx] - lo]
+        return scores
+
+
+class MemmapTrack:
+    def __init__(self, bed_filename):
+        self.bed_filename = bed_filename
+        self.scores = load_score_index(bed_filename)  # chrom --> float32 array
+
+    def get_many(self, chrom, positions) -> np.ndarray:
+        """
+        :param chrom: chromosome name
+        :param positions: 0-based positions
+        :return: float array of scores, NaN where missing
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        track = self.scores.get(chrom)
+        if track is None:
+            return np.full(len(positions), np.nan, dtype=np.float32)
+        valid = (positions >= 0) & (positions < len(track))
+        scores = np.full(len(positions), np.nan, dtype=np.float32)
+        scores[valid] = track[positions[valid]]
+        return scores
+
+
+def open_score_track(filename):
+    """
+    :param filename: bigWig file, or BED file of per-base scores (score in the 4th column)
+    :return: BigWigTrack or MemmapTrack
+    """
+    if is_bigwig(filename):
+        return BigWigTrack(filename)
+    return MemmapTrack(filename)
+
+
+def is_bigwig(filename: str) -> bool:
+    return filename.lower().endswith(BIGWIG_EXTENSIONS)
+
+
+def score_index_path(bed_filename: str) -> str:
+    return f"{bed_filename}{SCORE_TRACK_SUFFIX}"
+
+
+def score_index_is_current(bed_filename: str) -> bool:
+    """
+    :return: True if the index of bed_filename exists and was built from the current file
+    """
+    manifest = read_manifest(score_index_path(bed_filename))
+    return (
+        manifest is not None
+        and manifest.get("version") == SCORE_TRACK_VERSION
+        and manifest.get("source") == source_stamp(bed_filename)
+    )
+
+
+def _iter_bed_blocks(bed_filename):
+    """
+    Yield (chrom, starts, ends, scores) arrays for runs of consecutive lines on the same chromosome
+    """
+    chrom, starts, ends, scores = None, [], [], []
+    with open(bed_filename) as f:
+        for line in f:
+            raw = line.split()
+            if not raw or raw[0] in ("track", "browser") or raw[0].startswith("#"):
+                continue
+            if raw[0] != chrom or len(starts) >= SCORE_BED_BLOCK:
+                if starts:
+                    yield chrom, np.array(starts), np.array(ends), np.array(scores)
+                chrom, starts, ends, scores = raw[0], [], [], []
+            starts.append(int(raw[1]))
+            ends.append(int(raw[2]))
+            scores.append(float(raw[3]))
+    if starts:
+        yield chrom, np.array(starts), np.array(ends), np.array(scores)
+
+
+def build_score_index(bed_filename: str, index_dir: str = None) -> str:
+    """
+    Compile a per-base score BED file into one float32 array per chromosome
+    The file is read twice: once for the chromosome lengths, once to fill the arrays.
+    :param bed_filename: BED file of scored intervals (usually 1 bp each), score in the 4th column
+    :param index_dir: (optional) where to write the index, default <bed>.scores/
+    :return: path of the index directory
+    :raise OSError: if the index cannot be written
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    if index_dir is None:
+        index_dir = score_index_path(bed_filename)
+        if score_index_is_current(bed_filename):
+            return index_dir
+
+    logger.info(f"**** Building score track index for {bed_filename}...")
+    stamp = source_stamp(bed_filename)
+    chrom_sizes = defaultdict(lambda: 0)
+    for chrom, _, ends, _ in _iter_bed_blocks(bed_filename):
+        chrom_sizes[chrom] = max(chrom_sizes[chrom], int(ends.max()))
+
+    files = {chrom: f"{i}.npy" for i, chrom in enumerate(sorted(chrom_sizes))}
+
+    def write_files(tmp_dir):
+        tracks = {}
+        for chrom, size in chrom_sizes.items():
+            tracks[chrom] = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, files[chrom]),
+                mode="w+",
+                dtype=np.float32,
+                shape=(size,),
+            )
+            tracks[chrom][:] = np.nan
+        for chrom, starts, ends, scores in _iter_bed_blocks(bed_filename):
+            lengths = ends - starts
+            if (lengths == 1).all():
+                tracks[chrom][starts] = scores
+            else:
+                offsets = np.arange(lengths.sum()) - np.repeat(
+                    np.cumsum(lengths) - lengths, lengths
+                )
+                tracks[chrom][np.repeat(starts, lengths) + offsets] = np.repeat(
+                    scores, lengths
+                )
+        for track in tracks.values():
+            track.flush()
+
+    return write_index_dir(
+        index_dir,
+        {"version": SCORE_TRACK_VERSION, "source": stamp, "files": files},
+        write_files,
+        lambda: score_index_is_current(bed_filename),
+    )
+
+
+def load_score_index(bed_filename: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the per-chromosome score arrays of a BED file, building the index first if needed
+    If the index cannot be written next to the BED file, or keeps being replaced by
+    other processes while it is loaded, it is built in a temporary directory,
+    removed when the process exits.
+    :return: dict of chrom --> read-only float32 array indexed by 0-based position
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    for _ in range(INDEX_LOAD_ATTEMPTS):
+        try:
+            index_dir = build_score_index(bed_filename)
+        except OSError as e:
+            logger.warning(
+                f"Unable to write score index for {bed_filename} ({e}), using a temporary one."
+            )
+            break
+        manifest = read_manifest(index_dir)
+        if manifest is None:  # another process is replacing the index
+            continue
+        try:
+            return _memmap_scores(index_dir, manifest)
+        except OSError:
+            continue
+    else:
+        logger.warning(
+            f"Score index for {bed_filename} kept changing while loading it, using a temporary one."
+        )
+
+    tmp_dir = tempfile.mkdtemp(prefix="sqanti3_scores.")
+    atexit.register(shutil.rmtree, tmp_dir, ignore_errors=True)
+    index_dir = build_score_index(
+        bed_filename,
+        os.path.join(tmp_dir, os.path.basename(score_index_path(bed_filename))),
+    )
+    return _memmap_scores(index_dir, read_manifest(index_dir))
+
+
+def _memmap_scores(index_dir: str, manifest: dict) -> Dict[str, np.ndarray]:
+    return {
+        chrom: np.load(os.path.join(index_dir, name), mmap_mode="r")
+        for chrom, name in manifest["files"].items()
+    }
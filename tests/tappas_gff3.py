@@ -0,0 +1,55 @@
+"""
+Synthetic tappAS GFF3 annotations, for the IsoAnnotLite tests and benchmark
+"""
+
+import random
+
+EXONS = 10
+EXON_LEN = 150
+INTRON_LEN = 1000
+
+
+def write_tappas_gff3(
+    filename: str, n_transcripts: int, features_per_transcript: int, seed: int = 0
+) -> int:
+    """
+    Write a tappAS-like GFF3: per transcript, the tappAS transcript/gene/CDS/
+    protein/genomic/exon lines and features_per_transcript protein (P),
+    transcript (T) and ontology (N) features
+    :return: number of lines written
+    """
+    rng = random.Random(seed)
+    length = EXONS * EXON_LEN
+    n_lines = 0
+    with open(filename, "w") as f:
+        for i in range(n_transcripts):
+            trans = f"ENST{i:011d}"
+            strand = "+" if i % 2 else "-"
+            lines = [
+                f"transcript\t1\t{length}\t.\t{strand}\t.\tID={trans}; primary_class=coding",
+                f"gene\t1\t{length}\t.\t{strand}\t.\tID=ENSG{i:011d}; Name=G{i}; Desc=G{i}",
+                f"CDS\t{EXON_LEN + 1}\t{length - EXON_LEN}\t.\t{strand}\t.\tID=Protein_{trans}",
+                f"protein\t1\t{(length - 2 * EXON_LEN) // 3}\t.\t{strand}\t.\tID=Protein_{trans}",
+                f"genomic\t1\t1\t.\t{strand}\t.\tChr=chr1",
+            ]
+            start = 1 + i * EXONS * (EXON_LEN + INTRON_LEN)
+            for e in range(EXONS):
+                exon_start = start + e * (EXON_LEN + INTRON_LEN)
+                lines.append(
+                    f"exon\t{exon_start}\t{exon_start + EXON_LEN - 1}\t.\t{strand}\t.\tChr=chr1"
+                )
+            f.writelines(f"{trans}\ttappAS\t{line}\n" for line in lines)
+            n_lines += len(lines)
+            for k in range(features_per_transcript):
+                kind = k % 3
+                if kind == 0:
+                    s = rng.randint(1, 350)
+                    line = f"PFAM\tDOMAIN\t{s}\t{s + 40}\t.\t{strand}\t.\tID=PF{k:05d}; Name=d; Desc=d; PosType=P"
+                elif kind == 1:
+                    s = rng.randint(1, length - 30)
+                    line = f"miRWalk\tmiRNA_Binding\t{s}\t{s + 20}\t.\t{strand}\t.\tID=miR{k}; Name=m; Desc=m; PosType=T"
+                else:
+                    line = f"GeneOntology\tC\t.\t.\t.\t{strand}\t.\tID=GO:{k:07d}; Name=c; Desc=c; PosType=N"
+                f.write(f"{trans}\t{line}\n")
+            n_lines += features_per_transcript
+    return n_lines
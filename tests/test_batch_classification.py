@@ -0,0 +1,219 @@
+import logging
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from bx.intervals.intersection import IntervalTree
+from sqanti3.sqanti3_qc import (
+    FIELDS_CLASS,
+    batch_intrapriming,
+    batch_splice_sites,
+    genePredRecord,
+    gene_sites,
+    myQueryTranscripts,
+    nearest_gene_sites_diff,
+    nearest_site_diff,
+    sort_genes_by_start,
+)
+from sqanti3.utilities.genome_arrays import GenomeArrays
+
+logging.basicConfig(level=logging.CRITICAL)
+
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCAntgcan")
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+class Seq(str):
+    """
+    Slicing and reverse_complement of a Bio.Seq.Seq, enough for genePredRecord.get_splice_site
+    """
+
+    def __getitem__(self, key):
+        return Seq(str.__getitem__(self, key))
+
+    def reverse_complement(self):
+        return Seq(reverse_complement(self))
+
+
+def make_record(id, chrom, strand, exons):
+    """
+    :param exons: [(0-based start, 1-based end)] sorted
+    """
+    return genePredRecord(
+        id=id,
+        chrom=chrom,
+        strand=strand,
+        txStart=exons[0][0],
+        txEnd=exons[-1][1],
+        cdsStart=exons[0][0],
+        cdsEnd=exons[-1][1],
+        exonCount=len(exons),
+        exonStarts=[s for s, _ in exons],
+        exonEnds=[e for _, e in exons],
+    )
+
+
+def random_records(rng, chrom, length, n):
+    """
+    Multi-exon records on both strands, some right at the ends of the chromosome
+    """
+    records = []
+    for i in range(n):
+        n_exons = int(rng.randint(1, 5))
+        bounds = np.sort(rng.choice(np.arange(1, length), 2 * n_exons, replace=False))
+        if i % 10 == 0:
+            bounds[0] = 0
+        if i % 10 == 1:
+            bounds[-1] = length
+        exons = list(zip(bounds[::2].tolist(), bounds[1::2].tolist()))
+        records.append(make_record(f"PB.{i}.1", chrom, "+" if i % 2 else "-", exons))
+    return records
+
+
+def intrapriming(genome_dict, trec, nPolyA):
+    """
+    Per-record intra-priming of transcriptsKnownSpliceSites, before batch_intrapriming
+    """
+    seq = genome_dict[trec.chrom].seq
+    if trec.strand == "+":
+        pos_TTS = trec.exonEnds[-1]
+        seq_downTTS = seq[pos_TTS : pos_TTS + nPolyA].upper()
+    else:
+        pos_TTS = trec.exonStarts[0]
+        seq_downTTS = reverse_complement(seq[pos_TTS - nPolyA : pos_TTS]).upper()
+    percA = float(seq_downTTS.count("A")) / nPolyA * 100
+    # as sqanti3_RulesFilter counted it from seq_A_downstream_TTS
+    runA = len(seq_downTTS) - len(seq_downTTS.lstrip("A"))
+    return percA, seq_downTTS, runA
+
+
+class TestBatchClassification(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # A-rich, soft-masked and with Ns, so that A runs and case matter
+        bases = np.array(list("AAAAACGTacgtaN"))
+        self.length = 3000
+        self.genome_dict = {
+            "chr1": SimpleNamespace(seq=Seq("".join(rng.choice(bases, self.length))))
+        }
+        self.genome_arrays = GenomeArrays(self.genome_dict)
+        self.records = random_records(rng, "chr1", self.length, 200)
+
+    def test_batch_intrapriming(self):
+        for nPolyA in (20, 1):
+            downTTS = batch_intrapriming(self.genome_arrays, "chr1", self.records, nPolyA)
+            for trec in self.records:
+                self.assertEqual(downTTS[trec.id], intrapriming(self.genome_dict, trec, nPolyA), trec.id)
+        # windows running off both ends of the chromosome
+        downTTS = batch_intrapriming(self.genome_arrays, "chr1", self.records, 20)
+        self.assertTrue(any(len(seq) < 20 for _, seq, _ in downTTS.values()))
+
+    def test_runA_column(self):
+        downTTS = batch_intrapriming(self.genome_arrays, "chr1", self.records[:1], 20)
+        percA, seq, runA = downTTS[self.records[0].id]
+        isoform_hit = myQueryTranscripts(
+            id="PB.0.1",
+            tss_diff="NA",
+            tts_diff="NA",
+            num_exons=1,
+            length=100,
+            str_class="",
+            percAdownTTS=str(percA),
+            seqAdownTTS=seq,
+            runAdownTTS=runA,
+        )
+        # appended after the existing columns, which keep their positions
+        self.assertEqual(FIELDS_CLASS[-2:], ["polyA_dist", "runA_downstream_TTS"])
+        self.assertEqual(list(isoform_hit.as_dict())[-1], "runA_downstream_TTS")
+        fields = str(isoform_hit).split("\t")
+        self.assertEqual(fields[-2], str(runA))
+        self.assertEqual(fields[-4:-2], ["NA", "NA"])  # polyA_motif, polyA_dist
+        self.assertEqual(isoform_hit.as_dict()["perc_A_downstream_TTS"], str(percA))
+
+    def test_batch_splice_sites(self):
+        accepted_canonical_sites = {"GTAG", "GCAG", "ATAC"}
+        splice_sites = batch_splice_sites(
+            self.genome_arrays, "chr1", self.records, accepted_canonical_sites
+        )
+        n_junctions = 0
+        for trec in self.records:
+            expected = []
+            for i in range(trec.exonCount - 1):
+                site = trec.get_splice_site(self.genome_dict, i)
+                expected.append((site, site in accepted_canonical_sites))
+            self.assertEqual(splice_sites[trec.id], expected, trec.id)
+            n_junctions += len(expected)
+        self.assertGreater(n_junctions, 100)
+        self.assertEqual(batch_splice_sites(self.genome_arrays, "chr1", [], accepted_canonical_sites), {})
+
+    def test_nearest_site_diff(self):
+        rng = np.random.RandomState(1)
+        for _ in range(300):
+            sites = rng.choice(100, int(rng.randint(1, 6)), replace=False).tolist()
+            known = gene_sites(sites, sites)
+            for pos in range(-5, 106):
+                d = nearest_site_diff(known["begin"], pos)
+                # same distance as the loop over the set of sites
+                self.assertEqual(abs(d), min(abs(pos - x) for x in sites))
+                # ties go to the upstream site
+                self.assertEqual(d, max((pos - x for x in sites), key=lambda x: (-abs(x), x)))
+        self.assertEqual(nearest_site_diff(np.array([95, 105]), 100), 5)
+        self.assertEqual(nearest_site_diff(np.array([95, 105]), 101), -4)
+        self.assertEqual(nearest_site_diff(np.array([95]), 90), -5)
+
+    def test_nearest_gene_sites_diff(self):
+        start_ends_by_gene = {
+            "G1": gene_sites([100, 300], [500, 900]),
+            "G2": gene_sites([110], [890, 910]),
+            "G3": gene_sites([90], [1000]),
+        }
+        # nearest over all genes, the upstream site within a gene
+        self.assertEqual(nearest_gene_sites_diff(start_ends_by_gene, ["G1", "G2"], 104, 900), (4, 0))
+        self.assertEqual(nearest_gene_sites_diff(start_ends_by_gene, ["G2"], 104, 900), (-6, 10))
+        # equally close begins of two genes: the first gene in the list wins
+        self.assertEqual(nearest_gene_sites_diff(start_ends_by_gene, ["G1", "G3"], 95, 0), (-5, -500))
+        self.assertEqual(nearest_gene_sites_diff(start_ends_by_gene, ["G3", "G1"], 95, 0), (5, -500))
+        self.assertEqual(
+            nearest_gene_sites_diff(start_ends_by_gene, [], 95, 0), (float("inf"), float("inf"))
+        )
+
+    def test_sort_genes_by_start(self):
+        start_ends_by_gene = {
+            "G1": gene_sites([300, 100], [500]),
+            "G2": gene_sites([200], [250]),
+            "G3": gene_sites([100, 150], [2000]),
+            "G4": gene_sites([50], [60, 5000]),
+        }
+        self.assertEqual(start_ends_by_gene["G1"]["span"], (100, 500))
+        self.assertEqual(start_ends_by_gene["G4"]["span"], (50, 5000))
+        genes = ["G2", "G3", "G1", "G4"]
+        sort_genes_by_start(genes, start_ends_by_gene)
+        # by first begin, G3 and G1 start together and keep their order
+        self.assertEqual(genes, ["G4", "G3", "G1", "G2"])
+
+    def test_count_exon_overlaps(self):
+        rng = np.random.RandomState(2)
+        for ref in self.records:
+            # exon tree of categorize_incomplete_matches, before the bisects
+            ref_exon_tree = IntervalTree()
+            for i, e in enumerate(ref.exons):
+                ref_exon_tree.insert(e.start, e.end, i)
+            bounds = sorted(set(ref.exonStarts + ref.exonEnds))
+            queries = [(int(s), int(s) + int(rng.randint(1, 800))) for s in rng.randint(-50, self.length, 20)]
+            # intervals starting or ending right at, before and after the exon boundaries
+            for b in bounds:
+                for s in (b - 1, b, b + 1):
+                    queries.extend((s, e) for e in (b - 1, b, b + 1, b + 200) if e > s)
+            for start, end in queries:
+                self.assertEqual(
+                    ref.count_exon_overlaps(start, end),
+                    len(ref_exon_tree.find(start, end)),
+                    (ref.id, start, end),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import logging
+import unittest
+
+from benchmarks.bench_sqanti3 import StageSkipped, measure
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestBenchSqanti3(unittest.TestCase):
+    def test_measure(self):
+        records = []
+        with measure("ok", records, trace_memory=False):
+            pass
+        with measure("skipped", records, trace_memory=False):
+            raise StageSkipped("requires the output of ok")
+        with self.assertLogs("sqanti3_benchmark", level="WARNING") as logs:
+            with measure("error", records, trace_memory=False):
+                raise ValueError("bad input")
+        self.assertIn("Traceback", logs.output[0])
+        self.assertEqual(
+            [(r["stage"], r["status"]) for r in records],
+            [("ok", "ok"), ("skipped", "skipped"), ("error", "error")],
+        )
+        self.assertEqual(records[-1]["reason"], "ValueError: bad input")
+        # an exit of the code under test is not timed as a failed stage
+        with self.assertRaises(SystemExit):
+            with measure("exit", records, trace_memory=False):
+                raise SystemExit(-1)
+        self.assertEqual(records[-1]["stage"], "exit")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+import logging
+import os
+import shutil
+import tempfile
+import bisect
+import unittest
+from unittest import mock
+
+import numpy as np
+from sqanti3.sqanti3_qc import (
+    IntronIndex,
+    associationOverlapping,
+    genePredRecord,
+    myQueryTranscripts,
+    novelIsoformsKnownGenes,
+    reference_parser,
+    transcriptsKnownSpliceSites,
+)
+
+try:
+    from cupcake.cupcake.tofu.compare_junctions import compare_junctions
+except ImportError:
+    compare_junctions = None
+
+logging.basicConfig(level=logging.CRITICAL)
+
+OUTPUT = "test"
+# id, chrom, strand, gene, exons [(0-based start, 1-based end)]
+REFERENCE = [
+    # one gene, several isoforms sharing intron chains
+    ("A.1", "chr1", "+", "A", [(100, 200), (300, 400), (500, 600), (700, 800)]),
+    ("A.2", "chr1", "+", "A", [(100, 200), (300, 400), (500, 600)]),
+    ("A.3", "chr1", "+", "A", [(150, 200), (300, 400), (500, 600), (700, 850)]),
+    ("A.4", "chr1", "+", "A", [(90, 200), (300, 400), (500, 620)]),
+    # two overlapping genes on the same strand
+    ("D.1", "chr1", "+", "D", [(5000, 5100), (5200, 5300), (5400, 5500)]),
+    ("E.1", "chr1", "+", "E", [(5250, 5300), (5400, 5500), (5600, 5700)]),
+    # one gene with isoforms on both strands
+    ("F.1", "chr1", "+", "F", [(8000, 8100), (8200, 8300), (8400, 8500)]),
+    ("F.2", "chr1", "-", "F", [(8050, 8100), (8200, 8300), (8400, 8450)]),
+    # minus strand gene
+    ("G.1", "chr2", "-", "G", [(1000, 1100), (1200, 1300), (1400, 1500)]),
+    ("G.2", "chr2", "-", "G", [(1000, 1100), (1200, 1300), (1400, 1600)]),
+    ("G.3", "chr2", "-", "G", [(1050, 1100), (1200, 1300)]),
+    # adjacent genes sharing no junction, one of them mono-exonic
+    ("H.1", "chr1", "+", "H", [(10000, 10100), (10200, 10300)]),
+    ("I.1", "chr1", "+", "I", [(10500, 10600), (10700, 10800)]),
+    ("J.1", "chr1", "+", "J", [(10850, 10950)]),
+    # a long intron around a short one
+    ("K.1", "chr1", "+", "K", [(20000, 20120), (20800, 20900)]),
+    ("K.2", "chr1", "+", "K", [(20000, 20200), (20300, 20900)]),
+]
+
+
+def make_record(id, chrom, strand, exons, gene=None):
+    """
+    :param exons: [(0-based start, 1-based end)] sorted
+    """
+    return genePredRecord(
+        id=id,
+        chrom=chrom,
+        strand=strand,
+        txStart=exons[0][0],
+        txEnd=exons[-1][1],
+        cdsStart=exons[0][0],
+        cdsEnd=exons[-1][1],
+        exonCount=len(exons),
+        exonStarts=[s for s, _ in exons],
+        exonEnds=[e for _, e in exons],
+        gene=gene,
+    )
+
+
+def genePred_line(id, chrom, strand, gene, exons):
+    starts = "".join(f"{s}," for s, _ in exons)
+    ends = "".join(f"{e}," for _, e in exons)
+    return (
+        f"{id}\t{chrom}\t{strand}\t{exons[0][0]}\t{exons[-1][1]}\t{exons[0][0]}\t{exons[-1][1]}\t"
+        f"{len(exons)}\t{starts}\t{ends}\t0\t{gene}\tnone\tnone\t-1,\n"
+    )
+
+
+def old_has_intron_retention(da_pairs, trec):
+    """
+    Intron retention check of novelIsoformsKnownGenes before IntronIndex
+    """
+    for e in trec.exons:
+        m = bisect.bisect_left(da_pairs, (e.start, e.end))
+        if m < len(da_pairs) and e.start <= da_pairs[m][0] < da_pairs[m][1] < e.end:
+            return True
+    return False
+
+
+def old_genic_intron(da_pairs, trec):
+    """
+    Genic intron check of associationOverlapping before IntronIndex
+    """
+    i = bisect.bisect_left(da_pairs, (trec.txStart, trec.txEnd))
+    while i < len(da_pairs) and da_pairs[i][0] <= trec.txStart:
+        if da_pairs[i][0] <= trec.txStart <= trec.txStart <= da_pairs[i][1]:
+            return True
+        i += 1
+    return False
+
+
+class TestIntronIndex(unittest.TestCase):
+    def test_intron_index(self):
+        rng = np.random.RandomState(0)
+        for _ in range(100):
+            da_pairs = set()
+            for _ in range(int(rng.randint(1, 15))):
+                d = int(rng.randint(0, 200))
+                da_pairs.add((d, d + int(rng.randint(1, 100))))
+            da_pairs = sorted(da_pairs)
+            index = IntronIndex(da_pairs)
+            bounds = sorted({x for pair in da_pairs for x in pair})
+            queries = [(int(s), int(s) + int(rng.randint(1, 150))) for s in rng.randint(-10, 300, 20)]
+            # right at, before and after the intron boundaries
+            queries.extend((s, e) for s in bounds for e in bounds if e > s)
+            for start, end in queries:
+                self.assertEqual(
+                    index.any_within(start, end),
+                    any(start <= d and a < end for d, a in da_pairs),
+                    (da_pairs, start, end),
+                )
+                self.assertEqual(
+                    index.any_containing(start, end),
+                    any(d <= start and end <= a for d, a in da_pairs),
+                    (da_pairs, start, end),
+                )
+
+
+class TestClassification(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # an existing reference genePred is used as is by reference_parser
+        with open(os.path.join(self.tmp_dir, f"refAnnotation_{OUTPUT}.genePred"), "w") as f:
+            f.writelines(genePred_line(*ref) for ref in REFERENCE)
+        (
+            self.refs_1exon_by_chr,
+            self.refs_exons_by_chr,
+            self.junctions_by_chr,
+            self.junctions_by_gene,
+            self.start_ends_by_gene,
+        ) = reference_parser(
+            self.tmp_dir, OUTPUT, False, "unused.gtf", 0, ["chr1", "chr2"]
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def classify(self, trec, known_chains=True):
+        return transcriptsKnownSpliceSites(
+            self.refs_1exon_by_chr,
+            self.refs_exons_by_chr,
+            self.start_ends_by_gene,
+            self.junctions_by_chr,
+            trec,
+            (0.0, "", 0),
+            known_chains=known_chains,
+        )
+
+    @unittest.skipUnless(compare_junctions, "cupcake is not installed")
+    def test_known_chains(self):
+        queries = [
+            # FSM, several references with the query chain
+            (make_record("q.fsm", "chr1", "+", [(120, 200), (300, 400), (500, 600), (700, 790)]),
+             "full-splice_match"),
+            # ISM of several references
+            (make_record("q.ism5", "chr1", "+", [(350, 400), (500, 600)]), "incomplete-splice_match"),
+            (make_record("q.ism3", "chr1", "+", [(550, 600), (700, 780)]), "incomplete-splice_match"),
+            # known junctions around a retained intron
+            (make_record("q.ir", "chr1", "+", [(150, 400), (500, 600)]), "anyKnownJunction"),
+            # no known chain: needs the full scoring
+            (make_record("q.nic", "chr1", "+", [(100, 200), (500, 600)]), None),
+            # minus strand
+            (make_record("q.minus", "chr2", "-", [(1010, 1100), (1200, 1300), (1400, 1550)]),
+             "full-splice_match"),
+            (make_record("q.minus_ism", "chr2", "-", [(1250, 1300), (1400, 1450)]),
+             "incomplete-splice_match"),
+            # overlapping two genes: the fast path must not be used
+            (make_record("q.genes", "chr1", "+", [(5050, 5100), (5200, 5300), (5400, 5500)]), None),
+            (make_record("q.genes_ism", "chr1", "+", [(5260, 5300), (5400, 5500)]), None),
+            # references of the gene on both strands: the fast path must not be used
+            (make_record("q.strands", "chr1", "+", [(8020, 8100), (8200, 8300), (8400, 8480)]), None),
+            (make_record("q.strands_minus", "chr1", "-", [(8060, 8100), (8200, 8300), (8400, 8440)]), None),
+        ]
+        for trec, str_class in queries:
+            fast = self.classify(trec)
+            full = self.classify(trec, known_chains=False)
+            # same reference transcript, subtype, diffs and every other field
+            self.assertEqual(vars(fast), vars(full), trec.id)
+            if str_class is not None:
+                self.assertEqual(fast.str_class, str_class, trec.id)
+        # the first reference with the smallest total end difference
+        fsm = self.classify(queries[0][0])
+        self.assertEqual((fsm.transcripts, fsm.tss_diff, fsm.tts_diff), (["A.1"], 20, 10))
+        # an FSM is found by its hashed chain, without comparing junctions
+        with mock.patch(
+            "cupcake.cupcake.tofu.compare_junctions.compare_junctions", wraps=compare_junctions
+        ) as compare:
+            self.classify(queries[0][0])
+            self.assertEqual(compare.call_count, 0)
+            self.classify(queries[0][0], known_chains=False)
+            self.assertGreater(compare.call_count, 0)
+
+    def novel_class(self, trec, genes):
+        isoform_hit = myQueryTranscripts(
+            trec.id, "NA", "NA", trec.exonCount, trec.length, str_class="", genes=genes
+        )
+        return novelIsoformsKnownGenes(
+            isoform_hit, trec, self.junctions_by_chr, self.junctions_by_gene, self.start_ends_by_gene
+        )
+
+    def test_fusion(self):
+        genes_by_junction = self.junctions_by_chr["chr1"]["genes"]
+        self.assertEqual(genes_by_junction[(5300, 5400)], {"D", "E"})
+        self.assertEqual(genes_by_junction[(5100, 5200)], {"D"})
+        # a junction of both hit genes: not a fusion
+        trec = make_record("q.shared", "chr1", "+", [(5050, 5100), (5200, 5300), (5400, 5500), (5600, 5650)])
+        self.assertEqual(self.novel_class(trec, ["D", "E"]).str_class, "moreJunctions")
+        # only the hit genes count
+        self.assertEqual(self.novel_class(trec, ["D", "H"]).str_class, "fusion")
+        # each junction in a single gene
+        trec = make_record("q.fusion", "chr1", "+", [(10050, 10100), (10200, 10300), (10500, 10600), (10700, 10750)])
+        isoform_hit = self.novel_class(trec, ["H", "I"])
+        self.assertEqual((isoform_hit.str_class, isoform_hit.subtype), ("fusion", "multi-exon"))
+        self.assertEqual(isoform_hit.transcripts, ["novel"])
+        # a mono-exonic gene has no junctions
+        trec = make_record("q.mono", "chr1", "+", [(10750, 10900)])
+        isoform_hit = self.novel_class(trec, ["I", "J"])
+        self.assertEqual((isoform_hit.str_class, isoform_hit.subtype), ("fusion", "mono-exon"))
+
+    def test_intron_retention(self):
+        da_pairs = self.junctions_by_chr["chr1"]["da_pairs"]
+        # the first exon holds the short intron of K.2, not the long one of K.1
+        trec = make_record("q.ir", "chr1", "+", [(20100, 20700), (20850, 20900)])
+        self.assertFalse(old_has_intron_retention(da_pairs, trec))
+        isoform_hit = self.novel_class(trec, ["K"])
+        self.assertEqual(
+            (isoform_hit.str_class, isoform_hit.subtype), ("novel_not_in_catalog", "intron_retention")
+        )
+        # no intron inside an exon
+        trec = make_record("q.nnc", "chr1", "+", [(20100, 20150), (20850, 20900)])
+        self.assertEqual(self.novel_class(trec, ["K"]).subtype, "at_least_one_novel_splicesite")
+
+    def test_genic_intron(self):
+        da_pairs = self.junctions_by_chr["chr1"]["da_pairs"]
+
+        def association(trec):
+            isoform_hit = myQueryTranscripts(
+                trec.id, "NA", "NA", trec.exonCount, trec.length, str_class="", genes=[]
+            )
+            return associationOverlapping(isoform_hit, trec, self.junctions_by_chr).str_class
+
+        # inside the intron of K.1, starting past its donor
+        trec = make_record("q.intron", "chr1", "+", [(20400, 20600)])
+        self.assertFalse(old_genic_intron(da_pairs, trec))
+        self.assertEqual(association(trec), "genic_intron")
+        # right at the donor and acceptor of K.1
+        trec = make_record("q.intron_multi", "chr1", "+", [(20120, 20250), (20500, 20800)])
+        self.assertTrue(old_genic_intron(da_pairs, trec))
+        self.assertEqual(association(trec), "genic_intron")
+        # starting at the donor of K.2 but running past every intron
+        trec = make_record("q.past", "chr1", "+", [(20200, 20850)])
+        self.assertEqual(association(trec), "intergenic")
+        trec = make_record("q.far", "chr1", "+", [(30000, 30100)])
+        self.assertEqual(association(trec), "intergenic")
+
+
+if __name__ == "__main__":
+    unittest.main()
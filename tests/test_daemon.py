@@ -0,0 +1,174 @@
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from sqanti3.sqanti3_daemon import (
+    JOB_OPTIONS,
+    Server,
+    job_outputs,
+    job_summary,
+    read_message,
+    send_message,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_messages(self):
+        stream = io.BytesIO()
+        send_message(stream, {"command": "ping"})
+        send_message(stream, {"event": "log", "message": "a\nb"})
+        stream.seek(0)
+        self.assertEqual(read_message(stream), {"command": "ping"})
+        self.assertEqual(read_message(stream)["message"], "a\nb")
+        self.assertIsNone(read_message(stream))
+
+    def test_job_options(self):
+        for name in ("isoforms", "genome", "annotation", "chunks", "genome_dict"):
+            self.assertNotIn(name, JOB_OPTIONS)
+        for name in ("gtf", "output", "directory", "skiporf", "cpus"):
+            self.assertIn(name, JOB_OPTIONS)
+
+    def test_job_outputs(self):
+        prefix = os.path.join(self.tmp_dir, "sample")
+        with open(f"{prefix}_classification.txt", "w") as f:
+            f.write("isoform\tstructural_category\n")
+            f.write("PB.1.1\tfull-splice_match\nPB.1.2\tfull-splice_match\nPB.2.1\tantisense\n")
+        with open(f"{prefix}.run_profile.json", "w") as f:
+            json.dump({"stages": [{"stage": "classification"}]}, f)
+        outputs = job_outputs(
+            "/data/sample.fasta", {"output": None, "directory": self.tmp_dir}
+        )
+        self.assertEqual(
+            outputs,
+            {
+                "classification": f"{prefix}_classification.txt",
+                "run_profile"   : f"{prefix}.run_profile.json",
+            },
+        )
+        summary = job_summary(outputs)
+        self.assertEqual(
+            summary["categories"], {"full-splice_match": 2, "antisense": 1}
+        )
+        self.assertEqual(summary["stages"], [{"stage": "classification"}])
+
+
+def fake_run_qc(isoforms, directory=None, output=None, **kwargs):
+    """
+    Stand-in for run_qc, run in the forked job: log, then classify every isoform as antisense
+    """
+    logger = logging.getLogger("sqanti3_qc")
+    # the test runs with logging.CRITICAL, this only changes the job process
+    logger.setLevel(logging.INFO)
+    if isoforms.endswith("fail.fasta"):
+        logger.error("Cannot classify.")
+        sys.exit(-1)
+    logger.info(f"Classifying {isoforms} against {kwargs['genome_dict']['chr1']}...")
+    with open(os.path.join(directory, f"{output}_classification.txt"), "w") as f:
+        f.write("isoform\tstructural_category\nPB.1.1\tantisense\n")
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, "sq3.sock")
+        reference = SimpleNamespace(
+            name        = "test",
+            genome      = "genome.fa",
+            annotation  = "annotation.gtf",
+            min_ref_len = 200,
+            genename    = False,
+            genome_dict = {"chr1": "ACGT"},
+            reference   = None,
+        )
+        patcher = mock.patch("sqanti3.sqanti3_daemon.run_qc", fake_run_qc)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = Server(self.socket_path, {"test": reference}, 1)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def request(self, request):
+        """
+        :return: all the messages answered to the request
+        """
+        messages = []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            stream = sock.makefile("rwb")
+            send_message(stream, request)
+            while True:
+                message = read_message(stream)
+                if message is None:
+                    return messages
+                messages.append(message)
+
+    def classify(self, isoforms, **options):
+        options.setdefault("directory", self.tmp_dir)
+        return self.request(
+            {
+                "command"  : "classify",
+                "reference": "test",
+                "isoforms" : os.path.join(self.tmp_dir, isoforms),
+                "options"  : options,
+            }
+        )
+
+    def test_ping(self):
+        (status,) = self.request({"command": "ping"})
+        self.assertEqual(status["event"], "status")
+        self.assertEqual(status["references"], ["test"])
+        self.assertEqual(status["running"], 0)
+
+    def test_rejected(self):
+        (error,) = self.classify("sample.fasta", genome="other.fa")
+        self.assertEqual(error, {"event": "error", "message": "Unknown options: genome."})
+        (error,) = self.request({"command": "classify", "reference": "hg38", "isoforms": "a.fa"})
+        self.assertEqual(error["event"], "error")
+        self.assertIn("Unknown reference hg38", error["message"])
+
+    def test_classify(self):
+        messages = self.classify("sample.fasta", output="sample")
+        self.assertEqual([m["event"] for m in messages], ["log", "done"])
+        self.assertEqual(messages[0]["level"], "INFO")
+        self.assertIn("sample.fasta against ACGT", messages[0]["message"])
+        done = messages[-1]
+        self.assertEqual(
+            done["outputs"]["classification"],
+            os.path.join(self.tmp_dir, "sample_classification.txt"),
+        )
+        self.assertEqual(done["categories"], {"antisense": 1})
+        (status,) = self.request({"command": "ping"})
+        self.assertEqual(status["running"], 0)
+
+    def test_job_exit(self):
+        messages = self.classify("fail.fasta", output="fail")
+        self.assertEqual([m["event"] for m in messages], ["log", "error"])
+        self.assertEqual(messages[0]["level"], "ERROR")
+        self.assertEqual(messages[-1]["message"], "sqanti3_qc exited with status -1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqanti3.sqanti3_RulesFilter import filter_fasta, filter_fastq, filter_indexed
+from sqanti3.utilities.fasta_index import (
+    build_index,
+    copy_records,
+    fai_path,
+    read_index,
+    record_end,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+# names, descriptions and sequences of various lengths around the line width
+SEQUENCES = [
+    ("PB.1.1", "PB.1.1 full_length_coverage=2", "ACGTACGTAC" * 3),
+    ("PB.1.2", "PB.1.2", "ACG"),
+    ("PB.2.1", "PB.2.1 description", "T" * 25),
+    ("PB.3.1", "PB.3.1", "GATTACA" * 7),
+    ("PB.4.1", "PB.4.1", "A" * 10),
+]
+KEEP = {"PB.1.2", "PB.2.1", "PB.4.1", "PB.9.9"}
+
+
+class TestFastaIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fasta = os.path.join(self.tmp_dir, "isoforms.fasta")
+        with open(self.fasta, "w") as f:
+            for _, header, seq in SEQUENCES:
+                f.write(f">{header}\n")
+                for i in range(0, len(seq), 10):
+                    f.write(seq[i : i + 10] + "\n")
+        self.fastq = os.path.join(self.tmp_dir, "isoforms.fastq")
+        with open(self.fastq, "w") as f:
+            for _, header, seq in SEQUENCES:
+                f.write(f"@{header}\n{seq}\n+\n{'I' * len(seq)}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, filename: str) -> str:
+        with open(filename) as f:
+            return f.read()
+
+    def test_index(self):
+        records = build_index(self.fasta)
+        self.assertEqual(read_index(fai_path(self.fasta)), records)
+        # written by samtools faidx/fqidx for the same files
+        self.assertEqual(
+            self.read(fai_path(self.fasta)),
+            "PB.1.1\t30\t31\t10\t11\n"
+            "PB.1.2\t3\t72\t3\t4\n"
+            "PB.2.1\t25\t96\t10\t11\n"
+            "PB.3.1\t49\t132\t10\t11\n"
+            "PB.4.1\t10\t194\t10\t11\n",
+        )
+        self.assertEqual(record_end(records[-1]), os.path.getsize(self.fasta))
+        records = build_index(self.fastq, fastq=True)
+        self.assertEqual(
+            self.read(fai_path(self.fastq)),
+            "PB.1.1\t30\t31\t30\t31\t64\n"
+            "PB.1.2\t3\t103\t3\t4\t109\n"
+            "PB.2.1\t25\t133\t25\t26\t161\n"
+            "PB.3.1\t49\t195\t49\t50\t247\n"
+            "PB.4.1\t10\t305\t10\t11\t318\n",
+        )
+        self.assertEqual(record_end(records[-1]), os.path.getsize(self.fastq))
+
+    def test_copy_records(self):
+        for filename, fastq, filter_lines in (
+            (self.fasta, False, filter_fasta),
+            (self.fastq, True, filter_fastq),
+        ):
+            indexed = copy_records(filename, f"{filename}.indexed", KEEP, fastq)
+            expected = filter_lines(filename, f"{filename}.lines", KEEP)
+            self.assertEqual(self.read(indexed), self.read(expected))
+            # the index written by the first copy is reused
+            self.assertTrue(os.path.exists(fai_path(filename)))
+            copy_records(filename, f"{filename}.again", KEEP, fastq)
+            self.assertEqual(self.read(f"{filename}.again"), self.read(expected))
+
+    def test_irregular_lines(self):
+        with open(self.fasta, "a") as f:
+            f.write(">PB.5.1\nACG\nACGTACGTAC\n")
+        with self.assertRaises(ValueError):
+            build_index(self.fasta)
+        dst = filter_indexed(self.fasta, f"{self.fasta}.kept", {"PB.5.1"})
+        self.assertEqual(self.read(dst), ">PB.5.1\nACG\nACGTACGTAC\n")
+
+    def test_blank_lines(self):
+        for text, keep in (
+            (">a\nACGT\n\nACGT\n>b\nAC\n>c\nGG\n", {"a", "c"}),  # inside a record
+            (">a\nACGT\n\n>b\nAC\n\n>c\nGG\n", {"b"}),  # between records
+            ("\n>a\nACGT\n>b\nAC\n", {"a"}),  # before the first record
+        ):
+            with open(self.fasta, "w") as f:
+                f.write(text)
+            with self.assertRaises(ValueError):
+                build_index(self.fasta)
+            dst = filter_indexed(self.fasta, f"{self.fasta}.kept", keep)
+            expected = filter_fasta(self.fasta, f"{self.fasta}.lines", keep)
+            self.assertEqual(self.read(dst), self.read(expected), text)
+
+    def test_filter_logger(self):
+        # the index messages go to the rules filter logger, which has the CLI handlers
+        with self.assertLogs("sqanti3.sqanti3_RulesFilter", level="INFO") as logs:
+            filter_indexed(self.fasta, f"{self.fasta}.kept", KEEP)
+        self.assertIn(f"Indexing {self.fasta}", logs.output[0])
+
+    def test_irregular_fastq(self):
+        for record in (
+            "@PB.5.1\nACGTA\nCG\n+\nIIIIIII\n",  # wrapped sequence and quality
+            "@PB.5.1\nACGTACG\n+\nIIIII\n",  # truncated quality
+        ):
+            shutil.copy(self.fastq, f"{self.fastq}.bad")
+            with open(f"{self.fastq}.bad", "a") as f:
+                f.write(record)
+            with self.assertRaises(ValueError):
+                build_index(f"{self.fastq}.bad", fastq=True)
+            dst = filter_indexed(f"{self.fastq}.bad", f"{self.fastq}.kept", KEEP, fastq=True)
+            expected = filter_fastq(f"{self.fastq}.bad", f"{self.fastq}.lines", KEEP)
+            self.assertEqual(self.read(dst), self.read(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
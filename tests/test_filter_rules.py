@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqanti3.sqanti3_RulesFilter import CATEGORY_DICT
+from sqanti3.utilities.filter_rules import (
+    DEFAULT_RULES,
+    ClassificationTable,
+    CompiledRules,
+    load_rules,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+FIELDS = [
+    "isoform",
+    "structural_category",
+    "exons",
+    "perc_A_downstream_TTS",
+    "seq_A_downstream_TTS",
+    "polyA_motif",
+    "diff_to_gene_TSS",
+    "diff_to_gene_TTS",
+    "RTS_stage",
+    "all_canonical",
+    "min_cov",
+]
+ROWS = [
+    # kept FSM, but intra-priming for a 0.5 cutoff
+    ["PB.1.1", "full-splice_match", "3", "55", "AAAAT", "NA", "0", "200", "TRUE", "canonical", "NA"],
+    # intra-priming from the A run, no polyA motif, far from the known end
+    ["PB.2.1", "novel_in_catalog", "2", "10", "AAAAAAAT", "NA", "5", "-80", "FALSE", "canonical", "NA"],
+    # RT switching
+    ["PB.3.1", "novel_not_in_catalog", "4", "10", "CCC", "AATAAA", "NA", "NA", "TRUE", "canonical", "2"],
+    # non-canonical with low coverage, mono-exonic
+    ["PB.4.1", "antisense", "1", "10", "CCC", "AATAAA", "NA", "NA", "FALSE", "non_canonical", "2"],
+    # non-canonical with enough coverage
+    ["PB.5.1", "genic", "2", "10", "CCC", "AATAAA", "NA", "NA", "FALSE", "non_canonical", "8"],
+]
+
+
+class TestFilterRules(unittest.TestCase):
+    def setUp(self):
+        self.table = ClassificationTable(
+            FIELDS, ["\t".join(row) + "\n" for row in ROWS]
+        )
+
+    def test_default_rules(self):
+        rules = CompiledRules(DEFAULT_RULES, CATEGORY_DICT)
+        self.assertEqual(
+            rules.evaluate(self.table).tolist(),
+            ["", "IntraPriming", "RTSwitching", "LowCoverage/Non-Canonical", ""],
+        )
+        # runA is computed from seq_A_downstream_TTS when the column is missing
+        self.assertEqual(
+            self.table.numbers("runA_downstream_TTS").tolist(), [4, 7, 0, 0, 0]
+        )
+        reasons = rules.evaluate(
+            self.table, {"intrapriming": 0.5, "runAlength": 8, "filter_mono_exonic": True}
+        )
+        self.assertEqual(
+            reasons.tolist(),
+            ["IntraPriming", "", "RTSwitching", "Mono-Exonic", ""],
+        )
+
+    def test_custom_rules(self):
+        ruleset = {
+            "params"    : {"max_exons": 3},
+            "conditions": {"many_exons": {"column": "exons", "op": ">", "value": "$max_exons"}},
+            "rules"     : {
+                "NNC"    : [{"reason": "NNC", "when": {"not": {"column": "min_cov", "op": "is_na"}}}],
+                "default": [
+                    {"reason": "ManyExons", "when": {"ref": "many_exons"}},
+                    {
+                        "reason": "FarFromTTS",
+                        "when"  : {
+                            "all": [
+                                {"column": "structural_category", "op": "in", "value": ["novel_in_catalog", "genic"]},
+                                {"column": "diff_to_gene_TTS", "abs": True, "op": ">=", "value": 80},
+                            ]
+                        },
+                    },
+                ],
+            },
+        }
+        rules = CompiledRules(ruleset, CATEGORY_DICT)
+        self.assertEqual(
+            rules.evaluate(self.table).tolist(), ["", "FarFromTTS", "NNC", "", ""]
+        )
+        self.assertEqual(
+            rules.evaluate(self.table, {"max_exons": 2}).tolist(),
+            ["ManyExons", "FarFromTTS", "NNC", "", ""],
+        )
+        self.assertEqual(rules.reasons, ["FarFromTTS", "ManyExons", "NNC"])
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            CompiledRules({"rules": {"FSM": [{"reason": "x", "when": {"column": "exons", "op": "~"}}]}})
+        with self.assertRaises(ValueError):
+            CompiledRules({"rules": {"FSM": [{"reason": "x", "when": {"ref": "missing"}}]}})
+        rules = CompiledRules(
+            {"rules": {"FSM": [{"reason": "x", "when": {"column": "exons", "op": ">", "value": "$n"}}]}},
+            CATEGORY_DICT,
+        )
+        with self.assertRaises(ValueError):
+            rules.evaluate(self.table)
+
+    def test_load_rules(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "rules.json")
+            with open(filename, "w") as f:
+                json.dump(DEFAULT_RULES, f)
+            self.assertEqual(load_rules(filename), DEFAULT_RULES)
+            self.assertIs(load_rules(None), DEFAULT_RULES)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
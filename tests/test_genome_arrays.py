@@ -0,0 +1,35 @@
+import logging
+import unittest
+from types import SimpleNamespace
+
+from sqanti3.utilities.genome_arrays import GenomeArrays, as_strings, find_motifs
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestGenomeArrays(unittest.TestCase):
+    def setUp(self):
+        self.genome = GenomeArrays(
+            {"chr1": SimpleNamespace(seq="ACGTaatAAAGGGCCCTTTNAATAAACG")}
+        )
+
+    def test_windows(self):
+        windows = self.genome.windows("chr1", [-2, 0, 24], 6)
+        self.assertEqual(as_strings(windows), ["ACGT", "ACGTaa", "AACG"])
+        self.assertEqual(windows[0, 2:].tobytes(), b"ACGT")
+
+        windows = self.genome.windows("chr1", [0, 0], 6, reverse=[False, True])
+        self.assertEqual(as_strings(windows), ["ACGTaa", "ttACGT"])
+
+    def test_find_motifs(self):
+        windows = self.genome.windows("chr1", [0, 14, 16], 13)
+        best, pos = find_motifs(windows, ["AATAAA", "TTT", "GGG"])
+        # case-sensitive: "aatAAA" in the first window is not a hit for AATAAA
+        self.assertEqual(best.tolist(), [2, 0, 0])
+        self.assertEqual(pos.tolist(), [10, 6, 4])
+        best, pos = find_motifs(windows, ["CCCC"])
+        self.assertEqual(best.tolist(), [-1, -1, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
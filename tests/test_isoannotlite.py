@@ -0,0 +1,173 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqanti3.utilities.IsoAnnotLite_SQ1 import (
+    FeatureBuffer,
+    createGTFFromSqanti,
+    isoannot,
+    mappingFeatures,
+    readGFF,
+    transformCDStoGenomic,
+    transformTransFeaturesToGenomic,
+    updateGTF,
+)
+from tests.tappas_gff3 import EXONS, write_tappas_gff3
+
+logging.basicConfig(level=logging.CRITICAL)
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "test_data", "example_out")
+N_ISOFORMS = 40
+
+
+class TestIsoAnnotLite(unittest.TestCase):
+    def setUp(self):
+        """
+        SQANTI3 outputs of the first N_ISOFORMS isoforms of the example, the
+        corrected GTF written from its genePred
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+        self.classification = os.path.join(self.tmp_dir, "classification.txt")
+        with open(
+            os.path.join(TEST_DATA, "melanoma_chr13_classification.txt")
+        ) as f, open(self.classification, "w") as out:
+            out.write(next(f))
+            self.isoforms = []
+            for line in f:
+                if len(self.isoforms) == N_ISOFORMS:
+                    break
+                self.isoforms.append(line.split("\t", 1)[0])
+                out.write(line)
+        self.junctions = os.path.join(self.tmp_dir, "junctions.txt")
+        with open(
+            os.path.join(TEST_DATA, "melanoma_chr13_junctions.txt")
+        ) as f, open(self.junctions, "w") as out:
+            out.write(next(f))
+            out.writelines(l for l in f if l.split("\t", 1)[0] in self.isoforms)
+        self.gtf = os.path.join(self.tmp_dir, "corrected.gtf")
+        with open(
+            os.path.join(TEST_DATA, "melanoma_chr13_corrected.genePred")
+        ) as f, open(self.gtf, "w") as out:
+            for line in f:
+                raw = line.split("\t")
+                if raw[0] not in self.isoforms:
+                    continue
+                attrs = f'gene_id "{raw[0]}"; transcript_id "{raw[0]}";'
+                for start, end in zip(raw[8].split(",")[:-1], raw[9].split(",")[:-1]):
+                    out.write(
+                        f"{raw[1]}\tPacBio\texon\t{int(start) + 1}\t{end}\t.\t{raw[2]}\t.\t{attrs}\n"
+                    )
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_createGTFFromSqanti(self):
+        filename = os.path.join(self.tmp_dir, "aux.gff3")
+        dc_SQexons, dc_SQcoding, dc_SQtransGene, dc_SQstrand = createGTFFromSqanti(
+            self.gtf, self.classification, self.junctions, filename
+        )
+        self.assertEqual(sorted(dc_SQexons), sorted(self.isoforms))
+        self.assertEqual(sorted(dc_SQstrand), sorted(self.isoforms))
+        with open(filename) as f:
+            lines = f.readlines()
+        self.assertEqual(
+            {line.split("\t")[0] for line in lines if line.split("\t")[2] == "transcript"},
+            set(self.isoforms),
+        )
+        self.assertEqual(
+            sum(line.split("\t")[2] == "exon" for line in lines),
+            sum(len(exons) for exons in dc_SQexons.values()),
+        )
+        # the file is rewritten, not appended to
+        createGTFFromSqanti(self.gtf, self.classification, self.junctions, filename)
+        with open(filename) as f:
+            self.assertEqual(f.readlines(), lines)
+
+    def test_readGFF(self):
+        gff3 = os.path.join(self.tmp_dir, "reference.gff3")
+        write_tappas_gff3(gff3, n_transcripts=3, features_per_transcript=3000)
+        dc_GFF3, dc_GFF3exonsTrans, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand = readGFF(gff3)
+        self.assertEqual(len(dc_GFF3), 3)
+        # every feature, in file order
+        self.assertTrue(all(len(features) == 3000 for features in dc_GFF3.values()))
+        self.assertEqual(
+            [f[2].split("ID=")[1].split(";")[0] for f in dc_GFF3["ENST00000000000"][:4]],
+            ["PF00000", "miR1", "GO:0000002", "PF00003"],
+        )
+        self.assertTrue(all(len(exons) == EXONS for exons in dc_GFF3transExons.values()))
+        self.assertEqual(dc_GFF3coding["ENST00000000001"], [151, 1350])
+        self.assertEqual(sum(len(t) for t in dc_GFF3exonsTrans.values()), 3 * EXONS)
+        dc_GFF3coding = transformCDStoGenomic(dc_GFF3coding, dc_GFF3transExons, dc_GFF3strand)
+        genomic = transformTransFeaturesToGenomic(
+            dc_GFF3, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand
+        )
+        self.assertEqual(sorted(genomic), sorted(dc_GFF3))
+
+    def test_featureBuffer(self):
+        filename = os.path.join(self.tmp_dir, "aux.gff3")
+        createGTFFromSqanti(self.gtf, self.classification, self.junctions, filename)
+        updateGTF(filename, f"{filename}.mod")
+        features = FeatureBuffer(keep_raw=True)
+        createGTFFromSqanti(self.gtf, self.classification, self.junctions, features)
+        with open(filename) as f:
+            self.assertEqual(features.raw, f.readlines())
+        with open(f"{filename}.mod") as f:
+            self.assertEqual(features.lines, f.readlines())
+
+    def test_isoannot(self):
+        isoannot(self.gtf, self.classification, self.junctions)
+        self.assertEqual(os.listdir(self.tmp_dir).count("tappAS_annotation_from_SQANTI3.gff3"), 1)
+        # no auxiliary files unless asked for
+        self.assertFalse(os.path.exists("tappAS_annotation_from_SQANTI3_mod.gff3"))
+        with open("tappAS_annotation_from_SQANTI3.gff3") as f:
+            final = f.read()
+        isoannot(self.gtf, self.classification, self.junctions, keep_intermediate=True)
+        with open("tappAS_annotation_from_SQANTI3.gff3") as f:
+            self.assertEqual(f.read(), final)
+        updateGTF("tappAS_annotation_from_SQANTI3_aux.gff3", "mod.gff3")
+        with open("mod.gff3") as f, open("tappAS_annotation_from_SQANTI3_mod.gff3") as mod:
+            self.assertEqual(f.read(), mod.read())
+
+    def test_mappingFeatures_cpus(self):
+        gff3 = os.path.join(self.tmp_dir, "reference.gff3")
+        write_tappas_gff3(gff3, n_transcripts=30, features_per_transcript=50)
+        dc_GFF3, dc_GFF3exonsTrans, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand = readGFF(gff3)
+        dc_GFF3coding = transformCDStoGenomic(dc_GFF3coding, dc_GFF3transExons, dc_GFF3strand)
+        dc_GFF3_Genomic = transformTransFeaturesToGenomic(
+            dc_GFF3, dc_GFF3transExons, dc_GFF3coding, dc_GFF3strand
+        )
+        # every reference transcript as a full-splice match, and a novel isoform
+        dc_SQexons = dict(dc_GFF3transExons, novel=[[1, 100]])
+        dc_SQtransGene = {trans: ["G", "full-splice_match", trans] for trans in dc_GFF3transExons}
+        dc_SQtransGene["novel"] = ["G", "novel_in_catalog", "novel"]
+        mapped = []
+        for cpus in (1, 3):
+            features = FeatureBuffer()
+            mappingFeatures(
+                dc_SQexons,
+                dc_GFF3coding,
+                dc_SQtransGene,
+                dc_GFF3exonsTrans,
+                dc_GFF3transExons,
+                dc_GFF3_Genomic,
+                dc_GFF3coding,
+                features,
+                cpus=cpus,
+            )
+            mapped.append(features.lines)
+        self.assertTrue(mapped[0])
+        # same lines, in the same transcript order
+        self.assertEqual(mapped[1], mapped[0])
+        self.assertEqual(
+            list(dict.fromkeys(line.split("\t", 1)[0] for line in mapped[1])),
+            list(dc_GFF3transExons),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
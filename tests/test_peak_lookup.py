@@ -0,0 +1,213 @@
+import logging
+from pkg_resources import resource_filename
+from os.path import exists, join
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from bx.intervals.intersection import IntervalTree
+from sqanti3.sqanti3_qc import CAGEPeak, PolyAPeak
+from sqanti3.utilities import peak_index
+from sqanti3.utilities.peak_index import (
+    build_peak_index,
+    load_peak_index,
+    peak_index_is_current,
+    peak_index_path,
+    read_peak_bed,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+def interval_trees(peaks):
+    """
+    :param peaks: [(chrom, start0, end1, strand, tss0)]
+    :return: (chrom, strand) --> IntervalTree of (tss0, start0, end1), as CAGEPeak/PolyAPeak built them
+    """
+    trees = {}
+    for chrom, start0, end1, strand, tss0 in peaks:
+        trees.setdefault((chrom, strand), IntervalTree()).insert(start0, end1, (tss0, start0, end1))
+    return trees
+
+
+def cage_find(trees, chrom, strand, query, search_window=10000):
+    """
+    CAGEPeak.find over an IntervalTree, before the sorted-array lookup
+    """
+    within_peak, dist_peak = False, "NA"
+    if (chrom, strand) not in trees:
+        return within_peak, dist_peak
+    for (tss0, start0, end1) in trees[(chrom, strand)].find(query - search_window, query + search_window):
+        if strand == "+" and start0 > int(query) and end1 > int(query):
+            continue
+        if strand == "-" and start0 < int(query) and end1 < int(query):
+            continue
+        d = (query - tss0) * (-1 if strand == "-" else +1)
+        if not within_peak or abs(d) < abs(dist_peak):
+            within_peak, dist_peak = (start0 <= query < end1), d
+    return within_peak, dist_peak
+
+
+def polya_find(trees, chrom, strand, query, search_window=100):
+    """
+    PolyAPeak.find over an IntervalTree, before the sorted-array lookup
+    """
+    if (chrom, strand) not in trees:
+        return False, None
+    hits = trees[(chrom, strand)].find(query - search_window, query + search_window)
+    if len(hits) == 0:
+        return False, None
+    min_dist = query - hits[0][1]
+    for _, s0, _ in hits[1:]:
+        if abs(query - s0) < abs(min_dist):
+            min_dist = query - s0
+    return True, -min_dist if strand == "-" else min_dist
+
+
+def random_peaks(rng, n, chrom="chrR", length=20000):
+    """
+    Overlapping peaks of various widths on both strands, with shared starts and
+    TSSs so that distance ties happen
+    """
+    peaks = []
+    for _ in range(n):
+        start0 = int(rng.randint(0, length)) // 5 * 5
+        end1 = start0 + int(rng.choice([1, 5, 20, 300, 2000]))
+        tss0 = int(rng.randint(start0, end1))
+        peaks.append((chrom, start0, end1, "+" if rng.rand() < 0.5 else "-", tss0))
+    return peaks
+
+
+def edge_queries(peaks, search_window):
+    """
+    Positions at and around the peak boundaries and the edges of the search window
+    """
+    queries = set()
+    for _, start0, end1, _, tss0 in peaks:
+        for x in (start0, end1, tss0):
+            for d in (0, search_window):
+                for q in (x - d - 1, x - d, x - d + 1, x + d - 1, x + d, x + d + 1):
+                    queries.add(q)
+    return np.array(sorted(queries), dtype=np.int64)
+
+
+class TestPeakLookup(unittest.TestCase):
+    def setUp(self):
+        # work on a copy so the peak index is not written into the test data
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cage_peaks = join(self.tmp_dir, "hg38.cage_peaks.chr13.bed")
+        shutil.copy(
+            resource_filename("tests", "test_data/hg38.cage_peaks.chr13.bed"),
+            self.cage_peaks,
+        )
+        self.queries = np.sort(
+            np.random.RandomState(0).randint(18000000, 115000000, size=2000)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_bed(self, peaks):
+        bed = join(self.tmp_dir, "random_peaks.bed")
+        with open(bed, "w") as f:
+            for i, (chrom, start0, end1, strand, tss0) in enumerate(peaks):
+                f.write(f"{chrom}\t{start0}\t{end1}\tpeak{i}\t1\t{strand}\t{tss0}\t{tss0 + 1}\t0,0,255\n")
+        return bed
+
+    def test_cage_matches_interval_tree(self):
+        rng = np.random.RandomState(1)
+        for window in (10000, 50):
+            peaks = random_peaks(rng, 300)
+            trees = interval_trees(peaks)
+            cage = CAGEPeak(self.write_bed(peaks))
+            queries = np.concatenate([edge_queries(peaks, window), rng.randint(-100, 22000, size=500)])
+            queries.sort()
+            for strand in ("+", "-"):
+                expected = [cage_find(trees, "chrR", strand, int(q), window) for q in queries]
+                self.assertEqual(cage.find_batch("chrR", strand, queries, window), expected)
+                self.assertEqual(cage.find("chrR", strand, int(queries[0]), window), expected[0])
+            self.assertTrue(any(within for within, _ in expected))
+
+    def test_cage_real_peaks_match_interval_tree(self):
+        peaks = []
+        with open(self.cage_peaks) as f:
+            for line in f:
+                raw = line.split()
+                peaks.append((raw[0], int(raw[1]), int(raw[2]), raw[5], int(raw[6])))
+        trees = interval_trees(peaks)
+        cage = CAGEPeak(self.cage_peaks)
+        for strand in ("+", "-"):
+            expected = [cage_find(trees, "13", strand, int(q)) for q in self.queries]
+            self.assertEqual(cage.find_batch("13", strand, self.queries), expected)
+            self.assertTrue(any(dist != "NA" for _, dist in expected))
+
+    def test_cage_unknown_chrom(self):
+        cage = CAGEPeak(self.cage_peaks)
+        self.assertEqual(cage.find("chrUn", "+", 1000), (False, "NA"))
+
+    def test_polya_matches_interval_tree(self):
+        rng = np.random.RandomState(2)
+        for window in (100, 7):
+            peaks = random_peaks(rng, 300)
+            trees = interval_trees(peaks)
+            polya = PolyAPeak(self.write_bed(peaks))
+            queries = np.concatenate([edge_queries(peaks, window), rng.randint(-100, 22000, size=500)])
+            queries.sort()
+            for strand in ("+", "-"):
+                expected = [polya_find(trees, "chrR", strand, int(q), window) for q in queries]
+                self.assertEqual(polya.find_batch("chrR", strand, queries, window), expected)
+                self.assertEqual(polya.find("chrR", strand, int(queries[-1]), window), expected[-1])
+            self.assertTrue(any(hit for hit, _ in expected))
+        self.assertEqual(polya.find("chrUn", "-", 1000), (False, None))
+
+    def test_peak_index_matches_bed(self):
+        build_peak_index(self.cage_peaks, tss_column=6)
+        self.assertTrue(exists(join(peak_index_path(self.cage_peaks), "manifest.json")))
+        self.assertTrue(peak_index_is_current(self.cage_peaks, tss_column=6))
+
+        indexed = load_peak_index(self.cage_peaks, tss_column=6)
+        parsed = read_peak_bed(self.cage_peaks, tss_column=6)
+        self.assertEqual(sorted(indexed), sorted(parsed))
+        for key, peaks in parsed.items():
+            np.testing.assert_array_equal(indexed[key].start, peaks.start)
+            np.testing.assert_array_equal(indexed[key].end, peaks.end)
+            np.testing.assert_array_equal(indexed[key].tss, peaks.tss)
+            self.assertEqual(indexed[key].max_len, peaks.max_len)
+
+    def test_peak_index_stale(self):
+        build_peak_index(self.cage_peaks, tss_column=6)
+        with open(self.cage_peaks, "a") as f:
+            f.write("chrNew\t100\t200\tpeak\t1\t+\t150\t151\t0,0,255\n")
+        self.assertFalse(peak_index_is_current(self.cage_peaks, tss_column=6))
+        indexed = load_peak_index(self.cage_peaks, tss_column=6)
+        self.assertIn(("chrNew", "+"), indexed)
+        self.assertTrue(peak_index_is_current(self.cage_peaks, tss_column=6))
+
+    def test_peak_index_replaced_while_loading(self):
+        build_peak_index(self.cage_peaks, tss_column=6)
+        parsed = read_peak_bed(self.cage_peaks, tss_column=6)
+        read_manifest = peak_index.read_manifest
+        calls = []
+
+        def swapped_once(index_dir):
+            # the index is current when checked, then its manifest is missing once
+            # while another process swaps the index in
+            calls.append(index_dir)
+            return None if len(calls) == 2 else read_manifest(index_dir)
+
+        with mock.patch.object(peak_index, "read_manifest", side_effect=swapped_once):
+            indexed = load_peak_index(self.cage_peaks, tss_column=6)
+        self.assertGreater(len(calls), 2)
+        self.assertIsInstance(indexed[("13", "+")].start, np.memmap)
+        # always missing: falls back to the BED file
+        with mock.patch.object(peak_index, "read_manifest", return_value=None):
+            indexed = load_peak_index(self.cage_peaks, tss_column=6)
+        self.assertEqual(sorted(indexed), sorted(parsed))
+        for key, peaks in parsed.items():
+            np.testing.assert_array_equal(indexed[key].tss, peaks.tss)
+
+
+if __name__ == "__main__":
+    unittest.main()
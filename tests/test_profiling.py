@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqanti3.utilities.profiling import (
+    PROFILE_FIELDS,
+    IsoformLatency,
+    StageProfiler,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestStageProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmp_dir, "test")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stages(self):
+        profiler = StageProfiler(self.prefix)
+        with profiler.stage("genome_load") as record:
+            record["records"] = 3
+        with profiler.stage("classification"):
+            pass
+        profiler.write()
+
+        with open(f"{self.prefix}.run_profile.json") as f:
+            profile = json.load(f)
+        self.assertEqual(
+            [(s["stage"], s["status"], s["records"]) for s in profile["stages"]],
+            [("genome_load", "ok", 3), ("classification", "ok", None)],
+        )
+        self.assertGreater(profile["stages"][0]["peak_rss_mb"], 0)
+
+        with open(f"{self.prefix}.run_profile.tsv") as f:
+            lines = [line.rstrip("\n").split("\t") for line in f]
+        self.assertEqual(lines[0], PROFILE_FIELDS)
+        self.assertEqual(lines[2][0], "classification")
+        self.assertEqual(lines[2][-1], "NA")
+
+    def test_failed_stage(self):
+        profiler = StageProfiler(self.prefix)
+        with self.assertRaises(SystemExit):
+            with profiler.stage("report"):
+                raise SystemExit(-1)
+        # the profile is written as soon as a stage fails
+        with open(f"{self.prefix}.run_profile.json") as f:
+            profile = json.load(f)
+        self.assertEqual(profile["stages"][0]["status"], "failed")
+
+    def test_chunks(self):
+        chunk = StageProfiler(os.path.join(self.tmp_dir, "chunk0"))
+        with chunk.stage("classification"):
+            pass
+        chunk.write()
+
+        profiler = StageProfiler(self.prefix)
+        with profiler.stage("chunks"):
+            pass
+        profiler.add_chunks(
+            [os.path.join(self.tmp_dir, "chunk0"), os.path.join(self.tmp_dir, "missing")]
+        )
+        profiler.write()
+        with open(f"{self.prefix}.run_profile.tsv") as f:
+            stages = [line.split("\t")[0] for line in f][1:]
+        self.assertEqual(stages, ["chunks", "chunk0/classification"])
+
+    def test_hot_profile(self):
+        profiler = StageProfiler(self.prefix, cprofile=True)
+        with profiler.stage("genome_load"):
+            pass
+        with profiler.stage("classification", hot=True):
+            sorted(range(1000), key=lambda x: -x)
+            profiler.latency.add("PB.1.1", "chr1", "full-splice_match", 4, 0.002)
+            profiler.latency.add("PB.1.2", "chr1", "full-splice_match", 1, 0.5)
+            profiler.latency.add("PB.2.1", "chr2", "novel_in_catalog", 12, 20.0)
+        profiler.write()
+
+        self.assertTrue(os.path.exists(f"{self.prefix}.profile.pstats"))
+        with open(f"{self.prefix}.isoform_latency.tsv") as f:
+            isoforms = [line.split("\t")[0] for line in f][1:]
+        self.assertEqual(isoforms, ["PB.2.1", "PB.1.2", "PB.1.1"])
+        with open(f"{self.prefix}.isoform_latency_summary.tsv") as f:
+            rows = [line.rstrip("\n").split("\t") for line in f]
+        self.assertEqual(
+            [row[:3] for row in rows[1:]],
+            [
+                ["full-splice_match", "1", "1"],
+                ["full-splice_match", "4-7", "1"],
+                ["full-splice_match", "all", "2"],
+                ["novel_in_catalog", "8-15", "1"],
+                ["novel_in_catalog", "all", "1"],
+            ],
+        )
+        self.assertEqual(rows[0][-2:], ["<=10s", ">10s"])
+        self.assertEqual(rows[-1][-2:], ["0", "1"])
+
+        # latencies of the --chunks workers are merged back
+        latency = IsoformLatency()
+        latency.read(f"{self.prefix}.isoform_latency.tsv")
+        self.assertEqual(len(latency.rows), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import filecmp
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from csv import DictReader
+from importlib.util import find_spec
+
+from sqanti3.sqanti3_RulesFilter import (
+    bam_threads,
+    filter_bam,
+    filter_sam,
+    grid_points,
+    parse_sweep,
+    run_sweep,
+    sqanti_filter_lite,
+)
+
+logging.basicConfig(level=logging.CRITICAL)
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "test_data", "example_out")
+OUTPUTS = [
+    "filtered_lite_classification.txt",
+    "filtered_lite_reasons.txt",
+    "filtered_lite_junctions.txt",
+    "filtered_lite.fasta",
+    "filtered_lite.gtf",
+    "filtered_lite.sam",
+    "filtered_lite.faa",
+]
+
+
+class TestRulesFilter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(
+            os.path.join(TEST_DATA, "melanoma_chr13_classification.txt")
+        ) as f:
+            self.rows = list(DictReader(f, delimiter="\t"))
+        isoforms = [r["isoform"] for r in self.rows]
+        self.isoforms = os.path.join(self.tmp_dir, "isoforms.fasta")
+        self.gtf = os.path.join(self.tmp_dir, "isoforms.gtf")
+        self.sam = os.path.join(self.tmp_dir, "isoforms.sam")
+        self.faa = os.path.join(self.tmp_dir, "isoforms.faa")
+        with open(self.isoforms, "w") as f:
+            for i, seqid in enumerate(isoforms):
+                f.write(f">{seqid} description\nACGT\n{'A' * i}T\n")
+        with open(self.gtf, "w") as f:
+            for seqid in isoforms:
+                gene = seqid.rsplit(".", 1)[0]
+                attrs = f'gene_id "{gene}"; transcript_id "{seqid}";'
+                f.write(f"chr13\tPacBio\ttranscript\t1\t100\t.\t+\t.\t{attrs}\n")
+                f.write(f"chr13\tPacBio\texon\t1\t100\t.\t+\t.\t{attrs}\n")
+        with open(self.sam, "w") as f:
+            f.write("@SQ\tSN:chr13\tLN:1000\n")
+            for seqid in isoforms:
+                f.write(f"{seqid}\t0\tchr13\t1\t60\t4M\t*\t0\t0\tACGT\t*\n")
+        with open(self.faa, "w") as f:
+            for seqid in isoforms[::2]:
+                f.write(f">{seqid}\tgene\nMSK\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_filter(self, name: str, cpus: int) -> str:
+        sqanti_class = os.path.join(self.tmp_dir, name, "sample.classification.txt")
+        os.makedirs(os.path.dirname(sqanti_class))
+        shutil.copy(
+            os.path.join(TEST_DATA, "melanoma_chr13_classification.txt"), sqanti_class
+        )
+        sqanti_filter_lite(
+            sqanti_class          = sqanti_class,
+            isoforms              = self.isoforms,
+            annotation            = self.gtf,
+            junctions             = os.path.join(TEST_DATA, "melanoma_chr13_junctions.txt"),
+            sam                   = self.sam,
+            faa                   = self.faa,
+            intrapriming          = 0.6,
+            runAlength            = 6,
+            max_dist_to_known_end = 50,
+            min_cov               = 3,
+            filter_mono_exonic    = False,
+            skipGTF               = False,
+            skipFaFq              = False,
+            skipJunction          = False,
+            skip_report           = True,
+            cpus                  = cpus,
+        )
+        return os.path.join(self.tmp_dir, name, "sample.classification.")
+
+    def test_outputs(self):
+        prefix = self.run_filter("serial", cpus=1)
+        with open(f"{prefix}filtered_lite_classification.txt") as f:
+            kept = {r["isoform"] for r in DictReader(f, delimiter="\t")}
+        with open(f"{prefix}filtered_lite_reasons.txt") as f:
+            filtered = {
+                line.split(",")[0] for line in f if not line.startswith("#")
+            } - {"filtered_isoform"}
+        self.assertTrue(kept and filtered)
+        self.assertEqual(kept | filtered, {r["isoform"] for r in self.rows})
+        self.assertFalse(kept & filtered)
+
+        with open(f"{prefix}filtered_lite.fasta") as f:
+            lines = f.readlines()
+        self.assertEqual(
+            {line[1:].split()[0] for line in lines if line.startswith(">")}, kept
+        )
+        self.assertEqual(len(lines), 3 * len(kept))
+        with open(f"{prefix}filtered_lite.gtf") as f:
+            self.assertEqual(len(f.readlines()), 2 * len(kept))
+        with open(f"{prefix}filtered_lite.sam") as f:
+            lines = f.readlines()
+        self.assertTrue(lines[0].startswith("@SQ"))
+        self.assertEqual({line.split("\t")[0] for line in lines[1:]}, kept)
+        with open(f"{prefix}filtered_lite.faa") as f:
+            self.assertTrue(
+                all(line[1:].split()[0] in kept for line in f if line.startswith(">"))
+            )
+        with open(f"{prefix}filtered_lite_junctions.txt") as f:
+            self.assertTrue(
+                {r["isoform"] for r in DictReader(f, delimiter="\t")} <= kept
+            )
+
+    def test_parallel_outputs(self):
+        serial = self.run_filter("serial", cpus=1)
+        parallel = self.run_filter("parallel", cpus=4)
+        for name in OUTPUTS:
+            if name == "filtered_lite_reasons.txt":
+                # the header names the input classification file
+                continue
+            self.assertTrue(
+                filecmp.cmp(serial + name, parallel + name, shallow=False), name
+            )
+
+    def test_filter_sam(self):
+        keep = {"PB.1.1", "PB.10.2"}
+        dst = filter_sam(self.sam, os.path.join(self.tmp_dir, "kept.sam"), keep)
+        with open(dst) as f:
+            lines = f.readlines()
+        self.assertTrue(lines[0].startswith("@SQ"))
+        self.assertEqual(
+            {line.split("\t")[0] for line in lines[1:]},
+            keep & {r["isoform"] for r in self.rows},
+        )
+
+    @unittest.skipUnless(find_spec("pysam"), "requires pysam")
+    def test_filter_bam(self):
+        import pysam
+
+        bam = os.path.join(self.tmp_dir, "isoforms.bam")
+        with pysam.AlignmentFile(self.sam) as sam, pysam.AlignmentFile(
+            bam, "wb", template=sam
+        ) as out:
+            for read in sam:
+                out.write(read)
+        keep = {r["isoform"] for r in self.rows[::3]}
+        dst = filter_bam(bam, os.path.join(self.tmp_dir, "kept.bam"), keep, threads=2)
+        with pysam.AlignmentFile(dst) as f:
+            self.assertEqual([read.query_name for read in f], [r["isoform"] for r in self.rows[::3]])
+
+    def test_bam_threads(self):
+        # the other jobs take one CPU each in the pool
+        self.assertEqual(bam_threads(8, 5), 4)
+        self.assertEqual(bam_threads(4, 6), 1)
+        self.assertEqual(bam_threads(1, 5), 1)
+        # run alone
+        self.assertEqual(bam_threads(8, 1), 8)
+
+    def test_sweep(self):
+        grid = parse_sweep(["intrapriming=0.6,0.9", "min_cov=3,0", "filter_mono_exonic=true"])
+        self.assertEqual(grid, {"intrapriming": [0.6, 0.9], "min_cov": [3, 0], "filter_mono_exonic": [True]})
+        self.assertEqual(len(grid_points(grid)), 4)
+        with self.assertRaises(ValueError):
+            parse_sweep(["min_cov"])
+        # names of the options or of the rule set only, values in the ranges of the options
+        self.assertEqual(parse_sweep(["min_len=100,200"], rule_params=["min_len"]), {"min_len": [100, 200]})
+        self.assertEqual(parse_sweep(["intrapriming=0.25,1", "runAlength=4,20"])["runAlength"], [4, 20])
+        for spec in ["min_len=100", "intraprimming=0.6", "intrapriming=0.2", "intrapriming=0.6,1.5", "runAlength=21", "runAlength=3"]:
+            with self.assertRaises(ValueError, msg=spec):
+                parse_sweep([spec])
+
+        # point 0 is the default setting
+        serial = self.run_filter("serial", cpus=1)
+        sqanti_class = os.path.join(self.tmp_dir, "sample.classification.txt")
+        shutil.copy(os.path.join(TEST_DATA, "melanoma_chr13_classification.txt"), sqanti_class)
+        run_sweep(
+            sqanti_class = sqanti_class,
+            ruleset      = None,
+            base_params  = {
+                "intrapriming"         : 0.6,
+                "runAlength"           : 6,
+                "max_dist_to_known_end": 50,
+                "min_cov"              : 3,
+                "filter_mono_exonic"   : False,
+            },
+            sweep        = ["intrapriming=0.6,0.9", "min_cov=3,0"],
+            materialize  = [0],
+            filter_args  = {
+                "isoforms"    : self.isoforms,
+                "annotation"  : self.gtf,
+                "junctions"   : os.path.join(TEST_DATA, "melanoma_chr13_junctions.txt"),
+                "sam"         : self.sam,
+                "faa"         : self.faa,
+                "skipGTF"     : False,
+                "skipFaFq"    : False,
+                "skipJunction": False,
+                "skip_report" : True,
+            },
+        )
+        prefix = os.path.join(self.tmp_dir, "sample.classification.")
+        with open(f"{prefix}filtered_lite_sweep.tsv") as f:
+            rows = list(DictReader(f, delimiter="\t"))
+        self.assertEqual(
+            list(rows[0]),
+            ["point", "intrapriming", "min_cov", "structural_category", "reason", "count"],
+        )
+        kept = {}
+        for row in rows:
+            self.assertEqual(
+                sum(int(r["count"]) for r in rows if r["point"] == row["point"]),
+                len(self.rows),
+            )
+            if row["reason"] == "kept":
+                kept[int(row["point"])] = kept.get(int(row["point"]), 0) + int(row["count"])
+        # raising the intra-priming cutoff or lowering min_cov only keeps more isoforms
+        self.assertTrue(kept[0] <= kept[1] <= kept[3] and kept[0] <= kept[2] <= kept[3])
+
+        with open(f"{serial}filtered_lite_classification.txt") as f:
+            self.assertEqual(len(f.readlines()) - 1, kept[0])
+        for name in OUTPUTS:
+            if name == "filtered_lite_reasons.txt":
+                continue
+            self.assertTrue(
+                filecmp.cmp(serial + name, f"{prefix}sweep0." + name, shallow=False), name
+            )
+        self.assertFalse(os.path.exists(f"{prefix}sweep1.filtered_lite_classification.txt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import logging
+import os
+from os.path import join
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from sqanti3.utilities import score_track
+from sqanti3.utilities.score_track import (
+    MemmapTrack,
+    format_score,
+    open_score_track,
+    score_index_is_current,
+    score_index_path,
+)
+
+try:
+    import pyBigWig
+except ImportError:
+    pyBigWig = None
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestScoreTrack(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.phyloP_bed = join(self.tmp_dir, "phyloP.bed")
+        with open(self.phyloP_bed, "w") as f:
+            f.write("chr1\t100\t101\t0.064\n")
+            f.write("chr1\t101\t102\t-1.25\n")
+            f.write("chr1\t103\t104\t3\n")
+            f.write("chr2\t10\t13\t0.5\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_many(self):
+        track = open_score_track(self.phyloP_bed)
+        scores = track.get_many("chr1", [99, 100, 101, 102, 103, 5000])
+        self.assertEqual(
+            [format_score(x) for x in scores],
+            ["NA", "0.064", "-1.25", "NA", "3", "NA"],
+        )
+        np.testing.assert_array_equal(
+            track.get_many("chr2", [9, 10, 12, 13]), [np.nan, 0.5, 0.5, np.nan]
+        )
+        self.assertTrue(np.isnan(track.get_many("chrUn", [1])).all())
+
+    def test_format_score(self):
+        # the text of the BED file is kept
+        for text in ("3", "0", "-1.25", "0.064", "7.532", "-0.001", "12.5"):
+            self.assertEqual(format_score(np.float32(float(text))), text)
+        self.assertEqual(format_score(np.float32("nan")), "NA")
+
+    def test_stale_index(self):
+        track = open_score_track(self.phyloP_bed)
+        self.assertTrue(score_index_is_current(self.phyloP_bed))
+        self.assertEqual(format_score(track.get_many("chr1", [103])[0]), "3")
+        with open(self.phyloP_bed, "a") as f:
+            f.write("chr1\t103\t104\t-2\n")
+            f.write("chr3\t5\t6\t1.5\n")
+        self.assertFalse(score_index_is_current(self.phyloP_bed))
+        track = open_score_track(self.phyloP_bed)
+        self.assertTrue(score_index_is_current(self.phyloP_bed))
+        self.assertEqual(format_score(track.get_many("chr1", [103])[0]), "-2")
+        self.assertEqual(format_score(track.get_many("chr3", [5])[0]), "1.5")
+
+    def test_temporary_index(self):
+        build_score_index = score_track.build_score_index
+        cleanups = []
+
+        def unwritable(bed_filename, index_dir=None):
+            if index_dir is None:  # next to the BED file
+                raise PermissionError("read-only directory")
+            return build_score_index(bed_filename, index_dir)
+
+        with mock.patch.object(score_track, "build_score_index", side_effect=unwritable), mock.patch.object(
+            score_track.atexit, "register", side_effect=lambda *args, **kwargs: cleanups.append((args, kwargs))
+        ):
+            track = open_score_track(self.phyloP_bed)
+        self.assertEqual(format_score(track.get_many("chr1", [100])[0]), "0.064")
+        self.assertFalse(os.path.exists(score_index_path(self.phyloP_bed)))
+        # the temporary index is removed at exit
+        (func, tmp_dir, *_), kwargs = cleanups[0]
+        self.assertTrue(os.path.isdir(tmp_dir))
+        del track
+        func(tmp_dir, *_, **kwargs)
+        self.assertFalse(os.path.exists(tmp_dir))
+
+    def test_index_replaced_while_loading(self):
+        build_score_index = score_track.build_score_index
+        calls = []
+
+        def replaced(bed_filename, index_dir=None, times=1):
+            # another process removes the index right after it is built, before
+            # moving its own copy in place
+            index_dir = build_score_index(bed_filename, index_dir)
+            calls.append(index_dir)
+            if index_dir == score_index_path(bed_filename) and len(calls) <= times:
+                shutil.rmtree(index_dir)
+            return index_dir
+
+        with mock.patch.object(score_track, "build_score_index", side_effect=replaced):
+            track = open_score_track(self.phyloP_bed)
+        self.assertEqual(calls, [score_index_path(self.phyloP_bed)] * 2)
+        self.assertEqual(format_score(track.get_many("chr1", [101])[0]), "-1.25")
+        # always replaced: falls back to a temporary index
+        calls.clear()
+        cleanups = []
+        with mock.patch.object(
+            score_track, "build_score_index", side_effect=lambda *args: replaced(*args, times=100)
+        ), mock.patch.object(
+            score_track.atexit, "register", side_effect=lambda *args, **kwargs: cleanups.append((args, kwargs))
+        ):
+            track = open_score_track(self.phyloP_bed)
+        self.assertEqual(len(calls), score_track.INDEX_LOAD_ATTEMPTS + 1)
+        self.assertNotEqual(calls[-1], score_index_path(self.phyloP_bed))
+        self.assertEqual(format_score(track.get_many("chr1", [101])[0]), "-1.25")
+        (func, tmp_dir, *_), kwargs = cleanups[0]
+        del track
+        func(tmp_dir, *_, **kwargs)
+
+    @unittest.skipUnless(pyBigWig, "pyBigWig is not installed")
+    def test_bigwig_matches_memmap(self):
+        rng = np.random.RandomState(0)
+        chrom_sizes = [("chr1", 50000), ("chr2", 20000)]
+        scores = {}
+        with open(self.phyloP_bed, "w") as f:
+            for chrom, size in chrom_sizes:
+                # scored bases with gaps, as in phyloP tracks
+                positions = np.sort(rng.choice(size, size // 2, replace=False))
+                values = np.round(rng.normal(0, 2, len(positions)), 3)
+                scores[chrom] = (positions, values)
+                f.writelines(f"{chrom}\t{p}\t{p + 1}\t{v}\n" for p, v in zip(positions, values))
+        bigwig = join(self.tmp_dir, "phyloP.bw")
+        bw = pyBigWig.open(bigwig, "w")
+        bw.addHeader(chrom_sizes)
+        for chrom, _ in chrom_sizes:
+            positions, values = scores[chrom]
+            bw.addEntries(chrom, positions.tolist(), values=values.tolist(), span=1)
+        bw.close()
+
+        memmap, bigwig = open_score_track(self.phyloP_bed), open_score_track(bigwig)
+        self.assertIsInstance(memmap, MemmapTrack)
+        for chrom, size in chrom_sizes + [("chrUn", 100)]:
+            # sorted and unsorted, nearby and distant, in and out of the chromosome
+            queries = np.concatenate([rng.randint(-10, size + 10, 3000), np.arange(100, 200)])
+            self.assertEqual(
+                [format_score(x) for x in memmap.get_many(chrom, queries)],
+                [format_score(x) for x in bigwig.get_many(chrom, queries)],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import logging
+import subprocess
+import sys
+import unittest
+
+logging.basicConfig(level=logging.CRITICAL)
+
+# modules only the classification stages need, they must not be loaded by `--help`
+HEAVY_MODULES = ["Bio", "cupcake", "pygmst", "pandas", "gtfparse", "pysam"]
+# generous bound on the time to import a CLI and print its help
+MAX_STARTUP_SECONDS = 5.0
+
+
+def startup(module: str):
+    """
+    Import `module` and run `main --help` in a fresh interpreter
+    :return: {"seconds": time to import and print the help, "modules": heavy modules loaded}
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"from {module} import main\n"
+        "try:\n"
+        "    main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "seconds = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'seconds': seconds, 'modules': heavy}))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+class TestStartup(unittest.TestCase):
+    def check(self, module: str):
+        result = startup(module)
+        self.assertEqual(result["modules"], [])
+        self.assertLess(
+            result["seconds"],
+            MAX_STARTUP_SECONDS,
+            f"{module} --help took {result['seconds']:.3f}s",
+        )
+
+    def test_sqanti3_qc(self):
+        self.check("sqanti3.sqanti3_qc")
+
+    def test_sqanti3_RulesFilter(self):
+        self.check("sqanti3.sqanti3_RulesFilter")
+
+    def test_sqanti3_daemon(self):
+        self.check("sqanti3.sqanti3_daemon")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import logging
+import shutil
+import tempfile
+import unittest
+
+import random
+
+from benchmarks.synthetic import CATEGORIES, Locus, generate_dataset, make_isoform, parse_fractions
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestSyntheticData(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_fractions(self):
+        self.assertEqual(parse_fractions("FSM=3,NIC=1"), {"FSM": 0.75, "NIC": 0.25})
+        with self.assertRaises(ValueError):
+            parse_fractions("FSM=1,XYZ=1")
+
+    def test_generate_dataset(self):
+        dataset = generate_dataset(
+            self.tmp_dir, n_chroms=2, loci_per_chrom=20, isoforms_per_gene=5, seed=1
+        )
+        self.assertEqual(dataset["loci"], 40)
+        self.assertEqual(dataset["isoforms"], 200)
+        self.assertEqual(sum(dataset["categories"].values()), 200)
+        self.assertTrue(set(dataset["categories"]).issubset(CATEGORIES))
+
+        genome, chrom = {}, None
+        with open(dataset["files"]["genome"]) as f:
+            for line in f:
+                if line.startswith(">"):
+                    chrom = line[1:].strip()
+                    genome[chrom] = []
+                else:
+                    genome[chrom].append(line.strip())
+        genome = {k: "".join(v) for k, v in genome.items()}
+
+        # every reference intron is GT-AG on the transcript strand
+        with open(dataset["files"]["reference_genePred"]) as f:
+            for line in f:
+                raw = line.split("\t")
+                chrom, strand = raw[1], raw[2]
+                starts = [int(x) for x in raw[8][:-1].split(",")]
+                ends = [int(x) for x in raw[9][:-1].split(",")]
+                self.assertEqual(int(raw[7]), len(starts))
+                for d, a in zip(ends[:-1], starts[1:]):
+                    site = genome[chrom][d : d + 2] + genome[chrom][a - 2 : a]
+                    self.assertEqual(site, "GTAG" if strand == "+" else "CTAC")
+
+        with open(dataset["files"]["truth"]) as f:
+            self.assertEqual(len(f.readlines()), 201)
+
+    def test_nnc_lengths(self):
+        rng = random.Random(0)
+        # a short exon before a short intron, and a single exon that cannot be shifted
+        ref = [(0, 100), (200, 235), (275, 400)]
+        loci = [
+            Locus("G1", "chr1", "+", ref, [ref]),
+            Locus("G2", "chr1", "+", [(1000, 1030), (1061, 1200)], [[(1000, 1030), (1061, 1200)]]),
+        ]
+        for _ in range(200):
+            category, exons, _ = make_isoform(rng, "NNC", loci, 0)
+            self.assertNotEqual(exons, ref)
+            self.assertTrue(all(e - s >= 30 for s, e in exons), exons)
+            self.assertTrue(all(b[0] - a[1] > 30 for a, b in zip(exons, exons[1:])), exons)
+            self.assertIsNone(make_isoform(rng, "NNC", loci, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()